@@ -0,0 +1,709 @@
+"""
+
+BENCHMARK DEL MOTOR DE FICHAJE CONTRA EL PORTAL WCRONOS SIMULADO
+
+Lanza mock_wcronos.PortalWCRONOS en local, ejecuta FichajeEngine con distintos números
+de workers y reporta usuarios/minuto, latencia por paso y memoria.
+
+Uso: python benchmark_fichaje.py --usuarios 20 --workers 1,2,4 --latencia-ms 50
+
+     python benchmark_fichaje.py importacion --presupuesto-ms 100
+
+     python benchmark_fichaje.py arranque --repeticiones 5
+
+"""
+
+import argparse
+
+import csv
+
+import json
+
+import os
+
+import statistics
+
+import subprocess
+
+import sys
+
+import tempfile
+
+import threading
+
+import time
+
+import tracemalloc
+
+from mock_wcronos import PortalWCRONOS
+
+# ==================== PASOS MEDIDOS ====================
+
+# Prefijo del mensaje de callback -> nombre del paso que comienza con ese mensaje
+
+PASOS = [
+
+    ("📋 Procesando", "arranque_chrome"),
+
+    ("Iniciando fichaje para", "preparacion"),
+
+    ("Cargando página de login", "carga_pagina"),
+
+    ("Accediendo al sistema", "frames"),
+
+    ("Localizando formulario", "formulario"),
+
+    ("Resolviendo captcha", "captcha"),
+
+    ("Ingresando credenciales", "credenciales"),
+
+    ("Haciendo login", "login"),
+
+    ("Navegando a punto de fichaje", "punto_fichaje"),
+
+    ("Realizando fichaje", "fichaje_y_verificacion")
+
+]
+
+# Mensajes que cierran el paso en curso sin abrir otro
+
+FINALES = ("✅", "❌", "⚠️")
+
+
+class RegistroPasos:
+    """Callback que marca en el tiempo cada mensaje del motor y calcula duraciones por paso"""
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+
+        self.duraciones = {}
+
+        self.en_curso = {}
+
+    def callback_para(self, worker):
+
+        def callback(mensaje):
+
+            self.marcar(worker, mensaje.strip("\n= "), time.perf_counter())
+
+        return callback
+
+    def marcar(self, worker, mensaje, instante):
+
+        paso = next((nombre for prefijo, nombre in PASOS if mensaje.startswith(prefijo)), None)
+
+        if paso is None and not mensaje.startswith(FINALES):
+
+            return
+
+        with self.lock:
+
+            anterior = self.en_curso.pop(worker, None)
+
+            if anterior:
+
+                nombre, inicio = anterior
+
+                self.duraciones.setdefault(nombre, []).append(instante - inicio)
+
+            if paso:
+
+                self.en_curso[worker] = (paso, instante)
+
+    def resumen(self):
+
+        resultado = {}
+
+        for _, nombre in PASOS:
+
+            valores = sorted(self.duraciones.get(nombre, []))
+
+            if not valores:
+
+                continue
+
+            resultado[nombre] = {
+
+                'n': len(valores),
+
+                'mediana_s': statistics.median(valores),
+
+                'p95_s': valores[min(len(valores) - 1, int(len(valores) * 0.95))]
+
+            }
+
+        return resultado
+
+
+class MuestreadorMemoria:
+    """Muestrea periódicamente la memoria residente del proceso y de sus hijos (Chrome)"""
+
+    def __init__(self, intervalo=0.5):
+
+        self.intervalo = intervalo
+
+        self.pico_rss = 0
+
+        self._parar = threading.Event()
+
+        self._thread = None
+
+        try:
+
+            import psutil
+
+            self._proceso = psutil.Process()
+
+        except ImportError:
+
+            self._proceso = None
+
+    def _rss_actual(self):
+
+        if self._proceso is None:
+
+            import resource
+
+            # ru_maxrss está en KB en Linux y en bytes en macOS
+
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+            return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+        total = 0
+
+        for proceso in [self._proceso] + self._proceso.children(recursive=True):
+
+            try:
+
+                total += proceso.memory_info().rss
+
+            except Exception:
+
+                pass
+
+        return total
+
+    def _bucle(self):
+
+        while not self._parar.wait(self.intervalo):
+
+            self.pico_rss = max(self.pico_rss, self._rss_actual())
+
+    def __enter__(self):
+
+        self.pico_rss = self._rss_actual()
+
+        self._thread = threading.Thread(target=self._bucle, daemon=True)
+
+        self._thread.start()
+
+        return self
+
+    def __exit__(self, *exc):
+
+        self._parar.set()
+
+        self._thread.join()
+
+        self.pico_rss = max(self.pico_rss, self._rss_actual())
+
+    @property
+    def incluye_hijos(self):
+
+        return self._proceso is not None
+
+
+def escribir_roster(ruta, usuarios):
+
+    with open(ruta, 'w', newline='', encoding='utf-8') as f:
+
+        writer = csv.writer(f)
+
+        writer.writerow(["tarjeta", "contrasena"])
+
+        for usuario in usuarios:
+
+            writer.writerow([usuario, f"clave{usuario}"])
+
+
+def config_benchmark(base, portal, directorio, worker, ajustes=None):
+
+    """Copia de CONFIG apuntando al portal simulado y a ficheros temporales del worker
+
+    Sin límite de tasa hacia el portal ni pausa entre usuarios, salvo que los pidan los ajustes
+    (--tasa-portal, --pausa-usuarios-s). Todos los ficheros de estado van al directorio temporal.
+    """
+
+    config = dict(base, portal_tasa_por_s=0, pausa_entre_usuarios_s=0,
+                  chrome_plantilla_dir=os.path.join(directorio, "chrome_plantilla"))
+
+    config.update(ajustes or {})
+
+    config.update({
+
+        'url': portal.url,
+
+        'captcha_api_url': portal.url.rstrip("/"),
+
+        'captcha_poll_s': 0.05,
+
+        'api_key_2captcha': "benchmark",
+
+        'headless': True,
+
+        'csv_file': os.path.join(directorio, f"datos_w{worker}.csv"),
+
+        'results_file': os.path.join(directorio, f"resultados_w{worker}.csv"),
+
+        'log_file': os.path.join(directorio, f"fichajes_w{worker}.log"),
+
+        'screenshots_dir': os.path.join(directorio, "screenshots"),
+
+        'journal_dir': os.path.join(directorio, "journal"),
+
+        'concurrencia_export': os.path.join(directorio, f"concurrencia_w{worker}.csv"),
+
+        'notifications_file': os.path.join(directorio, "notificaciones_inexistente.ini"),
+
+        'config_file': os.path.join(directorio, "horarios_config.json"),
+
+        'daemon_status_file': os.path.join(directorio, "fichaje_daemon.json"),
+
+        'jobstore_file': os.path.join(directorio, "scheduler_jobs.json"),
+
+        'frames_cache_file': os.path.join(directorio, "frames_cache.json"),
+
+        'selectores_cache_file': os.path.join(directorio, "selectores_cache.json"),
+
+        'sesiones_cache_file': os.path.join(directorio, "sesiones_cache.bin"),
+
+        'sesiones_clave_file': os.path.join(directorio, "sesiones.key"),
+
+        'reloj_file': os.path.join(directorio, "reloj_portal.json"),
+
+        'procesos_file': os.path.join(directorio, "procesos_chrome.json")
+
+    })
+
+    os.makedirs(config['screenshots_dir'], exist_ok=True)
+
+    return config
+
+
+def ejecutar_escenario(fichaje, portal, total_usuarios, workers, ajustes=None, modo="shards"):
+
+    """Mide una ejecución con N workers
+
+    modo 'shards': el roster se reparte entre N FichajeEngine independientes.
+    modo 'motor': un solo FichajeEngine con concurrencia adaptativa hasta N usuarios en paralelo.
+    """
+
+    if modo == "motor":
+
+        ajustes = dict(ajustes or {}, concurrencia_min=1, concurrencia_max=workers)
+
+        motores_n = 1
+
+    else:
+
+        ajustes = dict(ajustes or {}, concurrencia_min=1, concurrencia_max=1, concurrencia_inicial=1)
+
+        motores_n = workers
+
+    registro = RegistroPasos()
+
+    resultados = []
+
+    with tempfile.TemporaryDirectory(prefix="bench_fichaje_") as directorio:
+
+        motores = []
+
+        for w in range(motores_n):
+
+            config = config_benchmark(fichaje.CONFIG, portal, directorio, w, ajustes)
+
+            escribir_roster(config['csv_file'], [str(100000 + i) for i in range(w, total_usuarios, motores_n)])
+
+            motores.append(fichaje.FichajeEngine(config))
+
+        def trabajar(w, motor):
+
+            resultados.append(motor.procesar_usuarios(callback=registro.callback_para(w)))
+
+        hilos = [threading.Thread(target=trabajar, args=(w, m)) for w, m in enumerate(motores)]
+
+        tracemalloc.start()
+
+        with MuestreadorMemoria() as memoria:
+
+            inicio = time.perf_counter()
+
+            for hilo in hilos:
+
+                hilo.start()
+
+            for hilo in hilos:
+
+                hilo.join()
+
+            duracion = time.perf_counter() - inicio
+
+        _, pico_python = tracemalloc.get_traced_memory()
+
+        tracemalloc.stop()
+
+    procesados = sum(r['total'] for r in resultados)
+
+    return {
+
+        'workers': workers,
+
+        'usuarios': procesados,
+
+        'exitos': sum(r['exitos'] for r in resultados),
+
+        'fallos': sum(r['fallos'] for r in resultados),
+
+        'desconocidos': sum(r['desconocidos'] for r in resultados),
+
+        'duracion_s': duracion,
+
+        'usuarios_minuto': procesados / duracion * 60 if duracion else 0.0,
+
+        'pico_rss_mb': memoria.pico_rss / (1024 * 1024),
+
+        'rss_incluye_chrome': memoria.incluye_hijos,
+
+        'pico_python_mb': pico_python / (1024 * 1024),
+
+        'pasos': registro.resumen(),
+
+        'cola_portal': combinar_trafico([r.get('trafico', {}) for r in resultados]),
+
+        'modo': modo,
+
+        'concurrencia': [r.get('concurrencia') for r in resultados]
+
+    }
+
+
+def combinar_trafico(resumenes):
+
+    """Suma las esperas en cola hacia el portal de varios motores (el p95 es el peor de ellos)"""
+
+    combinado = {}
+
+    for resumen in resumenes:
+
+        for tipo, m in resumen.items():
+
+            c = combinado.setdefault(tipo, {'n': 0, 'total_s': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0})
+
+            c['n'] += m['n']
+
+            c['total_s'] += m['total_s']
+
+            c['p95_ms'] = max(c['p95_ms'], m['p95_ms'])
+
+            c['max_ms'] = max(c['max_ms'], m['max_ms'])
+
+    for c in combinado.values():
+        c['media_ms'] = 1000 * c['total_s'] / c['n'] if c['n'] else 0.0
+
+    return combinado
+
+
+def imprimir_escenario(r):
+
+    print("\n" + "=" * 80)
+
+    print(f"📊 WORKERS: {r['workers']} ({r['modo']})")
+
+    print("=" * 80)
+
+    print(f"Usuarios: {r['usuarios']}  (✅ {r['exitos']}  ❌ {r['fallos']}  ⚠️ {r['desconocidos']})")
+
+    print(f"Duración: {r['duracion_s']:.1f} s  ->  {r['usuarios_minuto']:.2f} usuarios/minuto")
+
+    origen = "proceso + Chrome" if r['rss_incluye_chrome'] else "solo proceso Python (instala psutil para incluir Chrome)"
+
+    print(f"Memoria pico RSS: {r['pico_rss_mb']:.1f} MB ({origen})")
+
+    print(f"Memoria pico Python (tracemalloc): {r['pico_python_mb']:.1f} MB")
+
+    print(f"\n{'Paso':<26}{'n':>6}{'mediana (s)':>14}{'p95 (s)':>12}")
+
+    for nombre, datos in r['pasos'].items():
+
+        print(f"{nombre:<26}{datos['n']:>6}{datos['mediana_s']:>14.3f}{datos['p95_s']:>12.3f}")
+
+    if r['modo'] == "motor" and r['concurrencia'] and r['concurrencia'][0]:
+
+        c = r['concurrencia'][0]
+
+        print(f"Concurrencia adaptativa: pico {c['pico']}, final {c['limite_final']} ({c['decisiones']} decisiones)")
+
+    if r['cola_portal']:
+
+        print(f"\n{'Cola portal':<26}{'n':>6}{'media (ms)':>14}{'p95 (ms)':>12}{'máx (ms)':>12}")
+
+        for tipo, m in r['cola_portal'].items():
+            print(f"{tipo:<26}{m['n']:>6}{m['media_ms']:>14.0f}{m['p95_ms']:>12.0f}{m['max_ms']:>12.0f}")
+
+
+# ==================== PRESUPUESTO DE TIEMPO DE IMPORTACIÓN ====================
+
+# Dependencias que importar fichaje.py no debe cargar
+
+MODULOS_PESADOS = ("pandas", "selenium", "webdriver_manager", "requests", "tkinter")
+
+SCRIPT_IMPORTACION = """
+import json, sys, time
+sys.path.insert(0, {ruta!r})
+inicio = time.perf_counter()
+import fichaje
+duracion = time.perf_counter() - inicio
+print(json.dumps({{"ms": duracion * 1000, "cargados": [m for m in {pesados!r} if m in sys.modules]}}))
+"""
+
+
+def medir_importacion(repeticiones):
+
+    """Importa fichaje en procesos limpios y en un directorio vacío; devuelve mediana, pesados y ficheros creados"""
+
+    ruta = os.path.dirname(os.path.abspath(__file__))
+
+    script = SCRIPT_IMPORTACION.format(ruta=ruta, pesados=MODULOS_PESADOS)
+
+    tiempos = []
+
+    cargados = set()
+
+    with tempfile.TemporaryDirectory(prefix="bench_import_") as directorio:
+
+        # La primera importación compila el .pyc y no se cuenta
+
+        for i in range(repeticiones + 1):
+
+            salida = subprocess.run([sys.executable, "-c", script], cwd=directorio,
+
+                                    capture_output=True, text=True, check=True)
+
+            datos = json.loads(salida.stdout.strip().splitlines()[-1])
+
+            cargados.update(datos["cargados"])
+
+            if i > 0:
+                tiempos.append(datos["ms"])
+
+        creados = sorted(os.listdir(directorio))
+
+    return statistics.median(tiempos), sorted(cargados), creados
+
+
+def comprobar_importacion(args):
+
+    """Falla (código 1) si importar fichaje supera el presupuesto o tiene efectos secundarios"""
+
+    mediana, cargados, creados = medir_importacion(args.repeticiones)
+
+    print(f"⏱ Importación de fichaje: mediana {mediana:.1f} ms (presupuesto {args.presupuesto_ms:.0f} ms)")
+
+    errores = []
+
+    if mediana > args.presupuesto_ms:
+        errores.append(f"supera el presupuesto en {mediana - args.presupuesto_ms:.1f} ms")
+
+    if cargados:
+        errores.append(f"carga dependencias pesadas: {', '.join(cargados)}")
+
+    if creados:
+        errores.append(f"crea ficheros al importar: {', '.join(creados)}")
+
+    for error in errores:
+        print(f"❌ {error}")
+
+    if not errores:
+        print("✅ Importación dentro del presupuesto y sin efectos secundarios")
+
+    return 1 if errores else 0
+
+
+# ==================== ARRANQUE DE CHROME POR PERFIL ====================
+
+def medir_arranque(fichaje, portal, perfil, repeticiones):
+
+    """Tiempos (s) desde start_driver hasta completar el primer driver.get con un perfil de Chrome"""
+
+    tiempos = []
+
+    with tempfile.TemporaryDirectory(prefix="bench_arranque_") as directorio:
+
+        config = config_benchmark(fichaje.CONFIG, portal, directorio, 0, {
+
+            'chrome_perfil': perfil,
+
+            'chrome_plantilla_dir': os.path.join(directorio, "plantilla")
+
+        })
+
+        motor = fichaje.FichajeEngine(config)
+
+        # La primera vuelta resuelve chromedriver y crea la plantilla: no se cuenta
+
+        for i in range(repeticiones + 1):
+
+            inicio = time.perf_counter()
+
+            driver = motor.start_driver(headless=True)
+
+            try:
+
+                driver.get(portal.url)
+
+                duracion = time.perf_counter() - inicio
+
+            finally:
+
+                driver.quit()
+
+            if i > 0:
+                tiempos.append(duracion)
+
+    return tiempos
+
+
+def comparar_arranque(args):
+
+    """Compara el tiempo hasta el primer driver.get de los perfiles 'normal' y 'lite'"""
+
+    import fichaje
+
+    with PortalWCRONOS() as portal:
+
+        print(f"🌐 Portal simulado en {portal.url}")
+
+        print(f"\n{'Perfil':<10}{'n':>4}{'mediana (s)':>14}{'mín (s)':>10}{'máx (s)':>10}")
+
+        medianas = {}
+
+        for perfil in ("normal", "lite"):
+
+            tiempos = medir_arranque(fichaje, portal, perfil, args.repeticiones)
+
+            medianas[perfil] = statistics.median(tiempos)
+
+            print(f"{perfil:<10}{len(tiempos):>4}{medianas[perfil]:>14.3f}{min(tiempos):>10.3f}{max(tiempos):>10.3f}")
+
+    ahorro = medianas["normal"] - medianas["lite"]
+
+    print(f"\n⏱ 'lite' ahorra {ahorro:.3f} s por arranque ({ahorro / medianas['normal']:.0%})")
+
+    return 0
+
+
+def main():
+    """Ejecuta el benchmark de extremo a extremo contra el portal simulado"""
+
+    parser = argparse.ArgumentParser(description="Benchmark de FichajeEngine contra el portal WCRONOS simulado")
+
+    parser.add_argument("--usuarios", type=int, default=10, help="Tamaño del roster simulado")
+
+    parser.add_argument("--workers", default="1,2,4", help="Lista de números de workers separados por comas")
+
+    parser.add_argument("--latencia-ms", type=float, default=0, help="Latencia añadida por petición")
+
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Variación aleatoria de la latencia")
+
+    parser.add_argument("--fallo-http", type=float, default=0.0, help="Probabilidad de respuesta 503")
+
+    parser.add_argument("--fallo-login", type=float, default=0.0, help="Probabilidad de rechazo del login")
+
+    parser.add_argument("--fallo-fichaje", type=float, default=0.0, help="Probabilidad de error al fichar")
+
+    parser.add_argument("--semilla", type=int, default=1234, help="Semilla de la inyección de fallos")
+
+    parser.add_argument("--modo", choices=("shards", "motor"), default="shards",
+
+                        help="shards: N motores independientes; motor: un motor con concurrencia adaptativa hasta N")
+
+    parser.add_argument("--tasa-portal", type=float, help="Peticiones por segundo al portal (por defecto sin límite)")
+
+    parser.add_argument("--rafaga-portal", type=int, help="Ráfaga máxima del token bucket")
+
+    parser.add_argument("--pausa-usuarios-s", type=float, help="Pausa entre usuarios (por defecto sin pausa)")
+
+    parser.add_argument("--json", help="Fichero donde guardar los resultados en JSON")
+
+    subparsers = parser.add_subparsers(dest="comando")
+
+    p_import = subparsers.add_parser("importacion", help="Comprueba el presupuesto de tiempo de importación")
+
+    p_import.add_argument("--presupuesto-ms", type=float, default=100.0)
+
+    p_import.add_argument("--repeticiones", type=int, default=5)
+
+    p_arranque = subparsers.add_parser("arranque", help="Tiempo hasta el primer driver.get por perfil de Chrome")
+
+    p_arranque.add_argument("--repeticiones", type=int, default=5)
+
+    args = parser.parse_args()
+
+    if args.comando == "importacion":
+        sys.exit(comprobar_importacion(args))
+
+    if args.comando == "arranque":
+        sys.exit(comparar_arranque(args))
+
+    import fichaje
+
+    escenarios = []
+
+    ajustes = {}
+
+    if args.tasa_portal is not None:
+        ajustes['portal_tasa_por_s'] = args.tasa_portal
+
+    if args.rafaga_portal is not None:
+        ajustes['portal_rafaga'] = args.rafaga_portal
+
+    if args.pausa_usuarios_s is not None:
+        ajustes['pausa_entre_usuarios_s'] = args.pausa_usuarios_s
+
+    with PortalWCRONOS(latencia_ms=args.latencia_ms,
+
+                       jitter_ms=args.jitter_ms,
+
+                       fallo_http=args.fallo_http,
+
+                       fallo_login=args.fallo_login,
+
+                       fallo_fichaje=args.fallo_fichaje,
+
+                       semilla=args.semilla) as portal:
+
+        print(f"🌐 Portal simulado en {portal.url}")
+
+        for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+
+            resultado = ejecutar_escenario(fichaje, portal, args.usuarios, workers, ajustes, args.modo)
+
+            imprimir_escenario(resultado)
+
+            escenarios.append(resultado)
+
+        print(f"\n📈 Peticiones atendidas por el portal: {portal.contadores}")
+
+    if args.json:
+
+        with open(args.json, 'w', encoding='utf-8') as f:
+
+            json.dump({'parametros': vars(args), 'escenarios': escenarios}, f, indent=4, ensure_ascii=False)
+
+        print(f"📄 Resultados guardados en: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
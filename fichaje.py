@@ -16,51 +16,122 @@ import time
 
 import base64
 
-import requests
+import re
 
-import pandas as pd
+import random
+
+import heapq
+
+import csv
 
 import logging
 
 import threading
 
-import schedule
-
 import json
 
 import configparser
 
-import smtplib
+import argparse
+
+import gc
+
+import importlib
+
+import signal
+
+import shutil
+
+import tempfile
 
-from email.mime.text import MIMEText
+import io
 
-from email.mime.multipart import MIMEMultipart
+import tracemalloc
 
-from datetime import datetime
+from collections import deque
+
+from contextlib import contextmanager
+
+from datetime import datetime, timedelta
 
 from pathlib import Path
 
+from urllib.parse import urlparse
+
+
+# ==================== IMPORTACIONES DIFERIDAS ====================
+
+# Las dependencias pesadas (pandas, selenium, webdriver_manager, requests,
+
+# tkinter) se importan la primera vez que se usan: importar este módulo es rápido
+
+# y no tiene efectos secundarios.
+
+
+class LazyModule:
+    """Importa el módulo la primera vez que se accede a uno de sus atributos"""
+
+    def __init__(self, nombre, atributo=None):
+
+        self._nombre = nombre
+
+        self._atributo = atributo
+
+        self._objeto = None
+
+    def _resolver(self):
+
+        if self._objeto is None:
+
+            objeto = importlib.import_module(self._nombre)
+
+            if self._atributo:
+                objeto = getattr(objeto, self._atributo)
+
+            self._objeto = objeto
+
+        return self._objeto
+
+    def __getattr__(self, attr):
+
+        return getattr(self._resolver(), attr)
+
+    def __call__(self, *args, **kwargs):
+
+        return self._resolver()(*args, **kwargs)
+
+
+requests = LazyModule("requests")
+
+pd = LazyModule("pandas")
+
+cProfile = LazyModule("cProfile")
+
+pstats = LazyModule("pstats")
+
 # Selenium
 
-from selenium import webdriver
+webdriver = LazyModule("selenium.webdriver")
+
+By = LazyModule("selenium.webdriver.common.by", "By")
 
-from selenium.webdriver.common.by import By
+ChromeService = LazyModule("selenium.webdriver.chrome.service", "Service")
 
-from selenium.webdriver.chrome.service import Service as ChromeService
+WebDriverWait = LazyModule("selenium.webdriver.support.ui", "WebDriverWait")
 
-from selenium.webdriver.support.ui import WebDriverWait
+EC = LazyModule("selenium.webdriver.support.expected_conditions")
 
-from selenium.webdriver.support import expected_conditions as EC
+ChromeDriverManager = LazyModule("webdriver_manager.chrome", "ChromeDriverManager")
 
-from selenium.common.exceptions import TimeoutException, WebDriverException
+# Tkinter para GUI (se importa al crear la ventana: el modo consola no lo carga nunca)
 
-from webdriver_manager.chrome import ChromeDriverManager
+tk = LazyModule("tkinter")
 
-# Tkinter para GUI
+scrolledtext = LazyModule("tkinter.scrolledtext")
 
-import tkinter as tk
+messagebox = LazyModule("tkinter.messagebox")
 
-from tkinter import ttk, scrolledtext, messagebox, filedialog
+filedialog = LazyModule("tkinter.filedialog")
 
 # ==================== CONFIGURACIÓN GLOBAL ====================
 
@@ -70,53 +141,259 @@ CONFIG = {
 
     'csv_file': "datos.csv",
 
-    'log_file': f"fichajes_{datetime.now().strftime('%Y%m%d')}.log",
+    # Se fijan en inicializar_entorno() al crear el motor
 
-    'results_file': f"resultados_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+    'log_file': None,
+
+    'results_file': None,
 
     'screenshots_dir': "screenshots",
 
     'config_file': "horarios_config.json",
 
+    'roster_cache_max': 100000,
+
+    # Diario de ejecución para reanudar ('siempre', 'final' = solo estados finales, 'nunca')
+
+    'journal_dir': "journal",
+
+    'journal_fsync': "final",
+
+    # Minutos durante los que un fichaje exitoso evita volver a fichar al mismo usuario (0 = desactivado)
+
+    'idempotencia_ventana_min': 30,
+
+    # Reintentos dentro de la ejecución (intentos extra por usuario, backoff exponencial con jitter)
+
+    'reintentos_max': 2,
+
+    'reintentos_base_s': 30,
+
+    'reintentos_max_s': 300,
+
+    'reintentos_presupuesto_s': 900,
+
+    # Un resultado dudoso tras pulsar 'Realizar Fichaje' ('fichaje_enviado') nunca se reintenta
+
+    'reintentos_motivos': ['chrome', 'timeout', 'portal_inaccesible', 'login_rechazado'],
+
     'notifications_file': "notificaciones.ini",
 
+    'daemon_status_file': "fichaje_daemon.json",
+
     'headless': False,
 
     'api_key_2captcha': os.getenv("API_KEY_2CAPTCHA", "41c8f96621747395fd9731ebd83a746c"),
 
+    'captcha_api_url': "http://2captcha.com",
+
+    'captcha_poll_s': 5,
+
     'timeout_short': 5,
 
     'timeout_medium': 10,
 
-    'timeout_long': 30
+    'timeout_long': 30,
 
-}
+    # Perfilado opcional (también con la variable de entorno FICHAJE_PROFILE=1)
 
-# Crear directorios necesarios
+    'profiling': False,
 
-os.makedirs(CONFIG['screenshots_dir'], exist_ok=True)
+    'profiling_top_n': 25,
 
-# ==================== CONFIGURACIÓN DE LOGS ====================
+    'profiling_intervalo_ms': 10,
 
-logging.basicConfig(
+    'profiling_volcado_s': 300,
 
-    level=logging.INFO,
+    # Programador: espera máxima entre comprobaciones del reloj (detecta saltos de hora)
 
-    format='%(asctime)s - %(levelname)s - %(message)s',
+    'scheduler_max_espera_s': 60,
 
-    handlers=[
+    # Estado persistente del programador (próxima ejecución y último disparo de cada tarea)
 
-        logging.FileHandler(CONFIG['log_file'], encoding='utf-8'),
+    'jobstore_file': "scheduler_jobs.json",
 
-        logging.StreamHandler()
+    # Ejecuciones perdidas (equipo apagado o suspendido): 'coalescer', 'una_vez' u 'omitir'
 
-    ]
+    'misfire_politica': 'coalescer',
 
-)
+    'misfire_gracia_s': 3600,
+
+    # Solapamiento de ejecuciones: 'omitir', 'encolar' o 'concurrente' (hasta ejecutor_max_concurrentes)
+
+    'solapamiento_politica': 'encolar',
+
+    'ejecutor_max_concurrentes': 2,
+
+    # Control de tráfico hacia el portal (token bucket; tasa 0 = sin límite)
+
+    'portal_tasa_por_s': 1.0,
+
+    'portal_rafaga': 3,
+
+    # Reparto de los inicios de una ejecución a lo largo de N segundos (0 = sin reparto)
+
+    'portal_ventana_reparto_s': 0,
+
+    # Pausa entre el lanzamiento de un usuario y el siguiente
+
+    'pausa_entre_usuarios_s': 3,
+
+    # Concurrencia adaptativa (AIMD): usuarios en paralelo entre min y max según latencia y errores
+
+    'concurrencia_min': 1,
+
+    'concurrencia_max': 3,
+
+    'concurrencia_inicial': 1,
+
+    'concurrencia_latencia_objetivo_s': 10.0,
+
+    'concurrencia_error_max': 0.25,
+
+    'concurrencia_ventana': 3,
+
+    'concurrencia_factor': 0.5,
+
+    'concurrencia_export': "concurrencia.csv",
+
+    # Circuit breaker del portal: se abre tras N fallos seguidos de nivel portal
+
+    'circuito_fallos': 5,
+
+    'circuito_espera_s': 60,
+
+    'circuito_sonda_timeout_s': 5,
+
+    # Usuarios con el circuito abierto: 'aplazar' (a la cola de reintentos) o 'fallar'
+
+    'circuito_politica': 'aplazar',
+
+    # Perfil de arranque de Chrome: 'normal' o 'lite' (flags mínimos y user-data-dir precargado)
+
+    'chrome_perfil': 'normal',
+
+    'chrome_plantilla_dir': "chrome_plantilla",
+
+    # Bloqueo de recursos no esenciales vía DevTools (Network.setBlockedURLs)
+
+    'bloqueo_red': False,
+
+    'bloqueo_tipos': ['Image', 'Stylesheet', 'Font', 'Media'],
+
+    'bloqueo_denegar': [],
+
+    # Nunca se bloquean: tienen prioridad sobre las reglas de bloqueo
+
+    'bloqueo_permitir': ['*captcha*', '*codigo*'],
+
+    # Navegación directa al documento de login (sin frameset ni cambios de frame)
+
+    'navegacion_directa': False,
+
+    'frames_cache_file': "frames_cache.json",
+
+    'frames_cache_ttl_h': 24,
+
+    # Relleno del login: 'script' (una sola llamada al driver) o 'nativo' (send_keys campo a campo)
+
+    'relleno_formulario': 'script',
+
+    # Estrategia ganadora por página para localizar ENTRAR y 'Realizar Fichaje'
+
+    'selectores_cache_file': "selectores_cache.json",
+
+    'selectores_degradar_fallos': 2,
+
+    # Caché cifrada de cookies de sesión por usuario (requiere el paquete opcional 'cryptography')
+
+    'sesiones_cache': False,
+
+    'sesiones_cache_file': "sesiones_cache.bin",
+
+    'sesiones_clave_file': "sesiones.key",
+
+    'sesiones_ttl_min': 30,
+
+    # Preparación: segundos antes de cada horario en que se hace login y se espera en Punto de
+    # Fichaje para fichar todos a la hora exacta (0 = desactivado)
+
+    'preparacion_adelanto_s': 0,
+
+    'preparacion_max_usuarios': 10,
+
+    # Calibración del reloj con la cabecera Date del portal (la hora que cuenta es la del servidor)
+
+    'reloj_calibrar': True,
+
+    'reloj_muestras': 5,
+
+    'reloj_recalibrar_min': 60,
+
+    'reloj_file': "reloj_portal.json",
+
+    # Vigilante del driver: plazo máximo por comando de WebDriver. Los comandos que pueden
+    # navegar (get, clics, scripts) esperan hasta el page load timeout de 60 s y tienen
+    # el plazo de carga, que debe ser mayor
+
+    'driver_comando_timeout_s': 30,
+
+    'driver_carga_timeout_s': 90,
+
+    # Supervisión de procesos: PIDs de cada navegador lanzado, limpieza de huérfanos y
+    # reciclado del navegador que pase de driver_rss_max_mb de memoria residente. Cada
+    # proceso escribe su propio registro (procesos_chrome.<pid>.json)
+
+    'procesos_file': "procesos_chrome.json",
+
+    'procesos_revision_s': 5,
+
+    'procesos_recoleccion_min': 10,
+
+    'driver_rss_max_mb': 1500
+
+}
+
+# ==================== CONFIGURACIÓN DE LOGS ====================
 
 logger = logging.getLogger(__name__)
 
 
+def inicializar_entorno(config):
+    """Crea directorios, configura los logs y fija los ficheros de log y resultados de la sesión"""
+
+    ahora = datetime.now()
+
+    if not config.get('log_file'):
+        config['log_file'] = f"fichajes_{ahora.strftime('%Y%m%d')}.log"
+
+    if not config.get('results_file'):
+        config['results_file'] = f"resultados_{ahora.strftime('%Y%m%d_%H%M%S')}.csv"
+
+    # Crear directorios necesarios
+
+    os.makedirs(config['screenshots_dir'], exist_ok=True)
+
+    # Solo la primera vez (o si la aplicación que nos importa no configuró los logs)
+
+    if not logging.getLogger().handlers:
+        logging.basicConfig(
+
+            level=logging.INFO,
+
+            format='%(asctime)s - %(levelname)s - %(message)s',
+
+            handlers=[
+
+                logging.FileHandler(config['log_file'], encoding='utf-8'),
+
+                logging.StreamHandler()
+
+            ]
+
+        )
+
+
 # ==================== GESTOR DE NOTIFICACIONES ====================
 
 class NotificationManager:
@@ -261,6 +538,12 @@ class NotificationManager:
         if not self.email_enabled:
             return False
 
+        import smtplib
+
+        from email.mime.text import MIMEText
+
+        from email.mime.multipart import MIMEMultipart
+
         try:
 
             msg = MIMEMultipart()
@@ -361,1077 +644,6336 @@ class NotificationManager:
             self.send_email(f"[Fichaje] {titulo}", email_html)
 
 
-# ==================== CLASE PARA EL MOTOR DE FICHAJE ====================
+# ==================== PERFILADO (PROFILING) ====================
 
-class FichajeEngine:
-    """Motor de fichaje con todas las funciones necesarias"""
+class MuestreadorPerfil:
+    """Profiler de muestreo: toma la pila de un thread cada pocos milisegundos"""
 
-    def __init__(self, config):
+    def __init__(self, thread_id, intervalo_ms=10, al_volcar=None, volcado_s=0):
 
-        self.config = config
+        self.thread_id = thread_id
 
-        self.notifier = NotificationManager(config['notifications_file'])
+        self.intervalo = intervalo_ms / 1000.0
 
-    def start_driver(self, headless=False):
+        self.al_volcar = al_volcar
 
-        """Inicia el driver de Chrome con configuración optimizada"""
+        self.volcado_s = volcado_s
 
-        try:
+        self.muestras = 0
 
-            options = webdriver.ChromeOptions()
+        self.propias = {}
 
-            if headless:
-                options.add_argument("--headless=new")
+        self.acumuladas = {}
 
-            # Opciones para mayor estabilidad
+        self._parar = threading.Event()
 
-            options.add_argument("--no-sandbox")
+        self._thread = None
 
-            options.add_argument("--disable-dev-shm-usage")
+    def iniciar(self):
 
-            options.add_argument("--disable-gpu")
+        self._thread = threading.Thread(target=self._bucle, daemon=True)
 
-            options.add_argument("--disable-software-rasterizer")
+        self._thread.start()
 
-            options.add_argument("--disable-extensions")
+    def detener(self):
 
-            options.add_argument("--disable-blink-features=AutomationControlled")
+        self._parar.set()
 
-            options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        if self._thread:
+            self._thread.join()
 
-            options.add_experimental_option('useAutomationExtension', False)
+    def _bucle(self):
 
-            prefs = {
+        ultimo_volcado = time.monotonic()
 
-                "profile.default_content_setting_values.notifications": 2,
+        while not self._parar.wait(self.intervalo):
 
-                "profile.default_content_settings.popups": 0
+            frame = sys._current_frames().get(self.thread_id)
 
-            }
+            if frame is None:
+                continue
 
-            options.add_experimental_option("prefs", prefs)
+            self.muestras += 1
 
-            driver = webdriver.Chrome(
+            vistas = set()
 
-                service=ChromeService(ChromeDriverManager().install()),
+            hoja = True
 
-                options=options
+            while frame is not None:
 
-            )
+                code = frame.f_code
 
-            driver.set_window_size(1200, 900)
+                clave = (code.co_filename, code.co_firstlineno, code.co_name)
 
-            driver.set_page_load_timeout(60)
+                if hoja:
 
-            logger.info("✅ Driver de Chrome iniciado correctamente")
+                    self.propias[clave] = self.propias.get(clave, 0) + 1
 
-            return driver
+                    hoja = False
 
-        except Exception as e:
+                if clave not in vistas:
 
-            logger.error(f"❌ Error iniciando driver: {e}")
+                    vistas.add(clave)
 
-            raise
+                    self.acumuladas[clave] = self.acumuladas.get(clave, 0) + 1
 
-    def solve_captcha_2captcha(self, image_path, api_key, timeout=120):
+                frame = frame.f_back
 
-        """Resuelve captcha usando API de 2Captcha"""
+            if self.al_volcar and self.volcado_s and time.monotonic() - ultimo_volcado >= self.volcado_s:
 
-        try:
+                ultimo_volcado = time.monotonic()
 
-            with open(image_path, "rb") as f:
+                self.al_volcar()
 
-                b64 = base64.b64encode(f.read()).decode()
+    def informe(self, top_n):
 
-            logger.info("📤 Enviando captcha a 2Captcha...")
+        """Devuelve el top-N de funciones por muestras propias y acumuladas"""
 
-            r = requests.post("http://2captcha.com/in.php", data={
+        lineas = [f"Muestras: {self.muestras} (intervalo {self.intervalo * 1000:.0f} ms)", ""]
 
-                "method": "base64",
+        for titulo, tabla in (("FUNCIONES MÁS CALIENTES (tiempo propio)", self.propias),
 
-                "key": api_key,
+                              ("FUNCIONES MÁS CALIENTES (tiempo acumulado)", self.acumuladas)):
 
-                "body": b64,
+            lineas.append(titulo)
 
-                "json": 1
+            for (fichero, linea, nombre), n in sorted(tabla.items(), key=lambda x: -x[1])[:top_n]:
 
-            }, timeout=10).json()
+                pct = 100.0 * n / max(self.muestras, 1)
 
-            if r.get("status") != 1:
-                logger.error(f"❌ Error enviando captcha: {r}")
+                lineas.append(f"  {n:>8} {pct:6.1f}%  {nombre} ({os.path.basename(fichero)}:{linea})")
 
-                return None
+            lineas.append("")
 
-            captcha_id = r["request"]
+        return "\n".join(lineas)
 
-            logger.info(f"⏳ Esperando respuesta de captcha...")
 
-            for _ in range(timeout // 5):
+class SesionPerfil:
+    """Una sesión de perfilado: profiler, seguimiento de memoria y secciones anidadas"""
 
-                time.sleep(5)
+    def __init__(self, manager, nombre, etiqueta, muestreo):
 
-                res = requests.get("http://2captcha.com/res.php", params={
+        self.manager = manager
 
-                    "key": api_key,
+        self.nombre = nombre
 
-                    "action": "get",
+        self.etiqueta = etiqueta
 
-                    "id": captcha_id,
+        self.inicio = time.perf_counter()
 
-                    "json": 1
+        self.marca = datetime.now().strftime('%Y%m%d_%H%M%S')
 
-                }, timeout=10).json()
+        self.secciones = []
 
-                if res.get("status") == 1:
-                    logger.info(f"✅ Captcha resuelto: {res['request']}")
+        self.profile = None
 
-                    return res["request"]
+        self.muestreador = None
 
-                if res.get("request") != "CAPCHA_NOT_READY":
-                    logger.error(f"❌ Error resolviendo captcha: {res}")
+        self.snapshot_inicial = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
 
-                    return None
+        if not muestreo:
 
-            logger.warning("⏱ Timeout esperando respuesta de 2Captcha")
+            try:
 
-            return None
+                self.profile = cProfile.Profile()
 
-        except Exception as e:
+                self.profile.enable()
 
-            logger.error(f"❌ Error en 2Captcha: {e}")
+            except ValueError:
 
-            return None
+                # Otro profiler determinista ya está activo en el proceso: usamos muestreo
 
-    def find_captcha_image(self, driver):
+                self.profile = None
 
-        """Busca la imagen del captcha"""
+        if self.profile is None:
 
-        try:
+            self.muestreador = MuestreadorPerfil(
 
-            imgs = driver.find_elements(By.TAG_NAME, "img")
+                threading.get_ident(),
 
-            for img in imgs:
+                manager.config.get('profiling_intervalo_ms', 10),
 
-                src = (img.get_attribute("src") or "").lower()
+                al_volcar=self.volcar,
 
-                if "captcha" in src or "codigo" in src:
-                    logger.info("✅ Imagen de captcha encontrada")
+                volcado_s=manager.config.get('profiling_volcado_s', 0)
 
-                    return img
+            )
 
-            logger.warning("⚠️ No se encontró imagen de captcha")
+            self.muestreador.iniciar()
 
-            return None
+    def cerrar(self):
 
-        except Exception as e:
+        if self.profile is not None:
+            self.profile.disable()
 
-            logger.error(f"❌ Error buscando captcha: {e}")
+        if self.muestreador is not None:
+            self.muestreador.detener()
 
-            return None
+        return self.volcar()
 
-    def take_screenshot(self, driver, filename):
+    def volcar(self):
 
-        """Captura screenshot con timestamp"""
+        """Escribe el perfil (.prof) y el informe top-N (.txt) junto a los resultados"""
 
-        try:
+        top_n = self.manager.config.get('profiling_top_n', 25)
 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        directorio = os.path.dirname(os.path.abspath(self.manager.config['results_file']))
 
-            filepath = os.path.join(self.config['screenshots_dir'], f"{timestamp}_{filename}")
+        sufijo = f"_{self.etiqueta}" if self.etiqueta else ""
 
-            driver.save_screenshot(filepath)
+        base = os.path.join(directorio, f"perfil_{self.nombre}{sufijo}_{self.marca}")
 
-            logger.info(f"📸 Screenshot guardado: {filepath}")
+        lineas = [
 
-            return filepath
+            f"PERFIL: {self.nombre}{sufijo}",
 
-        except Exception as e:
+            f"Duración: {time.perf_counter() - self.inicio:.3f} s",
 
-            logger.error(f"❌ Error guardando screenshot: {e}")
+            ""
 
-            return ""
+        ]
 
-    def guardar_resultado(self, usuario, estado, mensaje, screenshot_path=""):
+        if self.profile is not None:
 
-        """Guarda el resultado del fichaje en CSV"""
+            self.profile.dump_stats(base + ".prof")
 
-        try:
+            for orden, titulo in (("tottime", "FUNCIONES MÁS CALIENTES (tiempo propio)"),
 
-            resultado = {
+                                  ("cumulative", "FUNCIONES MÁS CALIENTES (tiempo acumulado)")):
 
-                'fecha_hora': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                salida = io.StringIO()
 
-                'usuario': usuario,
+                pstats.Stats(base + ".prof", stream=salida).sort_stats(orden).print_stats(top_n)
 
-                'estado': estado,
+                lineas += [titulo, salida.getvalue()]
 
-                'mensaje': mensaje,
+        else:
 
-                'screenshot': screenshot_path
+            lineas.append(self.muestreador.informe(top_n))
 
-            }
+        if self.snapshot_inicial is not None and tracemalloc.is_tracing():
 
-            df = pd.DataFrame([resultado])
+            actual, pico = tracemalloc.get_traced_memory()
 
-            if os.path.exists(self.config['results_file']):
+            lineas.append(f"MEMORIA: actual {actual / 1024:.0f} KB - pico {pico / 1024:.0f} KB")
 
-                df.to_csv(self.config['results_file'], mode='a', header=False, index=False, encoding='utf-8')
+            lineas.append("MAYORES ASIGNADORES DE MEMORIA (crecimiento durante la sesión)")
 
-            else:
+            diferencias = tracemalloc.take_snapshot().compare_to(self.snapshot_inicial, 'lineno')
 
-                df.to_csv(self.config['results_file'], mode='w', header=True, index=False, encoding='utf-8')
+            for stat in diferencias[:top_n]:
+                lineas.append(f"  {stat}")
 
-            logger.info(f"📝 Resultado guardado")
+            lineas.append("")
 
-        except Exception as e:
+        if self.secciones:
 
-            logger.error(f"❌ Error guardando resultado: {e}")
+            lineas.append("SECCIONES")
 
-    def safe_click(self, driver, element, description="elemento"):
+            agregadas = {}
 
-        """Hace clic de forma segura con múltiples intentos"""
+            for nombre, etiqueta, duracion in self.secciones:
 
-        try:
+                n, total, maximo = agregadas.get(nombre, (0, 0.0, 0.0))
 
-            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", element)
+                agregadas[nombre] = (n + 1, total + duracion, max(maximo, duracion))
 
-            time.sleep(0.3)
+            for nombre, (n, total, maximo) in agregadas.items():
+                lineas.append(f"  {nombre}: {n} llamadas - total {total:.2f} s - media {total / n:.2f} s - máx {maximo:.2f} s")
 
-            element.click()
+            lineas.append("")
 
-            logger.info(f"✅ Clic en {description}")
+            lineas.append("SECCIONES MÁS LENTAS")
 
-            return True
+            for nombre, etiqueta, duracion in sorted(self.secciones, key=lambda x: -x[2])[:top_n]:
+                lineas.append(f"  {duracion:8.2f} s  {nombre} {etiqueta}")
 
-        except Exception as e1:
+        with open(base + ".txt", 'w', encoding='utf-8') as f:
 
-            try:
+            f.write("\n".join(lineas) + "\n")
 
-                driver.execute_script("arguments[0].click();", element)
+        return base + ".txt"
 
-                logger.info(f"✅ Clic con JS en {description}")
 
-                return True
+class ProfilingManager:
+    """Perfilado opcional de ejecuciones, fichajes y del scheduler (CPU y memoria)"""
 
-            except Exception as e2:
+    def __init__(self, config):
 
-                logger.error(f"❌ No se pudo hacer clic en {description}")
+        self.config = config
 
-                return False
+        self._local = threading.local()
 
-    def realizar_fichaje(self, usuario, password, driver, callback=None):
+        self._lock = threading.Lock()
 
-        """Realiza el proceso completo de fichaje"""
+        self._usuarios_tracemalloc = 0
 
-        logger.info(f"\n{'=' * 70}")
+    @property
+    def activo(self):
 
-        logger.info(f"🚀 FICHAJE PARA: {usuario}")
+        """Activado por CONFIG['profiling'] o por la variable de entorno FICHAJE_PROFILE"""
 
-        logger.info(f"{'=' * 70}")
+        if self.config.get('profiling'):
+            return True
 
-        if callback:
-            callback(f"Iniciando fichaje para {usuario}...")
+        return os.getenv("FICHAJE_PROFILE", "").strip().lower() in ("1", "true", "si", "sí", "yes", "on")
 
-        screenshot_path = ""
+    @contextmanager
+    def perfilar(self, nombre, etiqueta="", muestreo=False):
 
-        try:
+        """Perfila el bloque; si ya hay una sesión en este thread se registra como sección"""
 
-            # 1. Cargar página
+        if not self.activo:
 
-            logger.info("📍 Cargando página de login...")
+            yield
 
-            if callback:
-                callback("Cargando página de login...")
+            return
 
-            driver.get(self.config['url'])
+        pila = getattr(self._local, 'pila', None)
 
-            time.sleep(3)
+        if pila is None:
 
-            # 2. Entrar a frames
+            pila = self._local.pila = []
 
-            logger.info("🔀 Entrando a frames...")
+        if pila:
 
-            if callback:
-                callback("Accediendo al sistema...")
+            inicio = time.perf_counter()
 
-            driver.switch_to.frame("cuerpo_WCRONOS")
+            try:
 
-            time.sleep(1)
+                yield
 
-            driver.switch_to.frame("principal_wcronos")
+            finally:
 
-            time.sleep(1)
+                pila[-1].secciones.append((nombre, etiqueta, time.perf_counter() - inicio))
 
-            # 3. Localizar campos
+            return
 
-            logger.info("🔍 Localizando campos del formulario...")
+        self._iniciar_tracemalloc()
 
-            if callback:
-                callback("Localizando formulario de login...")
+        sesion = None
 
-            tarjeta_field = WebDriverWait(driver, self.config['timeout_medium']).until(
+        try:
 
-                EC.presence_of_element_located((By.ID, "USUARIO"))
+            sesion = SesionPerfil(self, nombre, etiqueta, muestreo)
 
-            )
+            pila.append(sesion)
 
-            contrasena_field = driver.find_element(By.ID, "CONTRASENA")
+            yield
 
-            captcha_field = driver.find_element(By.NAME, "codigo_captcha")
+        finally:
 
-            # 4. Captcha
+            if sesion is not None:
 
-            captcha_value = None
+                pila.pop()
 
-            captcha_img = self.find_captcha_image(driver)
+                try:
 
-            if captcha_img:
+                    informe = sesion.cerrar()
 
-                if callback:
-                    callback("Resolviendo captcha...")
+                    logger.info(f"📈 Perfil de {nombre} guardado en: {informe}")
 
-                captcha_path = f"captcha_{usuario}_{datetime.now().strftime('%H%M%S')}.png"
+                except Exception as e:
 
-                try:
+                    logger.error(f"❌ Error guardando perfil de {nombre}: {e}")
 
-                    captcha_img.screenshot(captcha_path)
+            self._detener_tracemalloc()
 
-                    captcha_value = self.solve_captcha_2captcha(captcha_path, self.config['api_key_2captcha'])
+    def _iniciar_tracemalloc(self):
 
-                    os.remove(captcha_path)
+        with self._lock:
 
-                except:
+            if self._usuarios_tracemalloc == 0 and not tracemalloc.is_tracing():
 
-                    pass
+                tracemalloc.start()
 
-            if not captcha_value:
-                captcha_value = "0000"
+            self._usuarios_tracemalloc += 1
 
-            # 5. Rellenar formulario
+    def _detener_tracemalloc(self):
 
-            logger.info("📝 Rellenando formulario...")
+        with self._lock:
 
-            if callback:
-                callback("Ingresando credenciales...")
+            self._usuarios_tracemalloc -= 1
 
-            tarjeta_field.clear()
+            if self._usuarios_tracemalloc == 0 and tracemalloc.is_tracing():
+                tracemalloc.stop()
 
-            tarjeta_field.send_keys(usuario)
 
-            time.sleep(0.5)
+# ==================== LECTURA DEL ROSTER (CSV DE USUARIOS) ====================
 
-            contrasena_field.clear()
+class RosterError(Exception):
+    """Error de formato en el CSV de usuarios"""
 
-            contrasena_field.send_keys(password)
 
-            time.sleep(0.5)
+def normalizar_hora(texto):
+    """'8:00', '08:00' o '08:00:00' -> '08:00' (None si no es una hora válida)"""
 
-            captcha_field.clear()
+    try:
 
-            captcha_field.send_keys(captcha_value)
+        partes = [int(p) for p in texto.strip().split(':')]
 
-            time.sleep(0.5)
+    except ValueError:
 
-            screenshot_path = self.take_screenshot(driver, f"antes_login_{usuario}.png")
+        return None
 
-            # 6. Hacer clic en ENTRAR
+    if len(partes) not in (2, 3) or not (0 <= partes[0] < 24 and 0 <= partes[1] < 60):
+        return None
 
-            logger.info("🔍 Buscando botón ENTRAR...")
+    return f"{partes[0]:02d}:{partes[1]:02d}"
 
-            if callback:
-                callback("Haciendo login...")
 
-            botones = driver.find_elements(By.XPATH, "//button | //input[@type='submit']")
+def parsear_turno(dias, horas, usuario=None):
+    """Columnas opcionales 'dias' ('LMXJV' o 'L,M,X') y 'horas' ('08:00;15:00') -> (días, horas) o None
 
-            entrar_clicked = False
+    Las horas no válidas se descartan con un aviso que identifica al usuario; si la columna
+    'horas' tiene texto pero ninguna hora válida se lanza ValueError (no se amplía el turno).
+    """
 
-            for btn in botones:
+    dias = (dias or "").upper()
 
-                texto = (btn.text or "").lower()
+    horas_texto = (horas or "").strip()
 
-                value = (btn.get_attribute("value") or "").lower()
+    textos = [h.strip() for h in (horas or "").replace('|', ';').replace(',', ';').split(';') if h.strip()]
 
-                if "entrar" in texto or "entrar" in value:
+    horas = [normalizar_hora(h) for h in textos]
 
-                    if self.safe_click(driver, btn, "botón ENTRAR"):
-                        entrar_clicked = True
+    for texto, hora in zip(textos, horas):
 
-                        break
+        if hora is None:
+            logger.warning(f"⚠️ Hora de turno no válida '{texto}' para {usuario or 'usuario sin tarjeta'} - se ignora")
 
-            if not entrar_clicked:
-                raise Exception("No se pudo hacer clic en ENTRAR")
+    if textos and not any(horas):
+        raise ValueError(f"ninguna hora de turno válida en '{horas_texto}'")
 
-            # 7. Esperar redirección
+    letras = frozenset(letra for letra in dias if letra in DIAS_NUMERO)
 
-            time.sleep(5)
+    if not horas and not letras:
+        return None
 
-            logger.info(f"📍 Login completado")
+    # Sin días se entiende toda la semana; sin horas, cualquier horario de esos días
 
-            # 8. Ir a Punto de Fichaje
+    return (letras or frozenset(TODOS_LOS_DIAS), tuple(h for h in horas if h))
 
-            if callback:
-                callback("Navegando a punto de fichaje...")
 
-            time.sleep(2)
+def franja_de(instante, horario):
+    """Franja (letra del día, 'HH:MM') de una ejecución programada"""
 
-            boton_fichaje = driver.find_element(
+    return (TODOS_LOS_DIAS[datetime.fromtimestamp(instante).weekday()], normalizar_hora(horario))
 
-                By.XPATH,
 
-                "//button[contains(@onclick, 'form_pfichaje.submit')]"
+class UsuarioRoster:
+    """Registro compacto de un usuario del CSV (turno = (días, horas) o None si ficha en todos los horarios)"""
 
-            )
+    __slots__ = ('tarjeta', 'contrasena', 'fila', 'turno')
 
-            onclick = boton_fichaje.get_attribute("onclick")
+    def __init__(self, tarjeta, contrasena, fila, turno=None):
 
-            driver.execute_script(onclick)
+        self.tarjeta = tarjeta
 
-            logger.info("✅ Navegando a Punto De Fichaje")
+        self.contrasena = contrasena
 
-            time.sleep(4)
+        self.fila = fila
 
-            # 9. Volver a entrar en frames
+        self.turno = turno
 
-            driver.switch_to.default_content()
+    def __repr__(self):
 
-            time.sleep(1)
+        return f"UsuarioRoster(tarjeta={self.tarjeta!r}, fila={self.fila})"
 
-            driver.switch_to.frame("cuerpo_WCRONOS")
 
-            time.sleep(1)
+class LectorRoster:
+    """Lee el CSV de usuarios fila a fila y cachea el roster parseado según la fecha de modificación"""
 
-            driver.switch_to.frame("principal_wcronos")
+    COLUMNAS = ('tarjeta', 'contrasena')
 
-            time.sleep(1)
+    # Columnas opcionales con el turno de cada usuario
 
-            # 10. REALIZAR FICHAJE
+    COLUMNAS_TURNO = ('dias', 'horas')
 
-            logger.info("🔍 Buscando botón 'Realizar Fichaje'...")
+    # Caché compartida entre motores: ruta -> (firma del fichero, registros o None, total)
 
-            if callback:
-                callback("Realizando fichaje...")
+    _cache = {}
 
-            fichaje_realizado = False
+    # Índice de turnos: ruta -> (firma del fichero, índice)
 
-            # Intento 1: Por ID
+    _cache_franjas = {}
 
-            try:
+    _cache_lock = threading.Lock()
 
-                boton = driver.find_element(By.ID, "btnEnviarForm")
+    def __init__(self, ruta, max_cache=100000):
 
-                if self.safe_click(driver, boton, "Realizar Fichaje"):
-                    fichaje_realizado = True
+        self.ruta = ruta
 
-            except:
+        self.max_cache = max_cache
 
-                pass
+    def _firma(self):
 
-            # Intento 2: Por texto
+        st = os.stat(self.ruta)
 
-            if not fichaje_realizado:
+        return (st.st_mtime_ns, st.st_size)
 
-                try:
+    def _abrir(self):
 
-                    botones = driver.find_elements(By.XPATH,
+        # utf-8-sig elimina el BOM de los CSV exportados desde Excel
 
-                                                   "//button[contains(., 'Realizar Fichaje')] | //button[contains(., 'Fichar')]")
+        return open(self.ruta, 'r', newline='', encoding='utf-8-sig')
 
-                    if botones and self.safe_click(driver, botones[0], "Realizar Fichaje"):
-                        fichaje_realizado = True
+    def _indices(self, cabecera):
 
-                except:
+        """Valida las columnas una sola vez y devuelve la posición de cada una"""
 
-                    pass
+        nombres = [(c or "").strip().lower() for c in cabecera or []]
 
-            # Intento 3: Submit
+        faltan = [c for c in self.COLUMNAS if c not in nombres]
 
-            if not fichaje_realizado:
-                driver.execute_script("""
+        if faltan:
+            raise RosterError(f"Faltan columnas en {self.ruta}: {', '.join(faltan)}")
 
-                    let btn = document.getElementById('btnEnviarForm');
+        opcionales = [nombres.index(c) if c in nombres else None for c in self.COLUMNAS_TURNO]
 
-                    if (btn && btn.form) btn.form.submit();
+        return [nombres.index(c) for c in self.COLUMNAS] + opcionales
 
-                """)
+    def _filas(self):
 
-                fichaje_realizado = True
+        """Genera (número de fila, tarjeta, contraseña, turno) sin cargar el fichero en memoria"""
 
-            if not fichaje_realizado:
-                raise Exception("No se pudo realizar el fichaje")
+        with self._abrir() as f:
 
-            # 11. Verificar resultado
+            reader = csv.reader(f)
 
-            time.sleep(3)
+            i_tarjeta, i_contrasena, i_dias, i_horas = self._indices(next(reader, None))
 
-            screenshot_path = self.take_screenshot(driver, f"resultado_{usuario}.png")
+            ancho = max(i_tarjeta, i_contrasena)
 
-            # GUARDAR HTML COMPLETO PARA DEBUG
+            con_turno = i_dias is not None or i_horas is not None
 
-            try:
+            for fila in reader:
 
-                page_html = driver.page_source
+                if not fila or not any(c.strip() for c in fila):
+                    continue
 
-                html_file = os.path.join(self.config['screenshots_dir'],
+                if len(fila) <= ancho:
 
-                                         f"html_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{usuario}.html")
+                    logger.warning(f"⚠️ Fila {reader.line_num} incompleta en {self.ruta} - se omite")
 
-                with open(html_file, 'w', encoding='utf-8') as f:
+                    continue
 
-                    f.write(page_html)
+                tarjeta = fila[i_tarjeta].strip()
 
-                logger.info(f"📄 HTML guardado en: {html_file}")
+                if not tarjeta:
 
-                # Imprimir HTML en consola también
+                    logger.warning(f"⚠️ Fila {reader.line_num} sin tarjeta en {self.ruta} - se omite")
 
-                print("\n" + "=" * 80)
+                    continue
 
-                print("🔍 HTML COMPLETO DE LA PÁGINA RESULTADO:")
+                turno = None
 
-                print("=" * 80)
+                if con_turno:
 
-                print(page_html)
+                    try:
 
-                print("=" * 80)
+                        turno = parsear_turno(
 
-                print("FIN DEL HTML")
+                            fila[i_dias] if i_dias is not None and i_dias < len(fila) else "",
 
-                print("=" * 80 + "\n")
+                            fila[i_horas] if i_horas is not None and i_horas < len(fila) else "",
 
-            except Exception as e:
+                            tarjeta
 
-                logger.error(f"Error guardando HTML: {e}")
+                        )
 
-            # Obtener el texto de la página
+                    except ValueError as e:
 
-            page_text = driver.page_source.lower()
+                        logger.warning(f"⚠️ Fila {reader.line_num} ({tarjeta}) en {self.ruta}: {e} - se omite")
 
-            # INDICADORES DE ÉXITO - Por prioridad (más específicos primero)
+                        continue
 
-            success_indicators_alta_prioridad = [
+                yield reader.line_num, tarjeta, fila[i_contrasena].strip(), turno
 
-                "el fichaje se a realizado correctamente",  # Mensaje EXACTO
+    def _cacheado(self):
 
-                "el fichaje se ha realizado correctamente",  # Variante con H
+        try:
 
-                "fichaje se a realizado correctamente",
+            firma = self._firma()
 
-                "fichaje se ha realizado correctamente",
+        except OSError:
 
-                "se a realizado correctamente",
+            return None, None
 
-                "se ha realizado correctamente",
+        with self._cache_lock:
 
-            ]
+            entrada = self._cache.get(os.path.abspath(self.ruta))
 
-            success_indicators_media_prioridad = [
+        if entrada and entrada[0] == firma:
+            return firma, entrada
 
-                "fichaje realizado",
+        return firma, None
 
-                "fichaje añadido",
+    def total(self):
 
-                "fichaje registrado",
+        """Número de usuarios del roster (valida las columnas y reutiliza la caché)"""
 
-                "añadido con éxito",
+        firma, entrada = self._cacheado()
 
-                "registrado con éxito",
+        if entrada:
+            return entrada[2]
 
-                "realizado con éxito",
+        total = 0
 
-                "fichaje correcto",
+        for _ in self._filas():
+            total += 1
 
-                "operación exitosa",
+        with self._cache_lock:
 
-                "guardado correctamente",
+            self._cache[os.path.abspath(self.ruta)] = (firma, None, total)
 
-            ]
+        return total
 
-            success_indicators_baja_prioridad = [
+    def __iter__(self):
 
-                "éxito",
+        """Itera los usuarios como UsuarioRoster; los rosters pequeños quedan cacheados"""
 
-                "exitoso",
+        firma, entrada = self._cacheado()
 
-                "correctamente",
+        if entrada and entrada[1] is not None:
 
-                "confirmado",
+            yield from entrada[1]
 
-                "completado"
+            return
 
-            ]
+        registros = []
 
-            # INDICADORES DE ERROR - Solo mensajes claros de error
+        total = 0
 
-            error_indicators_especificos = [
+        for fila, tarjeta, contrasena, turno in self._filas():
 
-                "error al realizar",
+            registro = UsuarioRoster(tarjeta, contrasena, fila, turno)
 
-                "error en el fichaje",
+            total += 1
 
-                "fichaje incorrecto",
+            if registros is not None:
 
-                "fichaje fallido",
+                registros.append(registro)
 
-                "no se pudo realizar",
+                # Roster demasiado grande: se sigue leyendo en streaming sin cachear
 
-                "operación fallida",
+                if len(registros) > self.max_cache:
+                    registros = None
 
-                "fichaje rechazado",
+            yield registro
 
-                "no se ha podido",
+        with self._cache_lock:
 
-                "ha ocurrido un error"
+            self._cache[os.path.abspath(self.ruta)] = (firma, tuple(registros) if registros is not None else None, total)
 
-            ]
+    def indice_franjas(self):
 
-            # PASO 1: Buscar indicadores de ALTA PRIORIDAD (mensajes específicos de éxito)
+        """Índice franja (día, 'HH:MM') -> tarjetas con turno en ella, más el número de usuarios sin turno
 
-            for indicator in success_indicators_alta_prioridad:
+        Los usuarios con turno de días pero sin horas fichan en cualquier horario de esos días:
+        se guardan por día con la hora None.
+        """
 
-                if indicator in page_text:
+        firma, _ = self._cacheado()
 
-                    logger.info(f"✅✅✅ FICHAJE EXITOSO para {usuario}")
+        clave = os.path.abspath(self.ruta)
 
-                    logger.info(f"   Mensaje detectado (ALTA PRIORIDAD): '{indicator}'")
+        with self._cache_lock:
 
-                    if callback:
-                        callback(f"✅ Fichaje exitoso para {usuario}")
+            entrada = self._cache_franjas.get(clave)
 
-                    self.guardar_resultado(usuario, "ÉXITO", f"Fichaje completado: {indicator}", screenshot_path)
+        if entrada and entrada[0] == firma:
+            return entrada[1]
 
-                    # Enviar notificación de éxito
+        franjas = {}
 
-                    self.notifier.notify(
+        sin_turno = 0
 
-                        "Fichaje Exitoso",
+        for registro in self:
 
-                        f"Usuario: {usuario}\nEstado: ÉXITO\nMensaje: {indicator}\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+            if registro.turno is None:
 
-                        tipo="success"
+                sin_turno += 1
 
-                    )
+                continue
 
-                    return True
+            dias, horas = registro.turno
 
-            # PASO 2: Buscar errores ESPECÍFICOS (solo si no encontramos éxito de alta prioridad)
+            for dia in dias:
 
-            error_especifico_found = False
+                for hora in horas or (None,):
+                    franjas.setdefault((dia, hora), set()).add(registro.tarjeta)
 
-            error_message = ""
+        indice = {'franjas': {k: frozenset(v) for k, v in franjas.items()}, 'sin_turno': sin_turno}
 
-            for indicator in error_indicators_especificos:
+        with self._cache_lock:
 
-                if indicator in page_text:
-                    error_especifico_found = True
+            self._cache_franjas[clave] = (firma, indice)
 
-                    error_message = indicator
+        return indice
 
-                    break
+    def seleccion_franja(self, franja):
 
-            if error_especifico_found:
+        """Tarjetas con turno en la franja (None si el roster no tiene turnos)"""
 
-                logger.error(f"❌ FICHAJE FALLIDO para {usuario}")
+        indice = self.indice_franjas()
 
-                logger.error(f"   Error ESPECÍFICO detectado: '{error_message}'")
+        if not indice['franjas']:
+            return None
 
-                if callback:
-                    callback(f"❌ Error en fichaje para {usuario}")
+        dia, hora = franja
 
-                self.guardar_resultado(usuario, "ERROR", f"Error específico: {error_message}", screenshot_path)
+        return indice['franjas'].get((dia, hora), frozenset()) | indice['franjas'].get((dia, None), frozenset())
 
-                # Enviar notificación de error
+    def buscar(self, tarjeta):
 
-                self.notifier.notify(
+        """Devuelve el registro del usuario con esa tarjeta (o None)"""
 
-                    "Fichaje Fallido",
+        return next((registro for registro in self if registro.tarjeta == tarjeta), None)
 
-                    f"Usuario: {usuario}\nEstado: ERROR\nMensaje: {error_message}\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
 
-                    tipo="error"
+# ==================== DIARIO DE EJECUCIÓN (REANUDACIÓN) ====================
 
-                )
+class DiarioEjecucion:
+    """Diario append-only de una ejecución para poder reanudarla tras una caída"""
 
-                return False
+    # Estados de usuario: en_curso -> fichando -> exito / error / desconocido
 
-            # PASO 3: Buscar indicadores de MEDIA PRIORIDAD
+    ESTADOS_FINALES = ('exito', 'error', 'desconocido', 'omitido')
 
-            for indicator in success_indicators_media_prioridad:
+    # Al reanudar no se repiten: 'fichando' significa que el clic de fichaje pudo llegar al servidor
 
-                if indicator in page_text:
+    ESTADOS_COMPLETADOS = ('exito', 'desconocido', 'fichando')
 
-                    logger.info(f"✅✅✅ FICHAJE EXITOSO para {usuario}")
+    def __init__(self, ruta, run_id, fsync="final"):
 
-                    logger.info(f"   Mensaje detectado (MEDIA PRIORIDAD): '{indicator}'")
+        self.ruta = ruta
 
-                    if callback:
-                        callback(f"✅ Fichaje exitoso para {usuario}")
+        self.run_id = run_id
 
-                    self.guardar_resultado(usuario, "ÉXITO", f"Fichaje completado: {indicator}", screenshot_path)
+        self.fsync = fsync
 
-                    # Enviar notificación de éxito
+        self.info = {}
 
-                    self.notifier.notify(
+        self.estados = {}
 
-                        "Fichaje Exitoso",
+        self.finalizado = False
 
-                        f"Usuario: {usuario}\nEstado: ÉXITO\nMensaje: {indicator}\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+        self._lock = threading.Lock()
 
-                        tipo="success"
+        self._f = None
 
-                    )
+    @staticmethod
+    def ruta_de(directorio, run_id):
 
-                    return True
+        return os.path.join(directorio, f"ejecucion_{run_id}.jsonl")
 
-            # PASO 4: Buscar indicadores de BAJA PRIORIDAD
+    @classmethod
+    def nuevo(cls, directorio, csv_file, total, fsync="final", franja=None):
 
-            for indicator in success_indicators_baja_prioridad:
+        """Crea el diario de una ejecución nueva"""
 
-                if indicator in page_text:
+        os.makedirs(directorio, exist_ok=True)
 
-                    logger.info(f"✅✅✅ FICHAJE EXITOSO para {usuario}")
+        run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.urandom(2).hex()}"
 
-                    logger.info(f"   Mensaje detectado (BAJA PRIORIDAD): '{indicator}'")
+        diario = cls(cls.ruta_de(directorio, run_id), run_id, fsync)
 
-                    if callback:
-                        callback(f"✅ Fichaje exitoso para {usuario}")
+        diario.info = {'tipo': 'inicio', 'run_id': run_id, 'csv': os.path.abspath(csv_file), 'total': total,
 
-                    self.guardar_resultado(usuario, "ÉXITO", f"Fichaje completado: {indicator}", screenshot_path)
+                       'inicio': datetime.now().isoformat(timespec='seconds')}
 
-                    # Enviar notificación de éxito
+        if franja:
+            diario.info['franja'] = list(franja)
 
-                    self.notifier.notify(
+        diario._escribir(diario.info, sincronizar=True)
 
-                        "Fichaje Exitoso",
+        return diario
 
-                        f"Usuario: {usuario}\nEstado: ÉXITO\nMensaje: {indicator}\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+    @classmethod
+    def cargar(cls, ruta, fsync="final"):
 
-                        tipo="success"
+        """Lee un diario existente; una última línea truncada por la caída se ignora"""
 
-                    )
+        diario = cls(ruta, None, fsync)
 
-                    return True
+        with open(ruta, 'r', encoding='utf-8') as f:
 
-            # PASO 5: Si no encontramos nada claro, intentar con el título
+            for linea in f:
 
-            try:
+                try:
 
-                page_title = driver.title.lower()
+                    registro = json.loads(linea)
 
-                if any(word in page_title for word in ["éxito", "correcto", "confirmado", "realizado"]):
+                except ValueError:
 
-                    logger.info(f"✅✅✅ FICHAJE EXITOSO para {usuario} (detectado en título)")
+                    continue
 
-                    if callback:
-                        callback(f"✅ Fichaje exitoso para {usuario}")
+                tipo = registro.get('tipo')
 
-                    self.guardar_resultado(usuario, "ÉXITO", "Fichaje completado (título)", screenshot_path)
+                if tipo == 'inicio':
 
-                    # Enviar notificación de éxito
+                    diario.info = registro
 
-                    self.notifier.notify(
+                    diario.run_id = registro.get('run_id')
 
-                        "Fichaje Exitoso",
+                elif tipo == 'usuario':
 
-                        f"Usuario: {usuario}\nEstado: ÉXITO\nMensaje: Detectado en título de página\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+                    diario.estados[registro['usuario']] = registro['estado']
 
-                        tipo="success"
+                elif tipo == 'fin':
 
-                    )
+                    diario.finalizado = True
 
-                    return True
+        return diario
 
-            except:
+    @classmethod
+    def interrumpidas(cls, directorio):
 
-                pass
+        """Diarios sin registro de fin (de la más antigua a la más reciente)"""
 
-            # PASO 6: Si llegamos aquí, no pudimos determinar el estado
+        if not os.path.isdir(directorio):
+            return []
 
-            logger.warning(f"⚠️ ESTADO DESCONOCIDO para {usuario}")
+        rutas = sorted(
 
-            logger.warning(f"   No se encontraron indicadores claros de éxito o error")
+            (os.path.join(directorio, n) for n in os.listdir(directorio)
 
-            logger.warning(f"   Revisa el screenshot: {screenshot_path}")
+             if n.startswith("ejecucion_") and n.endswith(".jsonl")),
 
-            if callback:
-                callback(f"⚠️ Estado desconocido para {usuario}")
+            key=os.path.getmtime
 
-            self.guardar_resultado(usuario, "DESCONOCIDO", "Estado no determinado - revisar screenshot",
+        )
 
-                                   screenshot_path)
+        diarios = []
 
-            # Enviar notificación de estado desconocido
+        for ruta in rutas:
 
-            self.notifier.notify(
+            try:
 
-                "Estado Desconocido",
+                diario = cls.cargar(ruta)
 
-                f"Usuario: {usuario}\nEstado: DESCONOCIDO\nMensaje: No se pudo determinar el resultado\nRevisa el screenshot: {screenshot_path}\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+            except OSError:
 
-                tipo="warning"
+                continue
 
-            )
+            if not diario.finalizado:
+                diarios.append(diario)
 
-            return None
+        return diarios
 
+    def completado(self, usuario):
 
+        """True si el usuario no debe repetirse al reanudar"""
 
-        except WebDriverException as e:
+        return self.estados.get(usuario) in self.ESTADOS_COMPLETADOS
 
-            logger.error(f"❌ ERROR DE CHROMEDRIVER para {usuario}")
+    def registrar(self, usuario, estado, mensaje=""):
 
-            if callback:
-                callback(f"❌ Error de Chrome para {usuario}")
+        """Añade una transición de estado del usuario"""
 
-            screenshot_path = self.take_screenshot(driver, f"error_{usuario}.png")
+        self.estados[usuario] = estado
 
-            self.guardar_resultado(usuario, "ERROR", "Chrome crash", screenshot_path)
+        registro = {'tipo': 'usuario', 't': datetime.now().isoformat(timespec='seconds'),
 
-            # Enviar notificación de error
+                    'usuario': usuario, 'estado': estado}
 
-            self.notifier.notify(
+        if mensaje:
+            registro['mensaje'] = mensaje[:200]
 
-                "Error de Chrome",
+        self._escribir(registro, sincronizar=estado in self.ESTADOS_FINALES or estado == 'fichando')
 
-                f"Usuario: {usuario}\nEstado: ERROR\nMensaje: Chrome crash\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+    def reanudacion(self):
 
-                tipo="error"
+        self._escribir({'tipo': 'reanudacion', 't': datetime.now().isoformat(timespec='seconds')}, sincronizar=True)
 
-            )
+    def _escribir(self, registro, sincronizar=False):
 
-            return False
+        """Escribe una línea y aplica la política de fsync ('siempre', 'final' o 'nunca')"""
 
-        except Exception as e:
+        with self._lock:
 
-            logger.error(f"❌ ERROR para {usuario}: {e}")
+            if self._f is None:
+                self._f = open(self.ruta, 'a', encoding='utf-8')
 
-            if callback:
-                callback(f"❌ Error: {str(e)[:50]}")
+            self._f.write(json.dumps(registro, ensure_ascii=False) + "\n")
 
-            screenshot_path = self.take_screenshot(driver, f"error_{usuario}.png")
+            self._f.flush()
 
-            self.guardar_resultado(usuario, "ERROR", str(e)[:200], screenshot_path)
+            if self.fsync == "siempre" or (self.fsync == "final" and sincronizar):
+                os.fsync(self._f.fileno())
 
-            # Enviar notificación de error
+    def finalizar(self, resumen):
 
-            self.notifier.notify(
+        """Marca la ejecución como completa y compacta el diario a un registro por usuario"""
 
-                "Error en Fichaje",
+        self._escribir({'tipo': 'fin', 't': datetime.now().isoformat(timespec='seconds'), 'resumen': resumen},
+
+                       sincronizar=True)
+
+        self.finalizado = True
+
+        self.cerrar()
+
+        try:
+
+            self.compactar(resumen)
+
+        except OSError as e:
+
+            logger.error(f"❌ Error compactando el diario {self.ruta}: {e}")
+
+    def compactar(self, resumen):
+
+        temporal = self.ruta + ".tmp"
+
+        with open(temporal, 'w', encoding='utf-8') as f:
+
+            f.write(json.dumps(self.info, ensure_ascii=False) + "\n")
+
+            for usuario, estado in self.estados.items():
+                f.write(json.dumps({'tipo': 'usuario', 'usuario': usuario, 'estado': estado}, ensure_ascii=False) + "\n")
+
+            f.write(json.dumps({'tipo': 'fin', 'resumen': resumen}, ensure_ascii=False) + "\n")
+
+            f.flush()
+
+            os.fsync(f.fileno())
+
+        os.replace(temporal, self.ruta)
+
+    def cerrar(self):
+
+        with self._lock:
+
+            if self._f is not None:
+
+                self._f.close()
+
+                self._f = None
+
+
+# ==================== IDEMPOTENCIA (FICHAJES YA REALIZADOS) ====================
+
+class IndiceFichajes:
+    """Índice usuario -> último fichaje exitoso, alimentado por los CSV de resultados recientes"""
+
+    def __init__(self, config):
+
+        self.config = config
+
+        self._lock = threading.Lock()
+
+        self._ultimo_exito = {}
+
+        self._en_curso = set()
+
+        # Lectura incremental de cada CSV de resultados: ruta -> (bytes leídos, columnas)
+
+        self._leidos = {}
+
+    @property
+    def ventana(self):
+
+        return timedelta(minutes=self.config.get('idempotencia_ventana_min', 0) or 0)
+
+    def _ficheros_recientes(self):
+
+        directorio = os.path.dirname(os.path.abspath(self.config['results_file']))
+
+        limite = time.time() - self.ventana.total_seconds()
+
+        try:
+
+            nombres = os.listdir(directorio)
+
+        except OSError:
+
+            return []
+
+        rutas = []
+
+        for nombre in nombres:
+
+            if not (nombre.startswith("resultados_") and nombre.endswith(".csv")):
+                continue
+
+            ruta = os.path.join(directorio, nombre)
+
+            try:
+
+                if os.path.getmtime(ruta) >= limite:
+                    rutas.append(ruta)
+
+            except OSError:
+
+                pass
+
+        return rutas
+
+    def _refrescar(self):
+
+        """Lee solo lo añadido a cada CSV de resultados desde la última consulta"""
+
+        for ruta in self._ficheros_recientes():
+
+            leidos, columnas = self._leidos.get(ruta, (0, None))
+
+            try:
+
+                with open(ruta, 'rb') as f:
+
+                    f.seek(leidos)
+
+                    nuevo = f.read()
+
+            except OSError:
+
+                continue
+
+            # Solo líneas completas: una fila a medio escribir se vuelve a leer en la siguiente consulta
+
+            nuevo = nuevo[:nuevo.rfind(b"\n") + 1]
+
+            if not nuevo:
+                continue
+
+            reader = csv.reader(io.StringIO(nuevo.decode('utf-8', 'replace')))
+
+            if columnas is None:
+
+                cabecera = next(reader, None) or []
+
+                if not {'fecha_hora', 'usuario', 'estado'} <= set(cabecera):
+                    continue
+
+                columnas = (cabecera.index('fecha_hora'), cabecera.index('usuario'), cabecera.index('estado'))
+
+            i_fecha, i_usuario, i_estado = columnas
+
+            for fila in reader:
+
+                if len(fila) <= max(columnas) or fila[i_estado] != "ÉXITO":
+                    continue
+
+                try:
+
+                    instante = datetime.strptime(fila[i_fecha], "%Y-%m-%d %H:%M:%S")
+
+                except ValueError:
+
+                    continue
+
+                self._anotar(fila[i_usuario].strip(), instante)
+
+            self._leidos[ruta] = (leidos + len(nuevo), columnas)
+
+    def _anotar(self, usuario, instante):
+
+        anterior = self._ultimo_exito.get(usuario)
+
+        if anterior is None or instante > anterior:
+            self._ultimo_exito[usuario] = instante
+
+    def registrar_exito(self, usuario, instante=None):
+
+        with self._lock:
+
+            self._anotar(usuario, instante or datetime.now())
+
+    def reservar(self, usuario):
+
+        """Devuelve el motivo para omitir al usuario, o None y lo marca como en curso"""
+
+        ventana = self.ventana
+
+        with self._lock:
+
+            if usuario in self._en_curso:
+                return "fichaje en curso en otra ejecución"
+
+            if ventana:
+
+                self._refrescar()
+
+                ultimo = self._ultimo_exito.get(usuario)
+
+                if ultimo is not None and datetime.now() - ultimo < ventana:
+                    return f"ya fichó correctamente a las {ultimo.strftime('%H:%M:%S')}"
+
+            self._en_curso.add(usuario)
+
+            return None
+
+    def liberar(self, usuario):
+
+        with self._lock:
+
+            self._en_curso.discard(usuario)
+
+
+# ==================== CONTROL DE TRÁFICO HACIA EL PORTAL ====================
+
+class LimitadorPortal:
+    """Token bucket compartido por todo el tráfico hacia un portal (cargas de página, logins y fichajes)
+
+    Cada petición reserva un token aunque el saldo quede negativo y duerme lo que falta para
+    que se repongan: las peticiones esperan en orden de llegada sin sondear.
+    """
+
+    # Un limitador por servidor, compartido entre motores y ejecuciones concurrentes
+
+    _instancias = {}
+
+    _lock_instancias = threading.Lock()
+
+    @classmethod
+    def para(cls, config):
+
+        clave = urlparse(config['url']).netloc or config['url']
+
+        tasa = config.get('portal_tasa_por_s', 0)
+
+        rafaga = config.get('portal_rafaga', 1)
+
+        with cls._lock_instancias:
+
+            limitador = cls._instancias.get(clave)
+
+            if limitador is None or (limitador.tasa, limitador.rafaga) != (tasa, rafaga):
+
+                limitador = cls(tasa, rafaga)
+
+                cls._instancias[clave] = limitador
+
+        return limitador
+
+    def __init__(self, tasa, rafaga=1):
+
+        self.tasa = tasa
+
+        self.rafaga = rafaga
+
+        self.tokens = float(max(1, rafaga))
+
+        self.actualizado = time.monotonic()
+
+        self._lock = threading.Lock()
+
+    def adquirir(self):
+
+        """Espera a que haya un token; devuelve los segundos de espera en cola"""
+
+        if self.tasa <= 0:
+            return 0.0
+
+        with self._lock:
+
+            ahora = time.monotonic()
+
+            self.tokens = min(max(1, self.rafaga), self.tokens + (ahora - self.actualizado) * self.tasa)
+
+            self.actualizado = ahora
+
+            self.tokens -= 1
+
+            espera = -self.tokens / self.tasa if self.tokens < 0 else 0.0
+
+        if espera > 0:
+            time.sleep(espera)
+
+        return espera
+
+
+class MetricasEspera:
+    """Esperas en cola por tipo de petición (se guardan las últimas max_muestras para el p95)"""
+
+    def __init__(self, max_muestras=10000):
+
+        self.muestras = {}
+
+        self.max_muestras = max_muestras
+
+        self._lock = threading.Lock()
+
+    def registrar(self, tipo, segundos):
+
+        with self._lock:
+
+            muestras = self.muestras.get(tipo)
+
+            if muestras is None:
+                muestras = self.muestras[tipo] = deque(maxlen=self.max_muestras)
+
+            muestras.append(segundos)
+
+    def resumen(self):
+
+        """{tipo: {'n', 'media_ms', 'p95_ms', 'max_ms', 'total_s'}}"""
+
+        with self._lock:
+
+            copia = {tipo: sorted(muestras) for tipo, muestras in self.muestras.items()}
+
+        resumen = {}
+
+        for tipo, valores in copia.items():
+
+            resumen[tipo] = {
+
+                'n': len(valores),
+
+                'media_ms': round(1000 * sum(valores) / len(valores), 1),
+
+                'p95_ms': round(1000 * valores[min(len(valores) - 1, int(len(valores) * 0.95))], 1),
+
+                'max_ms': round(1000 * valores[-1], 1),
+
+                'total_s': round(sum(valores), 2)
+
+            }
+
+        return resumen
+
+
+class ControladorConcurrencia:
+    """Límite de usuarios en paralelo ajustado por AIMD según la latencia del portal y los errores
+
+    Cada 'ventana' resultados se decide: si la mediana de las cargas de página supera el
+    objetivo o la tasa de errores pasa del máximo, el límite se multiplica por 'factor'
+    (bajada rápida); si todo va bien, sube en uno (subida lenta).
+    """
+
+    def __init__(self, minimo=1, maximo=1, inicial=1, latencia_objetivo_s=10.0, error_max=0.25, ventana=3, factor=0.5):
+
+        self.minimo = max(1, minimo)
+
+        self.maximo = max(self.minimo, maximo)
+
+        self._limite = min(self.maximo, max(self.minimo, inicial))
+
+        self.latencia_objetivo_s = latencia_objetivo_s
+
+        self.error_max = error_max
+
+        self.ventana = max(1, ventana)
+
+        self.factor = factor
+
+        self.latencias = []
+
+        self.resultados = []
+
+        self.decisiones = []
+
+        self.pico = self._limite
+
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_config(cls, config):
+
+        return cls(
+
+            config.get('concurrencia_min', 1),
+
+            config.get('concurrencia_max', 1),
+
+            config.get('concurrencia_inicial', 1),
+
+            config.get('concurrencia_latencia_objetivo_s', 10.0),
+
+            config.get('concurrencia_error_max', 0.25),
+
+            config.get('concurrencia_ventana', 3),
+
+            config.get('concurrencia_factor', 0.5)
+
+        )
+
+    @property
+    def limite(self):
+
+        return self._limite
+
+    def observar_latencia(self, segundos):
+
+        with self._lock:
+            self.latencias.append(segundos)
+
+    def observar_resultado(self, error):
+
+        with self._lock:
+
+            self.resultados.append(bool(error))
+
+            if len(self.resultados) >= self.ventana:
+                self._decidir()
+
+    def _decidir(self):
+
+        # Con self._lock adquirido
+
+        latencias = sorted(self.latencias)
+
+        mediana = latencias[len(latencias) // 2] if latencias else None
+
+        tasa_error = sum(self.resultados) / len(self.resultados)
+
+        anterior = self._limite
+
+        if tasa_error > self.error_max:
+
+            motivo = "errores"
+
+        elif mediana is not None and mediana > self.latencia_objetivo_s:
+
+            motivo = "latencia"
+
+        else:
+
+            motivo = None
+
+        if motivo:
+
+            self._limite = max(self.minimo, int(anterior * self.factor))
+
+        else:
+
+            self._limite = min(self.maximo, anterior + 1)
+
+            motivo = "sano"
+
+        self.pico = max(self.pico, self._limite)
+
+        self.decisiones.append({
+
+            'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+
+            'limite_anterior': anterior,
+
+            'limite': self._limite,
+
+            'latencia_mediana_s': round(mediana, 3) if mediana is not None else "",
+
+            'tasa_error': round(tasa_error, 3),
+
+            'muestras': len(self.resultados),
+
+            'motivo': motivo
+
+        })
+
+        if self._limite != anterior:
+
+            flecha = "📈" if self._limite > anterior else "📉"
+
+            texto_latencia = f"{mediana:.2f}s" if mediana is not None else "sin datos"
+
+            logger.info(f"{flecha} Concurrencia {anterior} → {self._limite} ({motivo}: carga mediana {texto_latencia}, errores {tasa_error:.0%})")
+
+        self.latencias = []
+
+        self.resultados = []
+
+    def resumen(self):
+
+        return {'limite_final': self._limite, 'pico': self.pico, 'decisiones': len(self.decisiones)}
+
+    def exportar(self, ruta, run_id):
+
+        """Añade las decisiones de la ejecución a un CSV para poder ajustar los parámetros"""
+
+        if not ruta or not self.decisiones:
+            return
+
+        campos = ['run_id', 'fecha', 'limite_anterior', 'limite', 'latencia_mediana_s', 'tasa_error', 'muestras', 'motivo']
+
+        try:
+
+            nuevo = not os.path.exists(ruta)
+
+            with open(ruta, 'a', newline='', encoding='utf-8') as f:
+
+                writer = csv.DictWriter(f, fieldnames=campos)
+
+                if nuevo:
+                    writer.writeheader()
+
+                for decision in self.decisiones:
+                    writer.writerow(dict(decision, run_id=run_id))
+
+        except OSError as e:
+
+            logger.error(f"❌ Error exportando decisiones de concurrencia: {e}")
+
+
+class GrupoTrabajadores:
+    """Un thread por tarea con un límite de tareas simultáneas que puede cambiar en caliente"""
+
+    def __init__(self, limite):
+
+        self._limite = limite
+
+        self._activos = 0
+
+        self._cond = threading.Condition()
+
+    def lanzar(self, funcion, *args):
+
+        """Espera a que haya hueco bajo el límite actual y lanza la tarea"""
+
+        with self._cond:
+
+            while self._activos >= self._limite():
+                self._cond.wait()
+
+            self._activos += 1
+
+        thread = threading.Thread(target=self._ejecutar, args=(funcion,) + args)
+
+        thread.daemon = True
+
+        thread.start()
+
+    def _ejecutar(self, funcion, *args):
+
+        try:
+
+            funcion(*args)
+
+        except Exception as e:
+
+            logger.error(f"❌ Error en un trabajador: {e}")
+
+        finally:
+
+            with self._cond:
+
+                self._activos -= 1
+
+                self._cond.notify_all()
+
+    def esperar(self):
+
+        with self._cond:
+
+            while self._activos:
+                self._cond.wait()
+
+
+class CircuitoPortal:
+    """Circuit breaker del portal: tras K fallos seguidos de nivel portal deja de lanzar Chrome
+
+    Abierto, rechaza al instante. Pasado circuito_espera_s, una sonda HTTP decide: si el
+    portal responde pasa a semiabierto y deja pasar un usuario de prueba (su resultado
+    cierra o vuelve a abrir el circuito); si no, sigue abierto otro periodo.
+    """
+
+    CERRADO = 'cerrado'
+
+    ABIERTO = 'abierto'
+
+    SEMIABIERTO = 'semiabierto'
+
+    def __init__(self, config):
+
+        self.url = config['url']
+
+        self.umbral = config.get('circuito_fallos', 5)
+
+        self.espera_s = config.get('circuito_espera_s', 60)
+
+        self.timeout_sonda = config.get('circuito_sonda_timeout_s', 5)
+
+        self.estado = self.CERRADO
+
+        self.fallos = 0
+
+        self.reapertura = 0.0
+
+        self.aperturas = 0
+
+        self.rechazados = 0
+
+        self._prueba_en_curso = False
+
+        # La sonda va fuera del lock; mientras dura, el resto de workers ve el circuito abierto
+
+        self._sondeando = False
+
+        self._lock = threading.Lock()
+
+    def sondear(self):
+
+        """Petición HTTP ligera al portal: (responde, detalle)"""
+
+        inicio = time.perf_counter()
+
+        try:
+
+            r = requests.get(self.url, timeout=self.timeout_sonda)
+
+            detalle = f"HTTP {r.status_code} en {(time.perf_counter() - inicio) * 1000:.0f} ms"
+
+            return r.status_code < 500, detalle
+
+        except Exception as e:
+
+            return False, f"{type(e).__name__}: {str(e)[:100]}"
+
+    @property
+    def proxima_sonda(self):
+
+        """Instante (time.monotonic) a partir del cual se volverá a sondear"""
+
+        return self.reapertura
+
+    def abrir(self, causa):
+
+        with self._lock:
+            self._abrir(causa)
+
+    def _abrir(self, causa):
+
+        # Con self._lock adquirido
+
+        self.estado = self.ABIERTO
+
+        self.reapertura = time.monotonic() + self.espera_s
+
+        self.aperturas += 1
+
+        self._prueba_en_curso = False
+
+        logger.warning(f"🔌 Circuito del portal ABIERTO ({causa}) - nueva sonda en {self.espera_s}s")
+
+    def permitir(self):
+
+        """Indica si se puede lanzar Chrome para el siguiente usuario"""
+
+        with self._lock:
+
+            if self.estado == self.CERRADO:
+                return True
+
+            if self.estado == self.SEMIABIERTO:
+
+                # Solo un usuario de prueba a la vez
+
+                if self._prueba_en_curso:
+
+                    self.rechazados += 1
+
+                    return False
+
+                self._prueba_en_curso = True
+
+                return True
+
+            if time.monotonic() < self.reapertura or self._sondeando:
+
+                self.rechazados += 1
+
+                return False
+
+            self._sondeando = True
+
+        # sondear() no lanza excepciones: el resultado se anota siempre
+
+        ok, detalle = self.sondear()
+
+        with self._lock:
+
+            self._sondeando = False
+
+            if not ok:
+
+                self.reapertura = time.monotonic() + self.espera_s
+
+                self.rechazados += 1
+
+                logger.info(f"🔌 Sonda del portal fallida ({detalle}) - sigue abierto")
+
+                return False
+
+            self.estado = self.SEMIABIERTO
+
+            self._prueba_en_curso = True
+
+            logger.info(f"🔌 Portal responde ({detalle}) - circuito semiabierto, se prueba con un usuario")
+
+            return True
+
+    def registrar(self, motivo):
+
+        """Anota el resultado de un usuario (motivo de fallo o None si el portal respondió)"""
+
+        with self._lock:
+
+            if motivo in MOTIVOS_PORTAL_CAIDO:
+
+                self.fallos += 1
+
+                if self.estado == self.SEMIABIERTO:
+
+                    self._abrir("falló el usuario de prueba")
+
+                elif self.estado == self.CERRADO and self.fallos >= self.umbral:
+
+                    self._abrir(f"{self.fallos} fallos seguidos del portal")
+
+                return
+
+            self.fallos = 0
+
+            if self.estado == self.SEMIABIERTO:
+
+                self.estado = self.CERRADO
+
+                self._prueba_en_curso = False
+
+                logger.info("🔌 Circuito del portal CERRADO: el portal vuelve a responder")
+
+    def resumen(self):
+
+        return {'estado': self.estado, 'aperturas': self.aperturas, 'rechazados': self.rechazados}
+
+
+# ==================== PERFIL DE ARRANQUE DE CHROME ====================
+
+# Perfil 'lite': sin servicios en segundo plano que no hacen falta para fichar
+
+CHROME_FLAGS_LITE = (
+
+    "--disable-background-networking",
+
+    "--disable-component-update",
+
+    "--disable-sync",
+
+    "--disable-translate",
+
+    "--disable-default-apps",
+
+    "--disable-client-side-phishing-detection",
+
+    "--disable-domain-reliability",
+
+    "--disable-breakpad",
+
+    "--disable-hang-monitor",
+
+    "--disable-prompt-on-repost",
+
+    "--disable-features=Translate,OptimizationHints,MediaRouter,AutofillServerCommunication,InterestFeedContentSuggestions",
+
+    "--no-first-run",
+
+    "--no-default-browser-check",
+
+    "--metrics-recording-only",
+
+    "--password-store=basic",
+
+    "--use-mock-keychain",
+
+    "--mute-audio",
+
+    "--window-size=1200,900"
+
+)
+
+# Preferencias sembradas en la plantilla del user-data-dir
+
+PREFERENCIAS_LITE = {
+
+    "profile": {
+
+        "default_content_setting_values": {"notifications": 2, "geolocation": 2, "media_stream": 2},
+
+        "password_manager_enabled": False
+
+    },
+
+    "credentials_enable_service": False,
+
+    "translate": {"enabled": False},
+
+    "autofill": {"profile_enabled": False, "credit_card_enabled": False},
+
+    "browser": {"check_default_browser": False},
+
+    "download": {"prompt_for_download": False}
+
+}
+
+
+def preparar_plantilla_chrome(directorio):
+    """Crea (una sola vez) el user-data-dir mínimo que se copia para cada Chrome del perfil 'lite'"""
+
+    preferencias = os.path.join(directorio, "Default", "Preferences")
+
+    if os.path.exists(preferencias):
+        return directorio
+
+    os.makedirs(os.path.dirname(preferencias), exist_ok=True)
+
+    # 'First Run' evita el asistente de primer arranque
+
+    Path(directorio, "First Run").touch()
+
+    with open(os.path.join(directorio, "Local State"), 'w', encoding='utf-8') as f:
+        json.dump({"browser": {"enabled_labs_experiments": []}}, f)
+
+    temporal = preferencias + ".tmp"
+
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(PREFERENCIAS_LITE, f)
+
+    os.replace(temporal, preferencias)
+
+    return directorio
+
+
+# ==================== BLOQUEO DE RECURSOS DE RED ====================
+
+# Tipo de recurso -> patrones de URL (comodín * de DevTools) que lo bloquean
+
+PATRONES_TIPO_RECURSO = {
+
+    'Image': ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.bmp", "*.ico", "*.svg", "*.webp"],
+
+    'Stylesheet': ["*.css"],
+
+    'Font': ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"],
+
+    'Media': ["*.mp3", "*.mp4", "*.webm", "*.ogg", "*.wav"]
+
+}
+
+def patron_a_regex(patron):
+    """Comodines de DevTools (* = cualquier cosa) -> expresión regular compilada"""
+
+    return re.compile(".*".join(re.escape(parte) for parte in patron.split("*")) + "$", re.IGNORECASE)
+
+
+def patron_a_urlpattern(patron):
+    """Comodín de DevTools sobre la ruta (*captcha*) -> URLPattern absoluto (*://*:*/*captcha*)"""
+
+    if "://" in patron:
+        return patron
+
+    ruta = re.sub(r"([:(){}?+\\])", r"\\\1", patron.lstrip("/"))
+
+    return "*://*:*/" + (ruta if ruta.startswith("*") else "*" + ruta)
+
+
+class BloqueoRed:
+    """Bloquea imágenes, estilos y fuentes que la automatización no usa y contabiliza lo ahorrado
+
+    Las reglas de denegación salen de bloqueo_tipos y bloqueo_denegar (se descarta la que
+    bloquearía la propia URL del portal). Las de bloqueo_permitir van delante como patrones
+    ordenados con block=False, que Chrome evalúa antes que las de denegación; un Chrome que
+    no los admite aplica solo las de denegación, y si alguna bloquea un recurso permitido se
+    retira para las sesiones siguientes. Los recuentos salen del log de rendimiento de Chrome;
+    el ahorro en bytes se estima con el tamaño visto de cada URL cuando se descargó sin bloqueo.
+    """
+
+    # Tamaño conocido de cada URL y reglas retiradas por bloquear algo imprescindible (por proceso)
+
+    _tamanos = {}
+
+    _retirados = set()
+
+    _lock_clase = threading.Lock()
+
+    def __init__(self, config):
+
+        self.activo = bool(config.get('bloqueo_red'))
+
+        self.permitir_patrones = list(config.get('bloqueo_permitir', []))
+
+        self.permitir = [patron_a_regex(p) for p in self.permitir_patrones]
+
+        self.portal = config['url']
+
+        patrones = []
+
+        for tipo in config.get('bloqueo_tipos', []):
+            patrones.extend(PATRONES_TIPO_RECURSO.get(tipo, []))
+
+        patrones.extend(config.get('bloqueo_denegar', []))
+
+        self.patrones = [p for p in dict.fromkeys(patrones) if self._regla_segura(p)]
+
+        self.stats = {'bloqueadas': 0, 'permitidas': 0, 'bytes_descargados': 0, 'bytes_ahorrados': 0, 'sin_tamano': 0}
+
+        self._lock = threading.Lock()
+
+    def _regla_segura(self, patron):
+
+        return not patron_a_regex(patron).match(self.portal)
+
+    def _imprescindible(self, url):
+
+        return any(regex.match(url) for regex in self.permitir)
+
+    def preparar_opciones(self, options):
+
+        """Activa el log de rendimiento, del que salen los recuentos"""
+
+        if self.activo:
+            options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+    def aplicar(self, driver):
+
+        """Instala las reglas de bloqueo en la sesión de DevTools del driver"""
+
+        if not self.activo:
+            return
+
+        with self._lock_clase:
+            patrones = [p for p in self.patrones if p not in self._retirados]
+
+        try:
+
+            driver.execute_cdp_cmd("Network.enable", {})
+
+            permitidos = [{"urlPattern": patron_a_urlpattern(p), "block": False} for p in self.permitir_patrones]
+
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patrones, "urlPatterns": permitidos})
+
+        except Exception as e:
+
+            logger.warning(f"⚠️ No se pudo activar el bloqueo de red: {e}")
+
+    def contabilizar(self, driver):
+
+        """Lee el log de rendimiento del driver y acumula peticiones bloqueadas, permitidas y bytes"""
+
+        if not self.activo:
+            return
+
+        try:
+
+            entradas = driver.get_log("performance")
+
+        except Exception:
+
+            return
+
+        urls = {}
+
+        bloqueadas = []
+
+        descargadas = []
+
+        for entrada in entradas:
+
+            try:
+
+                mensaje = json.loads(entrada["message"])["message"]
+
+            except (KeyError, ValueError):
+
+                continue
+
+            metodo = mensaje.get("method")
+
+            params = mensaje.get("params", {})
+
+            if metodo == "Network.requestWillBeSent":
+
+                urls[params.get("requestId")] = params.get("request", {}).get("url", "")
+
+            elif metodo == "Network.loadingFailed" and params.get("blockedReason"):
+
+                bloqueadas.append(urls.get(params.get("requestId"), ""))
+
+            elif metodo == "Network.loadingFinished":
+
+                descargadas.append((urls.get(params.get("requestId"), ""), int(params.get("encodedDataLength", 0))))
+
+        with self._lock_clase:
+
+            for url, tamano in descargadas:
+                self._tamanos[url.split("?")[0]] = tamano
+
+            ahorrados = [self._tamanos.get(url.split("?")[0]) for url in bloqueadas]
+
+            # Si algo imprescindible se bloqueó, se retiran las reglas culpables para las siguientes sesiones
+
+            for url in bloqueadas:
+
+                if self._imprescindible(url):
+
+                    culpables = [p for p in self.patrones if patron_a_regex(p).match(url)]
+
+                    self._retirados.update(culpables)
+
+                    logger.warning(f"⚠️ Se bloqueó un recurso imprescindible ({url}) - reglas retiradas: {', '.join(culpables)}")
+
+        with self._lock:
+
+            self.stats['bloqueadas'] += len(bloqueadas)
+
+            self.stats['permitidas'] += len(descargadas)
+
+            self.stats['bytes_descargados'] += sum(tamano for _, tamano in descargadas)
+
+            self.stats['bytes_ahorrados'] += sum(t for t in ahorrados if t)
+
+            self.stats['sin_tamano'] += sum(1 for t in ahorrados if not t)
+
+    def reiniciar(self):
+
+        with self._lock:
+            self.stats = dict.fromkeys(self.stats, 0)
+
+    def resumen(self):
+
+        with self._lock:
+            return dict(self.stats)
+
+
+# ==================== NAVEGACIÓN DIRECTA A LOS FRAMES ====================
+
+class CacheFrames:
+    """URL del documento de login (el frame principal_wcronos), descubierta y cacheada en disco
+
+    Se descubre en una sesión normal por el frameset y, mientras no caduque, las siguientes
+    sesiones cargan ese documento como página principal. Si al cargarlo no aparece el
+    formulario de login la entrada se invalida y se vuelve al frameset.
+    """
+
+    def __init__(self, config):
+
+        self.ruta = config['frames_cache_file']
+
+        self.portal = config['url']
+
+        self.ttl_s = config.get('frames_cache_ttl_h', 24) * 3600
+
+        self._lock = threading.Lock()
+
+        self._entrada = self._cargar()
+
+    def _cargar(self):
+
+        try:
+
+            if os.path.exists(self.ruta):
+                with open(self.ruta, 'r', encoding='utf-8') as f:
+                    return json.load(f).get(self.portal)
+
+        except (OSError, ValueError) as e:
+
+            logger.error(f"❌ Error cargando {self.ruta}: {e}")
+
+        return None
+
+    def url_login(self):
+
+        """URL cacheada del documento de login, o None si no hay o ha caducado"""
+
+        with self._lock:
+
+            entrada = self._entrada
+
+        if not entrada or time.time() - entrada.get('descubierta', 0) > self.ttl_s:
+            return None
+
+        return entrada.get('login')
+
+    def validar(self, driver):
+
+        """Comprueba que la página cargada es el formulario de login y no un frameset u otra página"""
+
+        try:
+
+            return bool(driver.find_elements(By.ID, "USUARIO")) and not driver.find_elements(By.TAG_NAME, "frameset")
+
+        except Exception:
+
+            return False
+
+    def guardar(self, url_login):
+
+        if not url_login or not url_login.startswith("http"):
+            return
+
+        with self._lock:
+
+            if self._entrada and self._entrada.get('login') == url_login and \
+                    time.time() - self._entrada.get('descubierta', 0) <= self.ttl_s:
+                return
+
+            self._entrada = {'login': url_login, 'descubierta': time.time()}
+
+            self._escribir(self._entrada)
+
+        logger.info(f"🧭 Documento de login descubierto: {url_login}")
+
+    def invalidar(self):
+
+        with self._lock:
+
+            self._entrada = None
+
+            self._escribir(None)
+
+    def _escribir(self, entrada):
+
+        try:
+
+            datos = {}
+
+            if os.path.exists(self.ruta):
+                with open(self.ruta, 'r', encoding='utf-8') as f:
+                    datos = json.load(f)
+
+        except (OSError, ValueError):
+
+            datos = {}
+
+        if entrada is None:
+            datos.pop(self.portal, None)
+
+        else:
+            datos[self.portal] = entrada
+
+        try:
+
+            temporal = self.ruta + ".tmp"
+
+            with open(temporal, 'w', encoding='utf-8') as f:
+
+                json.dump(datos, f, indent=4)
+
+            os.replace(temporal, self.ruta)
+
+        except OSError as e:
+
+            logger.error(f"❌ Error guardando {self.ruta}: {e}")
+
+
+# ==================== RELLENO DEL FORMULARIO DE LOGIN ====================
+
+# Rellena los tres campos, lanza input/change y pulsa ENTRAR en una sola llamada. Devuelve
+# 'enviado', 'teclas' (la página necesita pulsaciones reales), 'sin_campos' o 'sin_boton'.
+# El clic va en un setTimeout para que la navegación no corte la respuesta del script.
+
+SCRIPT_RELLENAR_LOGIN = """
+const valores = {USUARIO: arguments[0], CONTRASENA: arguments[1], codigo_captcha: arguments[2]};
+const campos = Object.entries(valores).map(([n, v]) => [document.getElementById(n) || document.getElementsByName(n)[0], v]);
+if (campos.some(([c]) => !c)) return 'sin_campos';
+if (campos.some(([c]) => c.onkeydown || c.onkeypress || c.onkeyup)) return 'teclas';
+campos.forEach(([c, v]) => {
+    c.focus();
+    c.value = v;
+    c.dispatchEvent(new Event('input', {bubbles: true}));
+    c.dispatchEvent(new Event('change', {bubbles: true}));
+});
+if (campos.some(([c, v]) => c.value !== v)) return 'teclas';
+const boton = Array.from(document.querySelectorAll("button, input[type='submit']"))
+    .find(b => ((b.textContent || '') + ' ' + (b.value || '')).toLowerCase().includes('entrar'));
+if (!boton) return 'sin_boton';
+setTimeout(() => boton.click(), 0);
+return 'enviado';
+"""
+
+
+class MetricasFormulario:
+    """Llamadas al driver (round trips) por login, separadas por modo de relleno"""
+
+    def __init__(self):
+
+        self.muestras = {}
+
+        self._lock = threading.Lock()
+
+    def registrar(self, modo, comandos):
+
+        with self._lock:
+            self.muestras.setdefault(modo, []).append(comandos)
+
+    def resumen(self):
+
+        """{modo: {'logins', 'media', 'max'}}"""
+
+        with self._lock:
+            copia = {modo: list(valores) for modo, valores in self.muestras.items()}
+
+        return {
+
+            modo: {'logins': len(valores), 'media': round(sum(valores) / len(valores), 1), 'max': max(valores)}
+
+            for modo, valores in copia.items()
+
+        }
+
+
+# ==================== CACHÉ DE SELECTORES ====================
+
+class CacheSelectores:
+    """Orden aprendido de las estrategias de localización de cada página, guardado entre ejecuciones
+
+    La estrategia que resuelve el elemento pasa a la cabeza de la lista y la que falla
+    'degradar_fallos' veces seguidas baja al final, de modo que la mayoría de las sesiones
+    resuelven el botón con una sola búsqueda. Solo cuentan como fallo de la estrategia los
+    errores de localización (elemento inexistente, obsoleto o no pulsable); los del driver o
+    la sesión se propagan sin anotar nada.
+    """
+
+    def __init__(self, ruta, degradar_fallos=2):
+
+        self.ruta = ruta
+
+        self.degradar_fallos = max(1, degradar_fallos)
+
+        self._lock = threading.Lock()
+
+        self.paginas = self._cargar()
+
+    def _cargar(self):
+
+        try:
+
+            if os.path.exists(self.ruta):
+                with open(self.ruta, 'r', encoding='utf-8') as f:
+                    return json.load(f).get("paginas", {})
+
+        except (OSError, ValueError) as e:
+
+            logger.error(f"❌ Error cargando {self.ruta}: {e}")
+
+        return {}
+
+    def orden(self, pagina, nombres):
+
+        """Estrategias en el orden aprendido; las que aún no se conocen van al final en su orden original"""
+
+        with self._lock:
+            aprendido = self.paginas.get(pagina, {}).get('orden', [])
+
+        return [n for n in aprendido if n in nombres] + [n for n in nombres if n not in aprendido]
+
+    def resolver(self, pagina, estrategias):
+
+        """Prueba las estrategias ({nombre: función que devuelve True si funcionó}) y devuelve la ganadora o None"""
+
+        from selenium.common.exceptions import (NoSuchElementException, StaleElementReferenceException,
+                                                ElementNotInteractableException, ElementClickInterceptedException,
+                                                InvalidSelectorException, JavascriptException)
+
+        errores_localizacion = (NoSuchElementException, StaleElementReferenceException, ElementNotInteractableException,
+                                ElementClickInterceptedException, InvalidSelectorException, JavascriptException)
+
+        for nombre in self.orden(pagina, list(estrategias)):
+
+            try:
+
+                funciono = bool(estrategias[nombre]())
+
+            except errores_localizacion as e:
+
+                logger.debug(f"Estrategia {pagina}/{nombre} falló: {e}")
+
+                funciono = False
+
+            self._anotar(pagina, nombre, list(estrategias), funciono)
+
+            if funciono:
+                return nombre
+
+        return None
+
+    def _anotar(self, pagina, nombre, nombres, funciono):
+
+        with self._lock:
+
+            estado = self.paginas.setdefault(pagina, {'orden': list(nombres), 'fallos': {}})
+
+            antes = json.dumps(estado, sort_keys=True)
+
+            orden = [n for n in estado['orden'] if n in nombres] + [n for n in nombres if n not in estado['orden']]
+
+            fallos = estado['fallos']
+
+            if funciono:
+
+                fallos[nombre] = 0
+
+                if orden[0] != nombre:
+
+                    orden.remove(nombre)
+
+                    orden.insert(0, nombre)
+
+                    logger.info(f"🎯 {pagina}: la estrategia '{nombre}' pasa a ser la primera")
+
+            else:
+
+                fallos[nombre] = fallos.get(nombre, 0) + 1
+
+                if fallos[nombre] >= self.degradar_fallos and orden[-1] != nombre:
+
+                    orden.remove(nombre)
+
+                    orden.append(nombre)
+
+                    fallos[nombre] = 0
+
+                    logger.info(f"🎯 {pagina}: la estrategia '{nombre}' baja al final tras fallar")
+
+            estado['orden'] = orden
+
+            # Solo se escribe cuando cambia algo: con la ganadora ya en cabeza no hay E/S
+
+            if json.dumps(estado, sort_keys=True) != antes or not os.path.exists(self.ruta):
+                self._escribir()
+
+    def _escribir(self):
+
+        try:
+
+            temporal = self.ruta + ".tmp"
+
+            with open(temporal, 'w', encoding='utf-8') as f:
+
+                json.dump({"paginas": self.paginas}, f, indent=4)
+
+            os.replace(temporal, self.ruta)
+
+        except OSError as e:
+
+            logger.error(f"❌ Error guardando {self.ruta}: {e}")
+
+
+# ==================== CACHÉ DE SESIONES ====================
+
+# Comprobación barata de sesión válida: estamos en Punto de Fichaje y no en el login
+
+SCRIPT_EN_PUNTO_FICHAJE = """
+if (document.getElementById('USUARIO')) return false;
+return !!document.getElementById('btnEnviarForm') ||
+    Array.from(document.querySelectorAll('button')).some(b => /realizar fichaje|fichar/i.test(b.textContent));
+"""
+
+# Reenvía por POST (como hace el botón del menú) a la página de Punto de Fichaje
+
+SCRIPT_POST_PUNTO_FICHAJE = """
+const form = document.createElement('form');
+form.method = 'post';
+form.action = arguments[0];
+document.body.appendChild(form);
+setTimeout(() => form.submit(), 0);
+"""
+
+
+class CacheSesiones:
+    """Cookies de la sesión del portal por usuario, cifradas en disco con Fernet
+
+    Tras un login completo se guardan las cookies y la URL de Punto de Fichaje; en el
+    siguiente fichaje del mismo usuario (p. ej. la salida) se restauran y, si la página
+    sigue mostrando el botón de fichar, se ahorran el login y el captcha. La entrada caduca
+    con la primera cookie que expire o a los sesiones_ttl_min minutos de guardarse.
+    """
+
+    # Margen para no usar una sesión que caducaría durante el propio fichaje
+
+    MARGEN_S = 60
+
+    def __init__(self, ruta, fernet, ttl_s):
+
+        self.ruta = ruta
+
+        self._fernet = fernet
+
+        self.ttl_s = ttl_s
+
+        self._lock = threading.Lock()
+
+        self.datos = self._cargar()
+
+        self.reiniciar()
+
+    @classmethod
+    def desde_config(cls, config):
+
+        """Crea la caché si está activada y 'cryptography' está instalado; si no, devuelve None"""
+
+        if not config.get('sesiones_cache'):
+            return None
+
+        try:
+
+            from cryptography.fernet import Fernet
+
+        except ImportError:
+
+            logger.warning("⚠️ Caché de sesiones desactivada: falta el paquete 'cryptography' (pip install cryptography)")
+
+            return None
+
+        try:
+
+            fernet = Fernet(cls._clave(config['sesiones_clave_file']))
+
+        except (OSError, ValueError) as e:
+
+            logger.error(f"❌ Caché de sesiones desactivada: clave no válida ({e})")
+
+            return None
+
+        return cls(config['sesiones_cache_file'], fernet, config.get('sesiones_ttl_min', 30) * 60)
+
+    @staticmethod
+    def _clave(ruta):
+
+        """Clave de FICHAJE_CLAVE_SESIONES o del fichero de clave (se genera con permisos 600 si no existe)"""
+
+        from cryptography.fernet import Fernet
+
+        clave = os.environ.get("FICHAJE_CLAVE_SESIONES")
+
+        if clave:
+            return clave.encode()
+
+        if not os.path.exists(ruta):
+
+            descriptor = os.open(ruta, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(Fernet.generate_key())
+
+        with open(ruta, 'rb') as f:
+            return f.read().strip()
+
+    def _cargar(self):
+
+        from cryptography.fernet import InvalidToken
+
+        try:
+
+            if os.path.exists(self.ruta):
+                with open(self.ruta, 'rb') as f:
+                    return json.loads(self._fernet.decrypt(f.read()))
+
+        except InvalidToken:
+
+            logger.warning(f"⚠️ {self.ruta} no se puede descifrar con la clave actual - se empieza de cero")
+
+        except (OSError, ValueError) as e:
+
+            logger.error(f"❌ Error cargando {self.ruta}: {e}")
+
+        return {'usuarios': {}}
+
+    def _escribir(self):
+
+        try:
+
+            temporal = self.ruta + ".tmp"
+
+            with open(temporal, 'wb') as f:
+
+                f.write(self._fernet.encrypt(json.dumps(self.datos).encode()))
+
+            os.replace(temporal, self.ruta)
+
+        except OSError as e:
+
+            logger.error(f"❌ Error guardando {self.ruta}: {e}")
+
+    def obtener(self, usuario):
+
+        """Entrada vigente del usuario ({'cookies', 'url', 'expira'}) o None"""
+
+        with self._lock:
+
+            self.stats['consultas'] += 1
+
+            entrada = self.datos['usuarios'].get(usuario)
+
+            if entrada and entrada['expira'] < time.time() + self.MARGEN_S:
+
+                del self.datos['usuarios'][usuario]
+
+                self._escribir()
+
+                self.stats['caducadas'] += 1
+
+                return None
+
+            return entrada
+
+    def guardar(self, usuario, cookies, url, segundos_login):
+
+        expira = time.time() + self.ttl_s
+
+        for cookie in cookies:
+
+            if cookie.get('expiry'):
+                expira = min(expira, cookie['expiry'])
+
+        with self._lock:
+
+            self.datos['usuarios'][usuario] = {'cookies': cookies, 'url': url, 'expira': expira}
+
+            # Media móvil de lo que cuesta un login completo, para estimar el tiempo ahorrado
+
+            previo = self.datos.get('login_medio_s')
+
+            self.datos['login_medio_s'] = segundos_login if previo is None else 0.8 * previo + 0.2 * segundos_login
+
+            self.stats['logins'] += 1
+
+            self._escribir()
+
+    def invalidar(self, usuario):
+
+        with self._lock:
+
+            if self.datos['usuarios'].pop(usuario, None) is not None:
+                self._escribir()
+
+    def registrar_restauracion(self, restaurada, segundos):
+
+        with self._lock:
+
+            self.stats['intentos'] += 1
+
+            if restaurada:
+
+                self.stats['restauradas'] += 1
+
+                self.stats['segundos_restauracion'] += segundos
+
+    def reiniciar(self):
+
+        with self._lock:
+            self.stats = {'consultas': 0, 'intentos': 0, 'restauradas': 0, 'caducadas': 0, 'logins': 0, 'segundos_restauracion': 0.0}
+
+    def resumen(self):
+
+        with self._lock:
+
+            stats = dict(self.stats)
+
+            login_medio = self.datos.get('login_medio_s') or 0.0
+
+        stats['tasa_acierto'] = round(stats['restauradas'] / stats['consultas'], 3) if stats['consultas'] else 0.0
+
+        stats['segundos_ahorrados'] = round(max(0.0, stats['restauradas'] * login_medio - stats['segundos_restauracion']), 1)
+
+        stats['segundos_restauracion'] = round(stats['segundos_restauracion'], 1)
+
+        return stats
+
+
+# ==================== RELOJ DEL PORTAL ====================
+
+class RelojPortal:
+    """Desfase (y deriva) del reloj local respecto al del servidor del portal
+
+    Cada muestra HTTP acota el desfase: la cabecera Date (resolución de 1 s) se generó entre
+    el envío y la respuesta, así que desfase ∈ [Date - t_respuesta, Date + 1 - t_envío]. Las
+    muestras se reparten dentro del segundo y se intersecan sus intervalos; el centro es la
+    estimación y la mitad del ancho el error máximo. La deriva sale de la recta de las
+    calibraciones guardadas (reloj_file) que abarcan al menos una hora.
+    """
+
+    MAX_HISTORIAL = 20
+
+    # Intervalo mínimo entre calibraciones del historial para estimar deriva
+
+    SPAN_DERIVA_S = 3600
+
+    def __init__(self, config):
+
+        self.activo = bool(config.get('reloj_calibrar'))
+
+        self.url = config['url']
+
+        self.muestras = max(1, config.get('reloj_muestras', 5))
+
+        self.recalibrar_s = config.get('reloj_recalibrar_min', 60) * 60
+
+        self.timeout = config.get('circuito_sonda_timeout_s', 5)
+
+        self.ruta = config.get('reloj_file')
+
+        self.desfase = 0.0
+
+        self.error = None
+
+        self.deriva = 0.0
+
+        self.calibrado = None
+
+        self.on_calibrado = None
+
+        self._lock = threading.Lock()
+
+        self._lock_calibracion = threading.Lock()
+
+        self.historial = self._cargar()
+
+        if self.historial:
+
+            self.calibrado, self.desfase, self.error = self.historial[-1]
+
+            self._estimar_deriva()
+
+    def _cargar(self):
+
+        try:
+
+            if self.ruta and os.path.exists(self.ruta):
+                with open(self.ruta, 'r', encoding='utf-8') as f:
+                    return [tuple(c) for c in json.load(f).get(self.url, [])]
+
+        except (OSError, ValueError) as e:
+
+            logger.error(f"❌ Error cargando {self.ruta}: {e}")
+
+        return []
+
+    def _guardar(self):
+
+        if not self.ruta:
+            return
+
+        try:
+
+            datos = {}
+
+            if os.path.exists(self.ruta):
+                with open(self.ruta, 'r', encoding='utf-8') as f:
+                    datos = json.load(f)
+
+            datos[self.url] = self.historial
+
+            temporal = self.ruta + ".tmp"
+
+            with open(temporal, 'w', encoding='utf-8') as f:
+
+                json.dump(datos, f, indent=4)
+
+            os.replace(temporal, self.ruta)
+
+        except (OSError, ValueError) as e:
+
+            logger.error(f"❌ Error guardando {self.ruta}: {e}")
+
+    def desfase_en(self, instante):
+
+        """(desfase, error) estimados en un instante local, aplicando la deriva desde la calibración"""
+
+        with self._lock:
+
+            if self.calibrado is None:
+                return 0.0, None
+
+            transcurrido = max(0.0, instante - self.calibrado)
+
+            return self.desfase + self.deriva * transcurrido, self.error
+
+    def ahora(self):
+
+        """Hora actual del servidor del portal (epoch) según la última calibración"""
+
+        instante = time.time()
+
+        if not self.activo:
+            return instante
+
+        return instante + self.desfase_en(instante)[0]
+
+    def toca_calibrar(self):
+
+        return self.activo and (self.calibrado is None or time.time() - self.calibrado >= self.recalibrar_s)
+
+    def calibrar_si_toca(self):
+
+        if self.toca_calibrar():
+            self.calibrar()
+
+    def _muestra(self, sesion):
+
+        from email.utils import parsedate_to_datetime
+
+        t_envio = time.time()
+
+        r = sesion.get(self.url, timeout=self.timeout, stream=True)
+
+        t_respuesta = time.time()
+
+        r.close()
+
+        fecha = r.headers.get("Date")
+
+        if not fecha:
+            raise ValueError("el portal no envía cabecera Date")
+
+        servidor = parsedate_to_datetime(fecha).timestamp()
+
+        return servidor - t_respuesta, servidor + 1 - t_envio
+
+    def calibrar(self):
+
+        """Toma las muestras y actualiza la estimación; devuelve True si se pudo calibrar"""
+
+        if not self._lock_calibracion.acquire(blocking=False):
+            return False
+
+        try:
+
+            intervalos = []
+
+            sesion = requests.Session()
+
+            try:
+
+                for i in range(self.muestras):
+
+                    # Cada muestra en una fase distinta del segundo para cazar el cambio de Date
+
+                    if i:
+                        time.sleep(1 + 1 / self.muestras)
+
+                    try:
+
+                        intervalos.append(self._muestra(sesion))
+
+                    except Exception as e:
+
+                        logger.debug(f"Muestra de reloj fallida: {e}")
+
+            finally:
+
+                sesion.close()
+
+            if not intervalos:
+
+                logger.warning(f"⚠️ No se pudo calibrar el reloj con {self.url}")
+
+                return False
+
+            bajo = max(i[0] for i in intervalos)
+
+            alto = min(i[1] for i in intervalos)
+
+            if bajo > alto:
+
+                # Intervalos incompatibles (el reloj del servidor saltó): el más estrecho
+
+                bajo, alto = min(intervalos, key=lambda i: i[1] - i[0])
+
+            with self._lock:
+
+                self.calibrado = time.time()
+
+                self.desfase = (bajo + alto) / 2
+
+                self.error = (alto - bajo) / 2
+
+                self.historial = (self.historial + [(self.calibrado, self.desfase, self.error)])[-self.MAX_HISTORIAL:]
+
+                self._estimar_deriva()
+
+            self._guardar()
+
+            logger.info(f"🕰 {self.texto()}")
+
+            if abs(self.desfase) > 60:
+                logger.warning(f"⚠️ El reloj local difiere {self.desfase:+.0f}s del portal - revisar la sincronización (NTP)")
+
+            if self.on_calibrado:
+                self.on_calibrado(self)
+
+            return True
+
+        finally:
+
+            self._lock_calibracion.release()
+
+    def _estimar_deriva(self):
+
+        # Con self._lock adquirido (o durante __init__)
+
+        puntos = [(t, d) for t, d, e in self.historial if e is not None and e <= 0.5]
+
+        if len(puntos) < 2 or puntos[-1][0] - puntos[0][0] < self.SPAN_DERIVA_S:
+
+            self.deriva = 0.0
+
+            return
+
+        media_t = sum(t for t, _ in puntos) / len(puntos)
+
+        media_d = sum(d for _, d in puntos) / len(puntos)
+
+        varianza = sum((t - media_t) ** 2 for t, _ in puntos)
+
+        self.deriva = sum((t - media_t) * (d - media_d) for t, d in puntos) / varianza
+
+    def resumen(self):
+
+        with self._lock:
+
+            if self.calibrado is None:
+                return None
+
+            return {
+
+                'desfase_s': round(self.desfase, 3),
+
+                'error_s': round(self.error, 3),
+
+                'deriva_s_h': round(self.deriva * 3600, 3),
+
+                'calibrado': datetime.fromtimestamp(self.calibrado).isoformat(timespec='seconds')
+
+            }
+
+    def texto(self):
+
+        r = self.resumen()
+
+        if not r:
+            return "Reloj del portal: sin calibrar"
+
+        return (f"Reloj del portal: {r['desfase_s']:+.2f}s ±{r['error_s']:.2f}s, deriva {r['deriva_s_h']:+.2f}s/h "
+                f"(calibrado {r['calibrado'][11:]})")
+
+
+# ==================== VIGILANCIA DEL DRIVER ====================
+
+class DriverColgadoError(Exception):
+    """Un comando de WebDriver superó su plazo y se mató el navegador"""
+
+
+def descendientes(pid):
+    """PIDs de todos los descendientes de un proceso (psutil si está instalado; si no, /proc)"""
+
+    try:
+
+        import psutil
+
+        return [p.pid for p in psutil.Process(pid).children(recursive=True)]
+
+    except ImportError:
+
+        pass
+
+    except Exception:
+
+        return []
+
+    hijos = {}
+
+    try:
+
+        for entrada in os.listdir("/proc"):
+
+            if entrada.isdigit():
+
+                try:
+
+                    with open(f"/proc/{entrada}/stat", 'r') as f:
+
+                        # El nombre va entre paréntesis y puede contener espacios
+
+                        padre = int(f.read().rsplit(")", 1)[1].split()[1])
+
+                except (OSError, ValueError, IndexError):
+
+                    continue
+
+                hijos.setdefault(padre, []).append(int(entrada))
+
+    except OSError:
+
+        return []
+
+    resultado = []
+
+    pendientes = [pid]
+
+    while pendientes:
+
+        for hijo in hijos.get(pendientes.pop(), []):
+
+            resultado.append(hijo)
+
+            pendientes.append(hijo)
+
+    return resultado
+
+
+def matar_arbol(pid):
+    """Mata un proceso y todos sus descendientes (chromedriver y los Chrome que lanzó)"""
+
+    if sys.platform == 'win32':
+
+        import subprocess
+
+        subprocess.run(["taskkill", "/T", "/F", "/PID", str(pid)], capture_output=True)
+
+        return
+
+    # Primero los hijos, que de otro modo quedarían huérfanos al morir el padre
+
+    for objetivo in descendientes(pid)[::-1] + [pid]:
+
+        try:
+
+            os.kill(objetivo, signal.SIGKILL)
+
+        except OSError:
+
+            pass
+
+
+def inicio_proceso(pid):
+    """Marca de arranque del proceso (distingue un PID reutilizado); None si no existe o no se sabe"""
+
+    try:
+
+        import psutil
+
+        return psutil.Process(pid).create_time()
+
+    except ImportError:
+
+        pass
+
+    except Exception:
+
+        return None
+
+    try:
+
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            return float(f.read().rsplit(")", 1)[1].split()[19])
+
+    except (OSError, ValueError, IndexError):
+
+        return None
+
+
+def rss_proceso(pid):
+    """Memoria residente de un proceso en bytes (0 si no existe o no se puede medir)"""
+
+    try:
+
+        import psutil
+
+        return psutil.Process(pid).memory_info().rss
+
+    except ImportError:
+
+        pass
+
+    except Exception:
+
+        return 0
+
+    try:
+
+        with open(f"/proc/{pid}/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    except (OSError, ValueError, IndexError, AttributeError):
+
+        return 0
+
+
+class SupervisorProcesos:
+    """Registro en disco de los procesos de cada navegador lanzado y limpieza de los huérfanos
+
+    Al arrancar un driver se anotan chromedriver y sus Chrome (PID, marca de arranque y PID
+    del proceso dueño). Al cerrarlo se matan los que sigan vivos. recolectar() elimina los
+    procesos anotados cuyo dueño ya no existe o que este proceso dejó atrás; la marca de
+    arranque evita matar un proceso ajeno que haya reutilizado el PID.
+
+    Cada proceso dueño escribe solo su propio fichero (procesos_file con su PID antes de la
+    extensión), así que no hay escrituras concurrentes sobre el mismo fichero; recolectar()
+    recorre los de todos los procesos y borra los de dueños que ya no existen.
+    """
+
+    def __init__(self, config):
+
+        self.ruta = config.get('procesos_file')
+
+        self.intervalo_s = config.get('procesos_recoleccion_min', 10) * 60
+
+        self.ultima_recoleccion = None
+
+        # id(driver) -> PIDs anotados de ese driver
+
+        self._activos = {}
+
+        self._lock = threading.Lock()
+
+    def ruta_de(self, pid):
+
+        raiz, extension = os.path.splitext(self.ruta)
+
+        return f"{raiz}.{pid}{extension}"
+
+    def _registros(self):
+
+        """Ficheros de registro existentes: {PID dueño: ruta}"""
+
+        if not self.ruta:
+            return {}
+
+        directorio = os.path.dirname(self.ruta) or "."
+
+        raiz, extension = os.path.splitext(os.path.basename(self.ruta))
+
+        registros = {}
+
+        try:
+
+            nombres = os.listdir(directorio)
+
+        except OSError:
+
+            return {}
+
+        for nombre in nombres:
+
+            dueno = nombre[len(raiz) + 1:len(nombre) - len(extension)] if extension else nombre[len(raiz) + 1:]
+
+            if nombre.startswith(raiz + ".") and nombre.endswith(extension) and dueno.isdigit():
+                registros[int(dueno)] = os.path.join(directorio, nombre)
+
+        return registros
+
+    def _cargar(self, ruta=None):
+
+        ruta = ruta or (self.ruta_de(os.getpid()) if self.ruta else None)
+
+        try:
+
+            if ruta and os.path.exists(ruta):
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    return json.load(f).get("procesos", {})
+
+        except (OSError, ValueError) as e:
+
+            logger.error(f"❌ Error cargando {ruta}: {e}")
+
+        return {}
+
+    def _escribir(self, procesos):
+
+        """Guarda el registro de este proceso (se borra cuando queda vacío)"""
+
+        if not self.ruta:
+            return
+
+        ruta = self.ruta_de(os.getpid())
+
+        try:
+
+            if not procesos:
+
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+
+                return
+
+            temporal = f"{ruta}.tmp"
+
+            with open(temporal, 'w', encoding='utf-8') as f:
+
+                json.dump({"procesos": procesos}, f, indent=4)
+
+            os.replace(temporal, ruta)
+
+        except OSError as e:
+
+            logger.error(f"❌ Error guardando {ruta}: {e}")
+
+    def registrar(self, driver, pid):
+
+        """Anota chromedriver y todos sus descendientes actuales (se puede llamar de nuevo para ampliar)"""
+
+        if not pid:
+            return
+
+        pids = [pid] + descendientes(pid)
+
+        with self._lock:
+
+            procesos = self._cargar()
+
+            for p in pids:
+
+                inicio = inicio_proceso(p)
+
+                if inicio is not None:
+                    procesos[str(p)] = {'inicio': inicio, 'dueno': os.getpid()}
+
+            self._activos[id(driver)] = set(self._activos.get(id(driver), ())) | set(pids)
+
+            self._escribir(procesos)
+
+    def liberar(self, driver):
+
+        """Tras cerrar el driver: mata los procesos suyos que sigan vivos y los borra del registro"""
+
+        with self._lock:
+
+            pids = self._activos.pop(id(driver), set())
+
+            procesos = self._cargar()
+
+            restantes = self._matar_vivos(procesos, pids)
+
+            for p in pids:
+                procesos.pop(str(p), None)
+
+            self._escribir(procesos)
+
+        if restantes:
+            logger.warning(f"🧹 {restantes} procesos del navegador seguían vivos tras cerrarlo - eliminados")
+
+    def _matar_vivos(self, procesos, pids):
+
+        # Con self._lock adquirido; solo mata si la marca de arranque coincide con la anotada
+
+        muertos = 0
+
+        for p in pids:
+
+            registro = procesos.get(str(p))
+
+            if registro and inicio_proceso(p) == registro['inicio']:
+
+                try:
+
+                    os.kill(p, signal.SIGKILL if hasattr(signal, 'SIGKILL') else signal.SIGTERM)
+
+                    muertos += 1
+
+                except OSError:
+
+                    pass
+
+        return muertos
+
+    def recolectar(self):
+
+        """Elimina los procesos huérfanos anotados (dueño muerto o driver que ya no está activo)"""
+
+        with self._lock:
+
+            self.ultima_recoleccion = time.time()
+
+            activos = set().union(*self._activos.values()) if self._activos else set()
+
+            muertos = 0
+
+            for dueno, ruta in self._registros().items():
+
+                if dueno == os.getpid():
+
+                    # Los de este proceso cuyo driver ya no está activo
+
+                    procesos = self._cargar(ruta)
+
+                    huerfanos = [int(clave) for clave in procesos if int(clave) not in activos]
+
+                    muertos += self._matar_vivos(procesos, huerfanos)
+
+                    for pid in huerfanos:
+                        procesos.pop(str(pid), None)
+
+                    if huerfanos:
+                        self._escribir(procesos)
+
+                elif not proceso_vivo(dueno):
+
+                    # Dueño muerto: su fichero ya no lo escribe nadie
+
+                    procesos = self._cargar(ruta)
+
+                    muertos += self._matar_vivos(procesos, [int(clave) for clave in procesos])
+
+                    try:
+
+                        os.remove(ruta)
+
+                    except OSError:
+
+                        pass
+
+        if muertos:
+            logger.warning(f"🧹 {muertos} procesos huérfanos de Chrome/chromedriver eliminados")
+
+        return muertos
+
+    def recolectar_si_toca(self):
+
+        if self.ultima_recoleccion is None or time.time() - self.ultima_recoleccion >= self.intervalo_s:
+            self.recolectar()
+
+
+class VigilanteDriver:
+    """Plazo por comando de WebDriver: si un comando se cuelga se mata el árbol de procesos del navegador
+
+    Cada comando pasa por comando(driver, nombre); un thread revisa cada segundo los que
+    están en curso. Al vencer un plazo se mata chromedriver con todos sus Chrome, el comando
+    bloqueado falla en el acto y los siguientes de ese driver lanzan DriverColgadoError sin
+    llegar a enviarse, de modo que el trabajador suelta el usuario (que pasa a reintentos
+    con un driver nuevo) y el resto de la ejecución sigue. Cada revision_s segundos mide
+    además la memoria residente de cada navegador (se recicla igual si pasa del máximo) y
+    guarda el pico de la ejecución. El thread termina cuando no queda ningún driver
+    registrado y se vuelve a lanzar con el siguiente.
+    """
+
+    # Comandos que pueden cargar una página (ENTRAR, el onclick de form_pfichaje, el envío
+    # del fichaje) y quedar bloqueados hasta el page load timeout: su plazo es driver_carga_timeout_s
+
+    COMANDOS_CARGA = ("get", "refresh", "goBack", "goForward", "clickElement", "sendKeysToElement",
+                      "w3cExecuteScript", "w3cExecuteScriptAsync")
+
+    # Page load timeout fijado en start_driver
+
+    CARGA_PAGINA_S = 60
+
+    def __init__(self, config):
+
+        self.plazo_comando = config.get('driver_comando_timeout_s', 30)
+
+        # Nunca por debajo del page load timeout: una carga lenta la corta Selenium, no el vigilante
+
+        self.plazo_carga = max(config.get('driver_carga_timeout_s', 90), self.CARGA_PAGINA_S + 10)
+
+        self.revision_s = config.get('procesos_revision_s', 5)
+
+        self.rss_max = config.get('driver_rss_max_mb', 1500) * 1024 * 1024
+
+        # id(driver) -> {'pid', 'comando', 'inicio', 'colgado'}
+
+        self._drivers = {}
+
+        self._lock = threading.Lock()
+
+        self._thread = None
+
+        self.eventos = []
+
+        self.reiniciar()
+
+    def registrar(self, driver):
+
+        servicio = getattr(driver, 'service', None)
+
+        proceso = getattr(servicio, 'process', None)
+
+        with self._lock:
+
+            self._drivers[id(driver)] = {'pid': getattr(proceso, 'pid', None), 'comando': None, 'inicio': None, 'colgado': None}
+
+            if self._thread is None:
+
+                self._thread = threading.Thread(target=self._vigilar, daemon=True)
+
+                self._thread.start()
+
+        return getattr(proceso, 'pid', None)
+
+    def pid(self, driver):
+
+        with self._lock:
+
+            estado = self._drivers.get(id(driver))
+
+            return estado['pid'] if estado else None
+
+    @contextmanager
+    def comando(self, driver, nombre):
+
+        with self._lock:
+
+            estado = self._drivers.get(id(driver))
+
+            if estado:
+
+                if estado['colgado']:
+
+                    if nombre == "quit":
+                        self._drivers.pop(id(driver), None)
+
+                    raise DriverColgadoError(f"navegador cerrado por el vigilante ({estado['colgado']})")
+
+                estado['comando'], estado['inicio'] = nombre, time.monotonic()
+
+        try:
+
+            yield
+
+        except Exception as e:
+
+            if estado and estado['colgado']:
+                raise DriverColgadoError(f"'{nombre}' interrumpido: navegador cerrado por el vigilante ({estado['colgado']})") from e
+
+            raise
+
+        finally:
+
+            with self._lock:
+
+                if estado:
+
+                    estado['comando'] = estado['inicio'] = None
+
+                if nombre == "quit":
+                    self._drivers.pop(id(driver), None)
+
+    def _vigilar(self):
+
+        ultima_revision = 0.0
+
+        while True:
+
+            time.sleep(1)
+
+            ahora = time.monotonic()
+
+            cerrar = []
+
+            with self._lock:
+
+                if not self._drivers:
+
+                    self._thread = None
+
+                    return
+
+                for estado in self._drivers.values():
+
+                    if estado['inicio'] is None or estado['colgado']:
+                        continue
+
+                    plazo = self.plazo_carga if estado['comando'] in self.COMANDOS_CARGA else self.plazo_comando
+
+                    if ahora - estado['inicio'] > plazo:
+
+                        estado['colgado'] = f"comando '{estado['comando']}' bloqueado {ahora - estado['inicio']:.0f}s"
+
+                        cerrar.append((estado, 'bloqueo'))
+
+                pids = [(estado, estado['pid']) for estado in self._drivers.values() if estado['pid'] and not estado['colgado']]
+
+            if ahora - ultima_revision >= self.revision_s:
+
+                ultima_revision = ahora
+
+                cerrar.extend(self._revisar_memoria(pids))
+
+            for estado, tipo in cerrar:
+
+                logger.error(f"⏱️ {estado['colgado']} - se cierra el navegador (PID {estado['pid']})")
+
+                if estado['pid']:
+                    matar_arbol(estado['pid'])
+
+                with self._lock:
+
+                    self.eventos.append({'fecha': datetime.now().isoformat(timespec='seconds'), 'tipo': tipo,
+                                         'detalle': estado['colgado'], 'pid': estado['pid']})
+
+    def _revisar_memoria(self, pids):
+
+        """Mide la memoria de cada navegador (chromedriver + Chrome) y devuelve los que hay que reciclar"""
+
+        reciclar = []
+
+        total = rss_proceso(os.getpid())
+
+        for estado, pid in pids:
+
+            rss = sum(rss_proceso(p) for p in [pid] + descendientes(pid))
+
+            total += rss
+
+            with self._lock:
+
+                self.pico_driver = max(self.pico_driver, rss)
+
+                if self.rss_max and rss > self.rss_max and not estado['colgado']:
+
+                    estado['colgado'] = f"memoria {rss / 1048576:.0f} MB > {self.rss_max / 1048576:.0f} MB"
+
+                    reciclar.append((estado, 'memoria'))
+
+        with self._lock:
+            self.pico_total = max(self.pico_total, total)
+
+        return reciclar
+
+    def reiniciar(self):
+
+        with self._lock:
+
+            self.eventos = []
+
+            self.pico_total = 0
+
+            self.pico_driver = 0
+
+    def resumen(self):
+
+        with self._lock:
+
+            return {
+
+                'colgados': sum(1 for e in self.eventos if e['tipo'] == 'bloqueo'),
+
+                'reciclados': sum(1 for e in self.eventos if e['tipo'] == 'memoria'),
+
+                'pico_rss_mb': round(self.pico_total / 1048576, 1),
+
+                'pico_driver_mb': round(self.pico_driver / 1048576, 1),
+
+                'eventos': list(self.eventos)
+
+            }
+
+
+# ==================== CLASE PARA EL MOTOR DE FICHAJE ====================
+
+# Motivos de fallo de un fichaje (deciden si se reintenta)
+
+MOTIVO_CHROME = 'chrome'
+
+MOTIVO_TIMEOUT = 'timeout'
+
+MOTIVO_LOGIN = 'login_rechazado'
+
+MOTIVO_PORTAL = 'portal'
+
+MOTIVO_INACCESIBLE = 'portal_inaccesible'
+
+MOTIVO_ERROR = 'error'
+
+# Fallo o resultado dudoso después de pulsar 'Realizar Fichaje': el portal pudo registrarlo, nunca se reintenta
+
+MOTIVO_ENVIADO = 'fichaje_enviado'
+
+# Resultado de realizar_fichaje -> contador del resumen
+
+CLAVE_RESULTADO = {True: 'exitos', False: 'fallos', None: 'desconocidos'}
+
+# Fallos que indican sobrecarga (del portal o de la máquina) para el control de concurrencia
+
+MOTIVOS_SOBRECARGA = (MOTIVO_CHROME, MOTIVO_TIMEOUT, MOTIVO_INACCESIBLE, MOTIVO_ERROR)
+
+# Fallos que indican que el portal no está sirviendo (cuentan para el circuit breaker)
+
+MOTIVOS_PORTAL_CAIDO = (MOTIVO_TIMEOUT, MOTIVO_INACCESIBLE)
+
+MENSAJES_MOTIVO = {
+
+    MOTIVO_CHROME: "Chrome crash",
+
+    MOTIVO_TIMEOUT: "Timeout esperando al portal",
+
+    MOTIVO_INACCESIBLE: "Portal inaccesible",
+
+    MOTIVO_LOGIN: "Login rechazado (captcha o credenciales)"
+
+}
+
+
+class FichajeEngine:
+    """Motor de fichaje con todas las funciones necesarias"""
+
+    # Ruta de chromedriver resuelta una vez por proceso (ChromeDriverManager consulta la red)
+
+    _ruta_chromedriver = None
+
+    _lock_chromedriver = threading.Lock()
+
+    def __init__(self, config):
+
+        self.config = config
+
+        inicializar_entorno(config)
+
+        self.notifier = NotificationManager(config['notifications_file'])
+
+        self.profiler = ProfilingManager(config)
+
+        self.indice_fichajes = IndiceFichajes(config)
+
+        self.limitador = LimitadorPortal.para(config)
+
+        self.metricas_trafico = MetricasEspera()
+
+        self.metricas_formulario = MetricasFormulario()
+
+        self.selectores = CacheSelectores(config['selectores_cache_file'], config.get('selectores_degradar_fallos', 2))
+
+        self.bloqueo = BloqueoRed(config)
+
+        self.sesiones = CacheSesiones.desde_config(config)
+
+        self.reloj = RelojPortal(config)
+
+        self.vigilante = VigilanteDriver(config)
+
+        self.supervisor = SupervisorProcesos(config)
+
+        self.cache_frames = CacheFrames(config) if config.get('navegacion_directa') else None
+
+        # Controlador de concurrencia de la ejecución en curso (recibe las latencias de carga)
+
+        self.controlador = None
+
+        self._lock_resultados = threading.Lock()
+
+        # Una sola ejecución a la vez: controlador, métricas, diario y motivos son de la ejecución en curso
+
+        self._lock_ejecucion = threading.Lock()
+
+        # Motivo del último fallo de cada usuario (lo consume procesar_usuarios)
+
+        self.motivos_fallo = {}
+
+        # Instante (epoch) en que se envió el último fichaje de cada usuario
+
+        self.instantes_envio = {}
+
+    @classmethod
+    def ruta_chromedriver(cls):
+
+        """Ruta de chromedriver, descargada o comprobada solo la primera vez"""
+
+        with cls._lock_chromedriver:
+
+            if cls._ruta_chromedriver is None:
+                cls._ruta_chromedriver = ChromeDriverManager().install()
+
+            return cls._ruta_chromedriver
+
+    def start_driver(self, headless=False):
+
+        """Inicia el driver de Chrome con configuración optimizada"""
+
+        perfil_temporal = None
+
+        try:
+
+            options = webdriver.ChromeOptions()
+
+            if headless:
+                options.add_argument("--headless=new")
+
+            # Opciones para mayor estabilidad
+
+            options.add_argument("--no-sandbox")
+
+            options.add_argument("--disable-dev-shm-usage")
+
+            options.add_argument("--disable-gpu")
+
+            options.add_argument("--disable-software-rasterizer")
+
+            options.add_argument("--disable-extensions")
+
+            options.add_argument("--disable-blink-features=AutomationControlled")
+
+            options.add_experimental_option("excludeSwitches", ["enable-automation"])
+
+            options.add_experimental_option('useAutomationExtension', False)
+
+            prefs = {
+
+                "profile.default_content_setting_values.notifications": 2,
+
+                "profile.default_content_settings.popups": 0
+
+            }
+
+            options.add_experimental_option("prefs", prefs)
+
+            self.bloqueo.preparar_opciones(options)
+
+            lite = self.config.get('chrome_perfil', 'normal') == 'lite'
+
+            if lite:
+
+                for flag in CHROME_FLAGS_LITE:
+                    options.add_argument(flag)
+
+                # Cada Chrome trabaja sobre su propia copia de la plantilla
+
+                plantilla = preparar_plantilla_chrome(os.path.abspath(self.config['chrome_plantilla_dir']))
+
+                perfil_temporal = tempfile.mkdtemp(prefix="fichaje_chrome_")
+
+                shutil.copytree(plantilla, perfil_temporal, dirs_exist_ok=True)
+
+                options.add_argument(f"--user-data-dir={perfil_temporal}")
+
+            driver = webdriver.Chrome(
+
+                service=ChromeService(self.ruta_chromedriver()),
+
+                options=options
+
+            )
+
+            # Cuenta los comandos enviados al driver (cada uno es un round trip) y les pone plazo
+
+            pid_driver = self.vigilante.registrar(driver)
+
+            self.supervisor.registrar(driver, pid_driver)
+
+            execute_original = driver.execute
+
+            driver.comandos = 0
+
+            def execute_vigilado(comando, *args, **kwargs):
+
+                driver.comandos += 1
+
+                with self.vigilante.comando(driver, comando):
+                    return execute_original(comando, *args, **kwargs)
+
+            driver.execute = execute_vigilado
+
+            if perfil_temporal:
+
+                quit_original = driver.quit
+
+                def quit_y_limpiar():
+
+                    try:
+
+                        quit_original()
+
+                    finally:
+
+                        shutil.rmtree(perfil_temporal, ignore_errors=True)
+
+                driver.quit = quit_y_limpiar
+
+            else:
+
+                # En 'lite' el tamaño va en --window-size y se ahorra la llamada
+
+                driver.set_window_size(1200, 900)
+
+            # Al cerrar, los procesos del navegador que sobrevivan a quit() se matan aquí
+
+            quit_sin_supervisar = driver.quit
+
+            def quit_supervisado():
+
+                try:
+
+                    self.supervisor.registrar(driver, pid_driver)
+
+                    quit_sin_supervisar()
+
+                finally:
+
+                    self.supervisor.liberar(driver)
+
+            driver.quit = quit_supervisado
+
+            driver.set_page_load_timeout(VigilanteDriver.CARGA_PAGINA_S)
+
+            self.bloqueo.aplicar(driver)
+
+            logger.info(f"✅ Driver de Chrome iniciado correctamente (perfil {'lite' if lite else 'normal'})")
+
+            return driver
+
+        except Exception as e:
+
+            if perfil_temporal:
+                shutil.rmtree(perfil_temporal, ignore_errors=True)
+
+            logger.error(f"❌ Error iniciando driver: {e}")
+
+            raise
+
+    def solve_captcha_2captcha(self, image_path, api_key, timeout=120):
+
+        """Resuelve captcha usando API de 2Captcha"""
+
+        try:
+
+            with open(image_path, "rb") as f:
+
+                b64 = base64.b64encode(f.read()).decode()
+
+            logger.info("📤 Enviando captcha a 2Captcha...")
+
+            api_url = self.config.get('captcha_api_url', "http://2captcha.com").rstrip("/")
+
+            poll_s = self.config.get('captcha_poll_s', 5)
+
+            r = requests.post(f"{api_url}/in.php", data={
+
+                "method": "base64",
+
+                "key": api_key,
+
+                "body": b64,
+
+                "json": 1
+
+            }, timeout=10).json()
+
+            if r.get("status") != 1:
+                logger.error(f"❌ Error enviando captcha: {r}")
+
+                return None
+
+            captcha_id = r["request"]
+
+            logger.info(f"⏳ Esperando respuesta de captcha...")
+
+            for _ in range(int(timeout / poll_s)):
+
+                time.sleep(poll_s)
+
+                res = requests.get(f"{api_url}/res.php", params={
+
+                    "key": api_key,
+
+                    "action": "get",
+
+                    "id": captcha_id,
+
+                    "json": 1
+
+                }, timeout=10).json()
+
+                if res.get("status") == 1:
+                    logger.info(f"✅ Captcha resuelto: {res['request']}")
+
+                    return res["request"]
+
+                if res.get("request") != "CAPCHA_NOT_READY":
+                    logger.error(f"❌ Error resolviendo captcha: {res}")
+
+                    return None
+
+            logger.warning("⏱ Timeout esperando respuesta de 2Captcha")
+
+            return None
+
+        except Exception as e:
+
+            logger.error(f"❌ Error en 2Captcha: {e}")
+
+            return None
+
+    def find_captcha_image(self, driver):
+
+        """Busca la imagen del captcha"""
+
+        try:
+
+            imgs = driver.find_elements(By.TAG_NAME, "img")
+
+            for img in imgs:
+
+                src = (img.get_attribute("src") or "").lower()
+
+                if "captcha" in src or "codigo" in src:
+                    logger.info("✅ Imagen de captcha encontrada")
+
+                    return img
+
+            logger.warning("⚠️ No se encontró imagen de captcha")
+
+            return None
+
+        except Exception as e:
+
+            logger.error(f"❌ Error buscando captcha: {e}")
+
+            return None
+
+    def take_screenshot(self, driver, filename):
+
+        """Captura screenshot con timestamp"""
+
+        try:
+
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+            filepath = os.path.join(self.config['screenshots_dir'], f"{timestamp}_{filename}")
+
+            driver.save_screenshot(filepath)
+
+            logger.info(f"📸 Screenshot guardado: {filepath}")
+
+            return filepath
+
+        except Exception as e:
+
+            logger.error(f"❌ Error guardando screenshot: {e}")
+
+            return ""
+
+    def guardar_resultado(self, usuario, estado, mensaje, screenshot_path=""):
+
+        """Guarda el resultado del fichaje en CSV"""
+
+        try:
+
+            resultado = {
+
+                'fecha_hora': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+
+                'usuario': usuario,
+
+                'estado': estado,
+
+                'mensaje': mensaje,
+
+                'screenshot': screenshot_path
+
+            }
+
+            df = pd.DataFrame([resultado])
+
+            # Con varios usuarios en paralelo las escrituras no deben intercalarse
+
+            with self._lock_resultados:
+
+                if os.path.exists(self.config['results_file']):
+
+                    df.to_csv(self.config['results_file'], mode='a', header=False, index=False, encoding='utf-8')
+
+                else:
+
+                    df.to_csv(self.config['results_file'], mode='w', header=True, index=False, encoding='utf-8')
+
+            if estado == "ÉXITO":
+                self.indice_fichajes.registrar_exito(usuario)
+
+            logger.info(f"📝 Resultado guardado")
+
+        except Exception as e:
+
+            logger.error(f"❌ Error guardando resultado: {e}")
+
+    def safe_click(self, driver, element, description="elemento"):
+
+        """Hace clic de forma segura con múltiples intentos"""
+
+        try:
+
+            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", element)
+
+            time.sleep(0.3)
+
+            element.click()
+
+            logger.info(f"✅ Clic en {description}")
+
+            return True
+
+        except DriverColgadoError:
+
+            # El vigilante cerró el navegador: no hay clic alternativo posible
+
+            raise
+
+        except Exception as e1:
+
+            try:
+
+                driver.execute_script("arguments[0].click();", element)
+
+                logger.info(f"✅ Clic con JS en {description}")
+
+                return True
+
+            except DriverColgadoError:
+
+                raise
+
+            except Exception as e2:
+
+                logger.error(f"❌ No se pudo hacer clic en {description}")
+
+                return False
+
+    def _turno_portal(self, tipo):
+
+        """Pide turno al limitador antes de una petición al portal y anota la espera"""
+
+        espera = self.limitador.adquirir()
+
+        self.metricas_trafico.registrar(tipo, espera)
+
+        if espera >= 1:
+            logger.info(f"🚦 {espera:.1f}s en cola para el portal ({tipo})")
+
+    def _cargar_pagina(self, driver, url):
+
+        self._turno_portal('pagina')
+
+        inicio_carga = time.perf_counter()
+
+        driver.get(url)
+
+        if self.controlador:
+            self.controlador.observar_latencia(time.perf_counter() - inicio_carga)
+
+    def _cargar_login(self, driver):
+
+        """Carga el login; devuelve True si se cargó directamente el documento del frame"""
+
+        url_login = self.cache_frames.url_login() if self.cache_frames else None
+
+        if url_login:
+
+            self._cargar_pagina(driver, url_login)
+
+            if self.cache_frames.validar(driver):
+
+                logger.info("🧭 Login cargado directamente (sin frameset)")
+
+                return True
+
+            logger.warning("⚠️ El documento de login cacheado no es válido - se vuelve al frameset")
+
+            self.cache_frames.invalidar()
+
+        self._cargar_pagina(driver, self.config['url'])
+
+        time.sleep(3)
+
+        return False
+
+    def _entrar_frames(self, driver):
+
+        driver.switch_to.frame("cuerpo_WCRONOS")
+
+        time.sleep(1)
+
+        driver.switch_to.frame("principal_wcronos")
+
+        time.sleep(1)
+
+    def _estrategias_entrar(self, driver):
+
+        """Formas de pulsar ENTRAR en el login, en orden por defecto"""
+
+        def por_xpath():
+
+            botones = driver.find_elements(
+
+                By.XPATH,
+
+                "//button[contains(translate(., 'ENTRAR', 'entrar'), 'entrar')] | "
+
+                "//input[@type='submit' and contains(translate(@value, 'ENTRAR', 'entrar'), 'entrar')]"
+
+            )
+
+            return botones and self.safe_click(driver, botones[0], "botón ENTRAR")
+
+        def recorriendo_botones():
+
+            for btn in driver.find_elements(By.XPATH, "//button | //input[@type='submit']"):
+
+                texto = (btn.text or "").lower()
+
+                value = (btn.get_attribute("value") or "").lower()
+
+                if "entrar" in texto or "entrar" in value:
+                    return self.safe_click(driver, btn, "botón ENTRAR")
+
+            return False
+
+        return {'xpath': por_xpath, 'recorrido': recorriendo_botones}
+
+    def _estrategias_fichaje(self, driver):
+
+        """Formas de pulsar 'Realizar Fichaje', en orden por defecto"""
+
+        def por_id():
+
+            return self.safe_click(driver, driver.find_element(By.ID, "btnEnviarForm"), "Realizar Fichaje")
+
+        def por_texto():
+
+            botones = driver.find_elements(By.XPATH,
+
+                                           "//button[contains(., 'Realizar Fichaje')] | //button[contains(., 'Fichar')]")
+
+            return botones and self.safe_click(driver, botones[0], "Realizar Fichaje")
+
+        def enviando_formulario():
+
+            return driver.execute_script("""
+
+                let btn = document.getElementById('btnEnviarForm');
+
+                if (!btn || !btn.form) return false;
+
+                setTimeout(() => btn.form.submit(), 0);
+
+                return true;
+
+            """)
+
+        return {'id': por_id, 'texto': por_texto, 'submit': enviando_formulario}
+
+    def _rellenar_login(self, driver, usuario, password, captcha_value, callback=None):
+
+        """Rellena y envía el login; devuelve (modo usado, screenshot del formulario relleno)"""
+
+        turno_pedido = False
+
+        if self.config.get('relleno_formulario', 'script') == 'script':
+
+            self._turno_portal('login')
+
+            turno_pedido = True
+
+            estado = driver.execute_script(SCRIPT_RELLENAR_LOGIN, usuario, password, captcha_value)
+
+            if estado == 'enviado':
+
+                logger.info("✅ Formulario rellenado y enviado en una sola llamada")
+
+                return 'script', ""
+
+            if estado == 'sin_boton':
+                raise Exception("No se pudo hacer clic en ENTRAR")
+
+            logger.info(f"⌨️ El formulario necesita escritura real ({estado}) - se rellena campo a campo")
+
+        tarjeta_field = driver.find_element(By.ID, "USUARIO")
+
+        contrasena_field = driver.find_element(By.ID, "CONTRASENA")
+
+        captcha_field = driver.find_element(By.NAME, "codigo_captcha")
+
+        tarjeta_field.clear()
+
+        tarjeta_field.send_keys(usuario)
+
+        time.sleep(0.5)
+
+        contrasena_field.clear()
+
+        contrasena_field.send_keys(password)
+
+        time.sleep(0.5)
+
+        captcha_field.clear()
+
+        captcha_field.send_keys(captcha_value)
+
+        time.sleep(0.5)
+
+        screenshot_path = self.take_screenshot(driver, f"antes_login_{usuario}.png")
+
+        # 6. Hacer clic en ENTRAR
+
+        logger.info("🔍 Buscando botón ENTRAR...")
+
+        if callback:
+            callback("Haciendo login...")
+
+        if not turno_pedido:
+            self._turno_portal('login')
+
+        if not self.selectores.resolver('login', self._estrategias_entrar(driver)):
+            raise Exception("No se pudo hacer clic en ENTRAR")
+
+        return 'nativo', screenshot_path
+
+    def realizar_fichaje(self, usuario, password, driver, callback=None, antes_de_fichar=None):
+
+        """Realiza el proceso completo de fichaje"""
+
+        with self.profiler.perfilar("realizar_fichaje", usuario):
+
+            try:
+
+                return self._realizar_fichaje(usuario, password, driver, callback, antes_de_fichar)
+
+            finally:
+
+                self.bloqueo.contabilizar(driver)
+
+    def _entrar_hasta_punto_fichaje(self, usuario, password, driver, callback=None):
+
+        """Login completo (captcha incluido) hasta la página de Punto de Fichaje; devuelve el screenshot del login"""
+
+        inicio_login = time.perf_counter()
+
+        # 1. Cargar página
+
+        logger.info("📍 Cargando página de login...")
+
+        if callback:
+            callback("Cargando página de login...")
+
+        directo = self._cargar_login(driver)
+
+        # 2. Entrar a frames (en navegación directa el login ya es la página principal)
+
+        if not directo:
+
+            logger.info("🔀 Entrando a frames...")
+
+            if callback:
+                callback("Accediendo al sistema...")
+
+            self._entrar_frames(driver)
+
+            if self.cache_frames:
+                self.cache_frames.guardar(driver.execute_script("return document.location.href"))
+
+        # 3. Localizar campos
+
+        logger.info("🔍 Localizando campos del formulario...")
+
+        if callback:
+            callback("Localizando formulario de login...")
+
+        comandos_inicio = getattr(driver, 'comandos', 0)
+
+        WebDriverWait(driver, self.config['timeout_medium']).until(
+
+            EC.presence_of_element_located((By.ID, "USUARIO"))
+
+        )
+
+        # 4. Captcha
+
+        captcha_value = None
+
+        captcha_img = self.find_captcha_image(driver)
+
+        if captcha_img:
+
+            if callback:
+                callback("Resolviendo captcha...")
+
+            captcha_path = f"captcha_{usuario}_{datetime.now().strftime('%H%M%S')}.png"
+
+            try:
+
+                captcha_img.screenshot(captcha_path)
+
+                captcha_value = self.solve_captcha_2captcha(captcha_path, self.config['api_key_2captcha'])
+
+                os.remove(captcha_path)
+
+            except:
+
+                pass
+
+        if not captcha_value:
+            captcha_value = "0000"
+
+        # 5-6. Rellenar formulario y hacer clic en ENTRAR
+
+        logger.info("📝 Rellenando formulario...")
+
+        if callback:
+            callback("Ingresando credenciales...")
+
+        modo_relleno, screenshot_login = self._rellenar_login(driver, usuario, password, captcha_value, callback)
+
+        screenshot_path = screenshot_login
+
+        self.metricas_formulario.registrar(modo_relleno, getattr(driver, 'comandos', 0) - comandos_inicio)
+
+        # 7. Esperar redirección
+
+        time.sleep(5)
+
+        logger.info(f"📍 Login completado")
+
+        # 8. Ir a Punto de Fichaje
+
+        if callback:
+            callback("Navegando a punto de fichaje...")
+
+        time.sleep(2)
+
+        boton_fichaje = driver.find_element(
+
+            By.XPATH,
+
+            "//button[contains(@onclick, 'form_pfichaje.submit')]"
+
+        )
+
+        onclick = boton_fichaje.get_attribute("onclick")
+
+        self._turno_portal('pagina')
+
+        driver.execute_script(onclick)
+
+        logger.info("✅ Navegando a Punto De Fichaje")
+
+        time.sleep(4)
+
+        # 9. Volver a entrar en frames
+
+        if not directo:
+
+            driver.switch_to.default_content()
+
+            self._entrar_frames(driver)
+
+        if self.sesiones:
+            self.sesiones.guardar(usuario, driver.get_cookies(), driver.execute_script("return document.location.href"),
+                                  time.perf_counter() - inicio_login)
+
+        return screenshot_path
+
+    def _restaurar_sesion(self, usuario, driver, callback=None):
+
+        """Restaura las cookies guardadas del usuario y comprueba que la sesión sigue viva en Punto de Fichaje"""
+
+        entrada = self.sesiones.obtener(usuario) if self.sesiones else None
+
+        if not entrada:
+            return False
+
+        if callback:
+            callback("Restaurando sesión guardada...")
+
+        inicio = time.perf_counter()
+
+        restaurada = False
+
+        try:
+
+            cookies = []
+
+            for cookie in entrada['cookies']:
+
+                cookie = dict(cookie)
+
+                if 'expiry' in cookie:
+                    cookie['expires'] = cookie.pop('expiry')
+
+                cookies.append(cookie)
+
+            driver.execute_cdp_cmd("Network.setCookies", {"cookies": cookies})
+
+            self._cargar_pagina(driver, entrada['url'])
+
+            restaurada = driver.execute_script(SCRIPT_EN_PUNTO_FICHAJE)
+
+            # Si la página solo responde por POST, se reenvía como el botón del menú (ya desde el mismo origen)
+
+            if not restaurada:
+
+                self._turno_portal('pagina')
+
+                pagina = driver.find_element(By.TAG_NAME, "html")
+
+                driver.execute_script(SCRIPT_POST_PUNTO_FICHAJE, entrada['url'])
+
+                WebDriverWait(driver, self.config['timeout_medium']).until(EC.staleness_of(pagina))
+
+                WebDriverWait(driver, self.config['timeout_medium']).until(
+
+                    lambda d: d.execute_script("return document.readyState") == "complete"
+
+                )
+
+                restaurada = driver.execute_script(SCRIPT_EN_PUNTO_FICHAJE)
+
+        except Exception as e:
+
+            logger.warning(f"⚠️ No se pudo restaurar la sesión de {usuario}: {e}")
+
+            restaurada = False
+
+        self.sesiones.registrar_restauracion(bool(restaurada), time.perf_counter() - inicio)
+
+        if restaurada:
+
+            logger.info(f"🍪 Sesión restaurada para {usuario} - se omiten login y captcha")
+
+            return True
+
+        logger.info(f"🍪 La sesión guardada de {usuario} ya no es válida - login completo")
+
+        self.sesiones.invalidar(usuario)
+
+        try:
+
+            driver.delete_all_cookies()
+
+        except Exception:
+
+            pass
+
+        return False
+
+    def _realizar_fichaje(self, usuario, password, driver, callback=None, antes_de_fichar=None):
+
+        """Pasos del fichaje: login, punto de fichaje, fichaje y verificación"""
+
+        from selenium.common.exceptions import WebDriverException
+
+        logger.info(f"\n{'=' * 70}")
+
+        logger.info(f"🚀 FICHAJE PARA: {usuario}")
+
+        logger.info(f"{'=' * 70}")
+
+        if callback:
+            callback(f"Iniciando fichaje para {usuario}...")
+
+        screenshot_path = ""
+
+        # Desde que se pulsa 'Realizar Fichaje' el portal pudo registrarlo: un fallo ya no es un error seguro
+
+        enviado = False
+
+        try:
+
+            # 1-9. Login y Punto de Fichaje (se saltan si la sesión guardada sigue viva)
+
+            if not self._restaurar_sesion(usuario, driver, callback):
+                screenshot_path = self._entrar_hasta_punto_fichaje(usuario, password, driver, callback)
+
+            # 10. REALIZAR FICHAJE
+
+            logger.info("🔍 Buscando botón 'Realizar Fichaje'...")
+
+            if callback:
+                callback("Realizando fichaje...")
+
+            self._turno_portal('fichaje')
+
+            if antes_de_fichar:
+                antes_de_fichar()
+
+            # Por ID, por texto o enviando el formulario, empezando por la que funcionó la última vez
+
+            enviado = True
+
+            if not self.selectores.resolver('fichaje', self._estrategias_fichaje(driver)):
+
+                # Ninguna estrategia llegó a pulsar el botón
+
+                enviado = False
+
+                raise Exception("No se pudo realizar el fichaje")
+
+            self.instantes_envio[usuario] = self.reloj.ahora()
+
+            # 11. Verificar resultado
+
+            time.sleep(3)
+
+            screenshot_path = self.take_screenshot(driver, f"resultado_{usuario}.png")
+
+            # GUARDAR HTML COMPLETO PARA DEBUG
+
+            try:
+
+                page_html = driver.page_source
+
+                html_file = os.path.join(self.config['screenshots_dir'],
+
+                                         f"html_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{usuario}.html")
+
+                with open(html_file, 'w', encoding='utf-8') as f:
+
+                    f.write(page_html)
+
+                logger.info(f"📄 HTML guardado en: {html_file}")
+
+                # Imprimir HTML en consola también
+
+                print("\n" + "=" * 80)
+
+                print("🔍 HTML COMPLETO DE LA PÁGINA RESULTADO:")
+
+                print("=" * 80)
+
+                print(page_html)
+
+                print("=" * 80)
+
+                print("FIN DEL HTML")
+
+                print("=" * 80 + "\n")
+
+            except Exception as e:
+
+                logger.error(f"Error guardando HTML: {e}")
+
+            # Obtener el texto de la página
+
+            page_text = driver.page_source.lower()
+
+            # INDICADORES DE ÉXITO - Por prioridad (más específicos primero)
+
+            success_indicators_alta_prioridad = [
+
+                "el fichaje se a realizado correctamente",  # Mensaje EXACTO
+
+                "el fichaje se ha realizado correctamente",  # Variante con H
+
+                "fichaje se a realizado correctamente",
+
+                "fichaje se ha realizado correctamente",
+
+                "se a realizado correctamente",
+
+                "se ha realizado correctamente",
+
+            ]
+
+            success_indicators_media_prioridad = [
+
+                "fichaje realizado",
+
+                "fichaje añadido",
+
+                "fichaje registrado",
+
+                "añadido con éxito",
+
+                "registrado con éxito",
+
+                "realizado con éxito",
+
+                "fichaje correcto",
+
+                "operación exitosa",
+
+                "guardado correctamente",
+
+            ]
+
+            success_indicators_baja_prioridad = [
+
+                "éxito",
+
+                "exitoso",
+
+                "correctamente",
+
+                "confirmado",
+
+                "completado"
+
+            ]
+
+            # INDICADORES DE ERROR - Solo mensajes claros de error
+
+            error_indicators_especificos = [
+
+                "error al realizar",
+
+                "error en el fichaje",
+
+                "fichaje incorrecto",
+
+                "fichaje fallido",
+
+                "no se pudo realizar",
+
+                "operación fallida",
+
+                "fichaje rechazado",
+
+                "no se ha podido",
+
+                "ha ocurrido un error"
+
+            ]
+
+            # PASO 1: Buscar indicadores de ALTA PRIORIDAD (mensajes específicos de éxito)
+
+            for indicator in success_indicators_alta_prioridad:
+
+                if indicator in page_text:
+
+                    logger.info(f"✅✅✅ FICHAJE EXITOSO para {usuario}")
+
+                    logger.info(f"   Mensaje detectado (ALTA PRIORIDAD): '{indicator}'")
+
+                    if callback:
+                        callback(f"✅ Fichaje exitoso para {usuario}")
+
+                    self.guardar_resultado(usuario, "ÉXITO", f"Fichaje completado: {indicator}", screenshot_path)
+
+                    # Enviar notificación de éxito
+
+                    self.notifier.notify(
+
+                        "Fichaje Exitoso",
+
+                        f"Usuario: {usuario}\nEstado: ÉXITO\nMensaje: {indicator}\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+
+                        tipo="success"
+
+                    )
+
+                    return True
+
+            # PASO 2: Buscar errores ESPECÍFICOS (solo si no encontramos éxito de alta prioridad)
+
+            error_especifico_found = False
+
+            error_message = ""
+
+            for indicator in error_indicators_especificos:
+
+                if indicator in page_text:
+                    error_especifico_found = True
+
+                    error_message = indicator
+
+                    break
+
+            if error_especifico_found:
+
+                logger.error(f"❌ FICHAJE FALLIDO para {usuario}")
+
+                logger.error(f"   Error ESPECÍFICO detectado: '{error_message}'")
+
+                if callback:
+                    callback(f"❌ Error en fichaje para {usuario}")
+
+                self.guardar_resultado(usuario, "ERROR", f"Error específico: {error_message}", screenshot_path)
+
+                # Enviar notificación de error
+
+                self.notifier.notify(
+
+                    "Fichaje Fallido",
+
+                    f"Usuario: {usuario}\nEstado: ERROR\nMensaje: {error_message}\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+
+                    tipo="error"
+
+                )
+
+                self.motivos_fallo[usuario] = MOTIVO_PORTAL
+
+                return False
+
+            # PASO 3: Buscar indicadores de MEDIA PRIORIDAD
+
+            for indicator in success_indicators_media_prioridad:
+
+                if indicator in page_text:
+
+                    logger.info(f"✅✅✅ FICHAJE EXITOSO para {usuario}")
+
+                    logger.info(f"   Mensaje detectado (MEDIA PRIORIDAD): '{indicator}'")
+
+                    if callback:
+                        callback(f"✅ Fichaje exitoso para {usuario}")
+
+                    self.guardar_resultado(usuario, "ÉXITO", f"Fichaje completado: {indicator}", screenshot_path)
+
+                    # Enviar notificación de éxito
+
+                    self.notifier.notify(
+
+                        "Fichaje Exitoso",
+
+                        f"Usuario: {usuario}\nEstado: ÉXITO\nMensaje: {indicator}\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+
+                        tipo="success"
+
+                    )
+
+                    return True
+
+            # PASO 4: Buscar indicadores de BAJA PRIORIDAD
+
+            for indicator in success_indicators_baja_prioridad:
+
+                if indicator in page_text:
+
+                    logger.info(f"✅✅✅ FICHAJE EXITOSO para {usuario}")
+
+                    logger.info(f"   Mensaje detectado (BAJA PRIORIDAD): '{indicator}'")
+
+                    if callback:
+                        callback(f"✅ Fichaje exitoso para {usuario}")
+
+                    self.guardar_resultado(usuario, "ÉXITO", f"Fichaje completado: {indicator}", screenshot_path)
+
+                    # Enviar notificación de éxito
+
+                    self.notifier.notify(
+
+                        "Fichaje Exitoso",
+
+                        f"Usuario: {usuario}\nEstado: ÉXITO\nMensaje: {indicator}\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+
+                        tipo="success"
+
+                    )
+
+                    return True
+
+            # PASO 5: Si no encontramos nada claro, intentar con el título
+
+            try:
+
+                page_title = driver.title.lower()
+
+                if any(word in page_title for word in ["éxito", "correcto", "confirmado", "realizado"]):
+
+                    logger.info(f"✅✅✅ FICHAJE EXITOSO para {usuario} (detectado en título)")
+
+                    if callback:
+                        callback(f"✅ Fichaje exitoso para {usuario}")
+
+                    self.guardar_resultado(usuario, "ÉXITO", "Fichaje completado (título)", screenshot_path)
+
+                    # Enviar notificación de éxito
+
+                    self.notifier.notify(
+
+                        "Fichaje Exitoso",
+
+                        f"Usuario: {usuario}\nEstado: ÉXITO\nMensaje: Detectado en título de página\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+
+                        tipo="success"
+
+                    )
+
+                    return True
+
+            except:
+
+                pass
+
+            # PASO 6: Si llegamos aquí, no pudimos determinar el estado
+
+            logger.warning(f"⚠️ ESTADO DESCONOCIDO para {usuario}")
+
+            logger.warning(f"   No se encontraron indicadores claros de éxito o error")
+
+            logger.warning(f"   Revisa el screenshot: {screenshot_path}")
+
+            if callback:
+                callback(f"⚠️ Estado desconocido para {usuario}")
+
+            self.guardar_resultado(usuario, "DESCONOCIDO", "Estado no determinado - revisar screenshot",
+
+                                   screenshot_path)
+
+            # Enviar notificación de estado desconocido
+
+            self.notifier.notify(
+
+                "Estado Desconocido",
+
+                f"Usuario: {usuario}\nEstado: DESCONOCIDO\nMensaje: No se pudo determinar el resultado\nRevisa el screenshot: {screenshot_path}\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+
+                tipo="warning"
+
+            )
+
+            self.motivos_fallo[usuario] = MOTIVO_ENVIADO
+
+            return None
+
+
+
+        except (WebDriverException, DriverColgadoError) as e:
+
+            motivo = self._clasificar_error_driver(e, driver)
+
+            mensaje = f"Chrome bloqueado: {e}" if isinstance(e, DriverColgadoError) else MENSAJES_MOTIVO[motivo]
+
+            if enviado:
+                return self._desconocido_tras_envio(usuario, mensaje, driver, callback)
+
+            logger.error(f"❌ ERROR DE CHROMEDRIVER para {usuario}: {mensaje}")
+
+            if callback:
+                callback(f"❌ Error de Chrome para {usuario}")
+
+            screenshot_path = self.take_screenshot(driver, f"error_{usuario}.png")
+
+            self.guardar_resultado(usuario, "ERROR", mensaje, screenshot_path)
+
+            # Enviar notificación de error
+
+            self.notifier.notify(
+
+                "Error de Chrome",
+
+                f"Usuario: {usuario}\nEstado: ERROR\nMensaje: {mensaje}\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+
+                tipo="error"
+
+            )
+
+            self.motivos_fallo[usuario] = motivo
+
+            return False
+
+        except Exception as e:
+
+            if enviado:
+                return self._desconocido_tras_envio(usuario, str(e)[:200], driver, callback)
+
+            logger.error(f"❌ ERROR para {usuario}: {e}")
+
+            if callback:
+                callback(f"❌ Error: {str(e)[:50]}")
+
+            screenshot_path = self.take_screenshot(driver, f"error_{usuario}.png")
+
+            self.guardar_resultado(usuario, "ERROR", str(e)[:200], screenshot_path)
+
+            # Enviar notificación de error
+
+            self.notifier.notify(
+
+                "Error en Fichaje",
 
                 f"Usuario: {usuario}\nEstado: ERROR\nMensaje: {str(e)[:200]}\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
 
-                tipo="error"
+                tipo="error"
+
+            )
+
+            self.motivos_fallo[usuario] = MOTIVO_ERROR
+
+            return False
+
+    def _desconocido_tras_envio(self, usuario, error, driver, callback=None):
+
+        """Fallo después de pulsar 'Realizar Fichaje': no se sabe si el portal lo registró y no se reintenta"""
+
+        mensaje = f"Fallo tras enviar el fichaje ({error}) - revisar manualmente"
+
+        logger.warning(f"⚠️ ESTADO DESCONOCIDO para {usuario}: {mensaje}")
+
+        if callback:
+            callback(f"⚠️ Estado desconocido para {usuario}")
+
+        screenshot_path = self.take_screenshot(driver, f"desconocido_{usuario}.png")
+
+        self.guardar_resultado(usuario, "DESCONOCIDO", mensaje, screenshot_path)
+
+        self.notifier.notify(
+
+            "Estado Desconocido",
+
+            f"Usuario: {usuario}\nEstado: DESCONOCIDO\nMensaje: {mensaje}\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+
+            tipo="warning"
+
+        )
+
+        self.motivos_fallo[usuario] = MOTIVO_ENVIADO
+
+        return None
+
+    def _clasificar_error_driver(self, error, driver):
+
+        """Clasifica un error de WebDriver: timeout, portal inaccesible, login rechazado o caída de Chrome"""
+
+        from selenium.common.exceptions import TimeoutException, NoSuchElementException, NoSuchFrameException
+
+        if isinstance(error, DriverColgadoError):
+            return MOTIVO_CHROME
+
+        if isinstance(error, TimeoutException):
+            return MOTIVO_TIMEOUT
+
+        # Sin servidor Chrome muestra su página de error (net::ERR_...) y no existen los frames del portal
+
+        if isinstance(error, NoSuchFrameException) or "net::ERR_" in str(error):
+            return MOTIVO_INACCESIBLE
+
+        if isinstance(error, NoSuchElementException):
+
+            # Si tras pulsar ENTRAR seguimos viendo el formulario, el portal rechazó el login
+
+            try:
+
+                if driver.find_elements(By.NAME, "codigo_captcha"):
+                    return MOTIVO_LOGIN
+
+            except Exception:
+
+                pass
+
+        return MOTIVO_CHROME
+
+    def fichar_usuario(self, usuario, password, callback=None, forzar=False):
+
+        """Ficha a un único usuario con su propio driver (None si se omite por estar ya fichado)"""
+
+        motivo = None if forzar else self.indice_fichajes.reservar(usuario)
+
+        if motivo:
+
+            logger.info(f"⏭ {usuario}: {motivo} - se omite")
+
+            return None
+
+        driver = None
+
+        try:
+
+            driver = self.start_driver(self.config['headless'])
+
+            return self.realizar_fichaje(usuario, password, driver, callback)
+
+        finally:
+
+            self.indice_fichajes.liberar(usuario)
+
+            try:
+
+                if driver:
+                    driver.quit()
+
+            except:
+
+                pass
+
+    def reanudar_ejecucion(self, run_id=None, callback=None):
+
+        """Continúa una ejecución interrumpida (la más reciente si no se indica run_id)"""
+
+        directorio = self.config['journal_dir']
+
+        if run_id:
+
+            ruta = DiarioEjecucion.ruta_de(directorio, run_id)
+
+            if not os.path.exists(ruta):
+
+                logger.error(f"❌ No existe el diario de la ejecución {run_id}")
+
+                return None
+
+            diario = DiarioEjecucion.cargar(ruta, self.config['journal_fsync'])
+
+            if diario.finalizado:
+
+                logger.info(f"✅ La ejecución {run_id} ya estaba completa")
+
+                return None
+
+        else:
+
+            interrumpidas = DiarioEjecucion.interrumpidas(directorio)
+
+            if not interrumpidas:
+
+                logger.info("✅ No hay ejecuciones interrumpidas")
+
+                return None
+
+            diario = interrumpidas[-1]
+
+        return self.procesar_usuarios(callback, reanudar=diario)
+
+    def procesar_usuarios(self, callback=None, reanudar=None, franja=None):
+
+        """Procesa los usuarios del CSV (solo los que tienen turno en la franja, si se indica)
+
+        El estado de la ejecución vive en el motor, así que dos ejecuciones simultáneas necesitan
+        dos motores: la segunda sobre el mismo motor se rechaza.
+        """
+
+        if not self._lock_ejecucion.acquire(blocking=False):
+
+            msg = "⛔ Este motor ya tiene una ejecución en curso - se rechaza la nueva"
+
+            logger.error(msg)
+
+            if callback:
+                callback(msg)
+
+            return {'exitos': 0, 'fallos': 0, 'desconocidos': 0, 'total': 0}
+
+        try:
+
+            with self.profiler.perfilar("procesar_usuarios"):
+
+                return self._procesar_usuarios(callback, reanudar, franja)
+
+        finally:
+
+            self._lock_ejecucion.release()
+
+    def _procesar_usuarios(self, callback=None, reanudar=None, franja=None):
+
+        """Carga el CSV y ficha a cada usuario, devolviendo el resumen de la ejecución"""
+
+        diario = reanudar
+
+        csv_file = (diario.info.get('csv') if diario else None) or self.config['csv_file']
+
+        if diario and diario.info.get('franja'):
+            franja = tuple(diario.info['franja'])
+
+        logger.info("\n" + "=" * 80)
+
+        logger.info("🚀 INICIANDO SISTEMA DE FICHAJE")
+
+        logger.info("=" * 80 + "\n")
+
+        if callback:
+            callback("Iniciando sistema de fichaje...")
+
+        # Verificar CSV
+
+        if not os.path.exists(csv_file):
+
+            msg = f"❌ No existe {csv_file}"
+
+            logger.error(msg)
+
+            if callback:
+                callback(msg)
+
+            return {'exitos': 0, 'fallos': 0, 'desconocidos': 0, 'total': 0}
+
+        # Cargar datos (el roster se lee en streaming; solo se cuenta y se validan las columnas)
+
+        roster = LectorRoster(csv_file, self.config.get('roster_cache_max', 100000))
+
+        try:
+
+            total = roster.total()
+
+            if total == 0:
+
+                logger.error("❌ El CSV está vacío")
+
+                if callback:
+                    callback("❌ El CSV está vacío")
+
+                return {'exitos': 0, 'fallos': 0, 'desconocidos': 0, 'total': 0}
+
+            logger.info(f"✅ Cargados {total} usuarios")
+
+            if callback:
+                callback(f"✅ Cargados {total} usuarios")
+
+        except Exception as e:
+
+            logger.error(f"❌ Error leyendo CSV: {e}")
+
+            if callback:
+                callback(f"❌ Error leyendo CSV: {e}")
+
+            return {'exitos': 0, 'fallos': 0, 'desconocidos': 0, 'total': 0}
+
+        # Turnos: en una ejecución programada solo se ficha a quien tiene turno en la franja
+
+        usuarios = roster
+
+        if franja:
+
+            seleccion = roster.seleccion_franja(franja)
+
+            if seleccion is not None:
+
+                sin_turno = roster.indice_franjas()['sin_turno']
+
+                total = len(seleccion) + sin_turno
+
+                msg = f"🕐 Franja {franja[0]} {franja[1]}: {len(seleccion)} usuarios con turno + {sin_turno} sin turno"
+
+                logger.info(msg)
+
+                if callback:
+                    callback(msg)
+
+                if total == 0:
+                    return {'exitos': 0, 'fallos': 0, 'desconocidos': 0, 'total': 0}
+
+                usuarios = (r for r in roster if r.turno is None or r.tarjeta in seleccion)
+
+        # Diario de ejecución: nuevo, o el de la ejecución que se reanuda
+
+        if diario is None:
+
+            diario = DiarioEjecucion.nuevo(self.config['journal_dir'], csv_file, total, self.config['journal_fsync'], franja)
+
+        else:
+
+            diario.reanudacion()
+
+            logger.info(f"🔁 Reanudando ejecución {diario.run_id}: {sum(map(diario.completado, diario.estados))} usuarios ya completados")
+
+            if callback:
+                callback(f"🔁 Reanudando ejecución {diario.run_id}")
+
+        # Enviar notificación de inicio
+
+        self.notifier.notify(
+
+            "Inicio de Proceso de Fichaje",
+
+            f"Iniciando proceso para {total} usuarios\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+
+            tipo="info"
+
+        )
+
+        # Sonda HTTP previa: si el portal no responde no se lanza Chrome para nadie
+
+        circuito = CircuitoPortal(self.config)
+
+        politica_circuito = self.config.get('circuito_politica', 'aplazar')
+
+        aplazados = 0
+
+        ok, detalle = circuito.sondear()
+
+        if ok:
+
+            logger.info(f"🌐 Portal accesible ({detalle})")
+
+        else:
+
+            msg = f"❌ El portal no responde ({detalle})"
+
+            logger.error(msg)
+
+            if callback:
+                callback(msg)
+
+            circuito.abrir(f"sonda inicial: {detalle}")
+
+            self.notifier.notify(
+
+                "Portal no disponible",
+
+                f"{self.config['url']} no responde: {detalle}\nUsuarios: {total} ({politica_circuito})\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+
+                tipo="error"
+
+            )
+
+        # Preparación: hasta la hora del horario se admiten más usuarios a la vez, porque
+        # cada uno queda esperando en Punto de Fichaje para fichar todos en ráfaga
+
+        objetivo = None if reanudar else self._objetivo_preparacion(franja)
+
+        plazas_preparacion = self.config.get('preparacion_max_usuarios', 10)
+
+        desfases = {}
+
+        if objetivo:
+
+            msg = (f"🎯 Preparación: login por adelantado y fichaje a las {datetime.fromtimestamp(objetivo).strftime('%H:%M:%S')} "
+                   f"(hasta {plazas_preparacion} usuarios esperando)")
+
+            logger.info(msg)
+
+            if callback:
+                callback(msg)
+
+        # Procesar: cada usuario en su propio thread con su Chrome, hasta el límite de concurrencia
+
+        controlador = self.controlador = ControladorConcurrencia.desde_config(self.config)
+
+        def limite():
+
+            if objetivo and self.reloj.ahora() < objetivo:
+                return max(controlador.limite, plazas_preparacion)
+
+            return controlador.limite
+
+        trabajadores = GrupoTrabajadores(limite)
+
+        lock_cuenta = threading.Lock()
+
+        cuenta = {'exitos': 0, 'fallos': 0, 'desconocidos': 0, 'duplicados': 0}
+
+        omitidos = 0
+
+        # Cola de reintentos: (instante listo, intento, usuario, contraseña, último resultado)
+
+        cola_reintentos = []
+
+        # Esperas en cola hacia el portal de esta ejecución y reparto de los inicios
+
+        self.metricas_trafico = MetricasEspera()
+
+        self.metricas_formulario = MetricasFormulario()
+
+        self.bloqueo.reiniciar()
+
+        self.vigilante.reiniciar()
+
+        self.supervisor.recolectar()
+
+        if self.sesiones:
+            self.sesiones.reiniciar()
+
+        ventana_reparto = self.config.get('portal_ventana_reparto_s', 0)
+
+        inicio_reparto = time.monotonic()
+
+        for i, registro in enumerate(usuarios):
+
+            usuario = registro.tarjeta
+
+            password = registro.contrasena
+
+            if diario.completado(usuario):
+
+                omitidos += 1
+
+                estado_previo = diario.estados[usuario]
+
+                logger.info(f"⏭ {usuario} ya completado en la ejecución {diario.run_id} ({estado_previo}) - se omite")
+
+                if estado_previo == 'fichando':
+                    logger.warning(f"⚠️ {usuario}: la ejecución se interrumpió durante el fichaje - revisar manualmente")
+
+                continue
+
+            # Idempotencia: no se lanza Chrome para quien ya fichó en la ventana configurada
+
+            motivo = self.indice_fichajes.reservar(usuario)
+
+            if motivo:
+
+                cuenta['duplicados'] += 1
+
+                diario.registrar(usuario, 'omitido', motivo)
+
+                logger.info(f"⏭ {usuario}: {motivo} - se omite")
+
+                if callback:
+                    callback(f"⏭ {usuario}: {motivo}")
+
+                continue
+
+            # Circuito abierto: el usuario se aplaza o falla al instante, sin lanzar Chrome
+
+            if not circuito.permitir():
+
+                self.indice_fichajes.liberar(usuario)
+
+                with lock_cuenta:
+
+                    cuenta['fallos'] += 1
+
+                    if politica_circuito == 'aplazar':
+                        heapq.heappush(cola_reintentos, (circuito.proxima_sonda, 0, usuario, password, False))
+
+                if politica_circuito == 'aplazar':
+
+                    aplazados += 1
+
+                    diario.registrar(usuario, 'error', "aplazado: portal no disponible")
+
+                    logger.info(f"⏸ {usuario}: portal no disponible - aplazado")
+
+                else:
+
+                    diario.registrar(usuario, 'error', "portal no disponible")
+
+                    self.guardar_resultado(usuario, "ERROR", "Portal no disponible (circuito abierto)", "")
+
+                    logger.info(f"⛔ {usuario}: portal no disponible - se marca como fallido")
+
+                continue
+
+            logger.info(f"\n{'=' * 80}")
+
+            logger.info(f"📋 USUARIO {i + 1}/{total}: {usuario}")
+
+            logger.info(f"{'=' * 80}")
+
+            if callback:
+                callback(f"\n{'=' * 60}\n📋 Procesando {i + 1}/{total}: {usuario}\n{'=' * 60}")
+
+            # Reparto determinista: el usuario i no empieza antes de i/total de la ventana
+
+            if ventana_reparto > 0:
+
+                espera = inicio_reparto + ventana_reparto * i / total - time.monotonic()
+
+                if espera > 0:
+
+                    logger.info(f"⏳ Reparto de carga: {usuario} empieza en {espera:.0f}s")
+
+                    time.sleep(espera)
+
+                self.metricas_trafico.registrar('reparto', max(0.0, espera))
+
+            def fichar(usuario, password):
+
+                driver = None
+
+                try:
+
+                    resultado, motivo, driver = self._intento_fichaje(usuario, password, None, callback, diario, objetivo)
+
+                finally:
+
+                    self.indice_fichajes.liberar(usuario)
+
+                    if driver:
+
+                        try:
+
+                            driver.quit()
+
+                        except:
+
+                            pass
+
+                controlador.observar_resultado(motivo in MOTIVOS_SOBRECARGA)
+
+                circuito.registrar(motivo)
+
+                envio = self.instantes_envio.pop(usuario, None)
+
+                if objetivo and envio:
+                    logger.info(f"🎯 {usuario}: fichaje enviado {1000 * (envio - objetivo):+.0f} ms respecto a la hora objetivo")
+
+                with lock_cuenta:
+
+                    if objetivo and envio:
+                        desfases[usuario] = round(envio - objetivo, 3)
+
+                    cuenta[CLAVE_RESULTADO[resultado]] += 1
+
+                    if self._es_reintentable(resultado, motivo):
+                        heapq.heappush(cola_reintentos, (time.monotonic() + self._espera_reintento(1), 1, usuario, password, resultado))
+
+            trabajadores.lanzar(fichar, usuario, password)
+
+            pausa = self.config.get('pausa_entre_usuarios_s', 3)
+
+            if pausa > 0 and i < total - 1 and circuito.estado == CircuitoPortal.CERRADO:
+                logger.info(f"⏸ Pausa de {pausa:g} segundos...")
+
+                time.sleep(pausa)
+
+        trabajadores.esperar()
+
+        self.controlador = None
+
+        controlador.exportar(self.config.get('concurrencia_export'), diario.run_id)
+
+        # Reintentos de los fallos transitorios, detrás de los usuarios nuevos (de uno en uno)
+
+        driver, reintentos = self._procesar_reintentos(cola_reintentos, None, callback, diario, cuenta, circuito)
+
+        exitos, fallos, desconocidos, duplicados = cuenta['exitos'], cuenta['fallos'], cuenta['desconocidos'], cuenta['duplicados']
+
+        # Cerrar driver
+
+        if driver:
+
+            try:
+
+                driver.quit()
+
+                logger.info("🔚 Driver cerrado")
+
+            except:
+
+                pass
+
+        # Resumen
+
+        logger.info("\n" + "=" * 80)
+
+        logger.info("📊 RESUMEN FINAL")
+
+        logger.info("=" * 80)
+
+        logger.info(f"✅ Exitosos: {exitos}")
+
+        logger.info(f"❌ Fallidos: {fallos}")
+
+        logger.info(f"⚠️ Desconocidos: {desconocidos}")
+
+        logger.info(f"📁 Total: {total}")
+
+        if omitidos:
+            logger.info(f"⏭ Omitidos (ya completados): {omitidos}")
+
+        if duplicados:
+            logger.info(f"⏭ Omitidos (ya fichados en la ventana): {duplicados}")
+
+        if reintentos['intentos']:
+            logger.info(f"🔄 Reintentos: {reintentos['intentos']} intentos, {reintentos['recuperados']} recuperados, {reintentos['agotados']} agotados")
+
+        trafico = self.metricas_trafico.resumen()
+
+        for tipo, m in trafico.items():
+            logger.info(f"🚦 Cola {tipo}: {m['n']} peticiones, espera media {m['media_ms']:.0f} ms, p95 {m['p95_ms']:.0f} ms, máx {m['max_ms']:.0f} ms")
+
+        formulario = self.metricas_formulario.resumen()
+
+        for modo, m in formulario.items():
+            logger.info(f"📝 Login {modo}: {m['logins']} logins, {m['media']:.1f} llamadas al driver de media (máx {m['max']})")
+
+        preparacion = None
+
+        if objetivo:
+
+            valores = list(desfases.values())
+
+            preparacion = {
+
+                'objetivo': datetime.fromtimestamp(objetivo).isoformat(timespec='seconds'),
+
+                'enviados': len(valores),
+
+                'desfase_medio_s': round(sum(valores) / len(valores), 3) if valores else None,
+
+                'desfase_max_s': max(valores, key=abs) if valores else None,
+
+                'desfases_s': desfases
+
+            }
+
+            if valores:
+                logger.info(f"🎯 Preparación: {len(valores)} fichajes enviados, desfase medio {1000 * preparacion['desfase_medio_s']:+.0f} ms, "
+                            f"máximo {1000 * preparacion['desfase_max_s']:+.0f} ms")
+
+        vigilante = self.vigilante.resumen()
+
+        if vigilante['colgados'] or vigilante['reciclados']:
+            logger.info(f"⏱️ Navegadores reemplazados: {vigilante['colgados']} por bloqueo, {vigilante['reciclados']} por memoria")
+
+        if vigilante['pico_rss_mb']:
+            logger.info(f"🧠 Memoria: pico {vigilante['pico_rss_mb']:.0f} MB (Python + navegadores), "
+                        f"máximo por navegador {vigilante['pico_driver_mb']:.0f} MB")
+
+        reloj = self.reloj.resumen() if self.reloj.activo else None
+
+        if reloj:
+            logger.info(f"🕰 {self.reloj.texto()}")
+
+        sesiones = self.sesiones.resumen() if self.sesiones else None
+
+        if sesiones and sesiones['consultas']:
+            logger.info(f"🍪 Sesiones: {sesiones['restauradas']}/{sesiones['consultas']} restauradas "
+                        f"({sesiones['tasa_acierto']:.0%}), ~{sesiones['segundos_ahorrados']:.0f}s ahorrados")
+
+        red = self.bloqueo.resumen() if self.bloqueo.activo else None
+
+        if red:
+            logger.info(f"🧱 Red: {red['bloqueadas']} peticiones bloqueadas, {red['permitidas']} permitidas, "
+                        f"{red['bytes_descargados'] / 1024:.0f} KB descargados, ~{red['bytes_ahorrados'] / 1024:.0f} KB ahorrados")
+
+        estado_circuito = dict(circuito.resumen(), aplazados=aplazados)
+
+        if circuito.aperturas:
+            logger.info(f"🔌 Circuito del portal: {circuito.aperturas} aperturas, {aplazados} usuarios aplazados, estado final {circuito.estado}")
+
+        concurrencia = controlador.resumen()
+
+        if concurrencia['pico'] > 1:
+            logger.info(f"⚙️ Concurrencia: pico {concurrencia['pico']}, final {concurrencia['limite_final']} ({concurrencia['decisiones']} decisiones)")
+
+        logger.info("=" * 80 + "\n")
+
+        if callback:
+            callback(f"\n{'=' * 60}\n📊 RESUMEN FINAL\n{'=' * 60}")
+
+            callback(f"✅ Exitosos: {exitos}")
+
+            callback(f"❌ Fallidos: {fallos}")
+
+            callback(f"⚠️ Desconocidos: {desconocidos}")
+
+            callback(f"📁 Total procesados: {total}")
+
+            if omitidos:
+                callback(f"⏭ Omitidos (ya completados): {omitidos}")
+
+            if duplicados:
+                callback(f"⏭ Omitidos (ya fichados en la ventana): {duplicados}")
+
+            if reintentos['intentos']:
+                callback(f"🔄 Reintentos: {reintentos['intentos']} intentos, {reintentos['recuperados']} recuperados, {reintentos['agotados']} agotados")
+
+            callback(f"📄 Resultados en: {self.config['results_file']}")
+
+            callback(f"{'=' * 60}\n")
+
+        # Enviar notificación de resumen
+
+        resumen_msg = f"""Total procesados: {total}
+
+✅ Exitosos: {exitos}
+
+❌ Fallidos: {fallos}
+
+⚠️ Desconocidos: {desconocidos}
+
+🔄 Reintentos: {reintentos['intentos']} ({reintentos['recuperados']} recuperados, {reintentos['agotados']} agotados)
+
+
+
+Archivo de resultados: {self.config['results_file']}
+
+Fecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"""
+
+        tipo_resumen = "success" if fallos == 0 else "warning" if exitos > 0 else "error"
+
+        self.notifier.notify("Resumen de Fichajes", resumen_msg, tipo=tipo_resumen)
+
+        resumen = {'exitos': exitos, 'fallos': fallos, 'desconocidos': desconocidos, 'total': total,
+
+                   'omitidos': omitidos, 'duplicados': duplicados, 'reintentos': reintentos, 'trafico': trafico,
+
+                   'formulario': formulario, 'concurrencia': concurrencia, 'circuito': estado_circuito, 'red': red,
+
+                   'sesiones': sesiones, 'preparacion': preparacion, 'reloj': reloj,
+
+                   'vigilante': vigilante, 'run_id': diario.run_id}
+
+        diario.finalizar(resumen)
+
+        return resumen
+
+    def _intento_fichaje(self, usuario, password, driver, callback, diario, objetivo=None):
+
+        """Un intento de fichaje con un Chrome nuevo; devuelve (resultado, motivo de fallo, driver)
+
+        Con 'objetivo' (epoch), el usuario queda en Punto de Fichaje hasta ese instante.
+        """
+
+        self.motivos_fallo.pop(usuario, None)
+
+        self.instantes_envio.pop(usuario, None)
+
+        def antes_de_fichar():
+
+            if objetivo:
+                self._esperar_objetivo(usuario, objetivo, callback)
+
+            diario.registrar(usuario, 'fichando')
+
+        try:
+
+            if driver:
+
+                try:
+
+                    driver.quit()
+
+                except:
+
+                    pass
+
+                time.sleep(2)
+
+            diario.registrar(usuario, 'en_curso')
+
+            driver = self.start_driver(self.config['headless'])
+
+            resultado = self.realizar_fichaje(usuario, password, driver, callback, antes_de_fichar)
+
+            diario.registrar(usuario, {True: 'exito', False: 'error'}.get(resultado, 'desconocido'))
+
+            return resultado, self.motivos_fallo.pop(usuario, None), driver
+
+        except Exception as e:
+
+            logger.error(f"❌ Error crítico procesando {usuario}: {e}")
+
+            if callback:
+                callback(f"❌ Error crítico: {str(e)[:50]}")
+
+            # Si ya se había pulsado 'Realizar Fichaje' no se reintenta
+
+            if diario.estados.get(usuario) == 'fichando':
+
+                mensaje = f"Error tras enviar el fichaje: {str(e)[:100]} - revisar manualmente"
+
+                diario.registrar(usuario, 'desconocido', mensaje)
+
+                self.guardar_resultado(usuario, "DESCONOCIDO", mensaje, "")
+
+                return None, MOTIVO_ENVIADO, driver
+
+            diario.registrar(usuario, 'error', str(e))
+
+            self.guardar_resultado(usuario, "ERROR", f"Error crítico: {str(e)[:100]}", "")
+
+            # Casi siempre es Chrome/ChromeDriver que no arranca: se trata como caída de Chrome
+
+            return False, MOTIVO_CHROME, driver
+
+    def _objetivo_preparacion(self, franja):
+
+        """Instante de la franja si la ejecución llega con adelanto de preparación (si no, None)"""
+
+        adelanto = self.config.get('preparacion_adelanto_s', 0)
+
+        if not adelanto or not franja:
+            return None
+
+        self.reloj.calibrar_si_toca()
+
+        ahora = self.reloj.ahora()
+
+        objetivo = proxima_hora_local(franja[1], franja[0], ahora)
+
+        # Margen por si el programador despertó un poco antes o después de lo previsto
+
+        if objetivo is None or objetivo > ahora + adelanto + 60:
+            return None
+
+        return objetivo
+
+    def _esperar_objetivo(self, usuario, objetivo, callback=None):
+
+        """Mantiene al usuario en Punto de Fichaje hasta el instante objetivo (hora del servidor)"""
+
+        espera = objetivo - self.reloj.ahora()
+
+        if espera <= 0:
+            return
+
+        logger.info(f"🅿️ {usuario} preparado en Punto de Fichaje - ficha en {espera:.1f}s")
+
+        if callback:
+            callback(f"🅿️ {usuario} preparado - ficha a las {datetime.fromtimestamp(objetivo).strftime('%H:%M:%S')}")
+
+        # Sueño largo hasta casi el instante y el último tramo en pasos cortos
+
+        if espera > 0.05:
+            time.sleep(espera - 0.05)
+
+        while self.reloj.ahora() < objetivo:
+            time.sleep(0.001)
+
+    def _es_reintentable(self, resultado, motivo):
+
+        """Indica si un fallo es transitorio según CONFIG['reintentos_motivos']"""
+
+        if resultado is True or motivo == MOTIVO_ENVIADO:
+            return False
+
+        return motivo in self.config.get('reintentos_motivos', ())
+
+    def _espera_reintento(self, intento):
+
+        """Backoff exponencial con jitter: mitad fija y mitad aleatoria, con tope en reintentos_max_s"""
+
+        base = self.config.get('reintentos_base_s', 30)
+
+        tope = min(self.config.get('reintentos_max_s', 300), base * (2 ** (intento - 1)))
+
+        return tope / 2 + random.uniform(0, tope / 2)
+
+    def _procesar_reintentos(self, cola, driver, callback, diario, cuenta, circuito=None):
+
+        """Reintenta los fallos transitorios por orden de vencimiento dentro del presupuesto de la ejecución"""
+
+        stats = {'intentos': 0, 'recuperados': 0, 'agotados': 0}
+
+        if not cola:
+            return driver, stats
+
+        max_intentos = self.config.get('reintentos_max', 2)
+
+        limite = time.monotonic() + self.config.get('reintentos_presupuesto_s', 900)
+
+        logger.info(f"\n🔄 {len(cola)} usuarios pendientes de reintento")
+
+        if callback:
+            callback(f"\n🔄 {len(cola)} usuarios pendientes de reintento")
+
+        while cola:
+
+            listo, intento, usuario, password, previo = heapq.heappop(cola)
+
+            if intento > max_intentos or listo > limite:
+
+                stats['agotados'] += 1
+
+                causa = "sin intentos" if intento > max_intentos else "fuera del presupuesto de tiempo"
+
+                logger.warning(f"⛔ {usuario}: reintentos agotados ({causa})")
+
+                if callback:
+                    callback(f"⛔ {usuario}: reintentos agotados ({causa})")
+
+                # Un aplazado que nunca llegó a intentarse deja constancia en resultados
+
+                if intento == 0:
+                    self.guardar_resultado(usuario, "ERROR", "Portal no disponible (circuito abierto)", "")
+
+                continue
+
+            espera = listo - time.monotonic()
+
+            if espera > 0:
+
+                logger.info(f"⏳ Esperando {espera:.0f}s para reintentar a {usuario}")
+
+                time.sleep(espera)
+
+            # Con el circuito abierto se espera a la siguiente sonda sin gastar intento
+
+            if circuito and not circuito.permitir():
+
+                if self.config.get('circuito_politica', 'aplazar') == 'fallar':
+
+                    stats['agotados'] += 1
+
+                    logger.warning(f"⛔ {usuario}: portal no disponible - no se reintenta")
+
+                else:
+
+                    heapq.heappush(cola, (max(circuito.proxima_sonda, time.monotonic()), intento, usuario, password, previo))
+
+                continue
+
+            # Otro proceso pudo ficharlo mientras tanto
+
+            motivo = self.indice_fichajes.reservar(usuario)
+
+            if motivo:
+
+                cuenta[CLAVE_RESULTADO[previo]] -= 1
+
+                cuenta['duplicados'] += 1
+
+                diario.registrar(usuario, 'omitido', motivo)
+
+                logger.info(f"⏭ {usuario}: {motivo} - no se reintenta")
+
+                continue
+
+            if intento == 0:
+
+                logger.info(f"\n▶️ USUARIO APLAZADO: {usuario}")
+
+                if callback:
+                    callback(f"\n▶️ Usuario aplazado: {usuario}")
+
+            else:
+
+                stats['intentos'] += 1
+
+                logger.info(f"\n🔄 REINTENTO {intento}/{max_intentos}: {usuario}")
+
+                if callback:
+                    callback(f"\n🔄 Reintento {intento}/{max_intentos}: {usuario}")
+
+            try:
+
+                resultado, motivo, driver = self._intento_fichaje(usuario, password, driver, callback, diario)
+
+            finally:
+
+                self.indice_fichajes.liberar(usuario)
+
+            if circuito:
+                circuito.registrar(motivo)
+
+            # El resumen refleja el último resultado de cada usuario
+
+            cuenta[CLAVE_RESULTADO[previo]] -= 1
+
+            cuenta[CLAVE_RESULTADO[resultado]] += 1
+
+            if resultado is True:
+
+                if intento > 0:
+                    stats['recuperados'] += 1
+
+            elif self._es_reintentable(resultado, motivo):
+
+                heapq.heappush(cola, (time.monotonic() + self._espera_reintento(intento + 1), intento + 1, usuario, password, resultado))
+
+        return driver, stats
+
+
+# ==================== PROGRAMADOR DE HORARIOS ====================
+
+# Mapeo de días a datetime.weekday()
+
+DIAS_NUMERO = {
+
+    'L': 0,
+
+    'M': 1,
+
+    'X': 2,
+
+    'J': 3,
+
+    'V': 4,
+
+    'S': 5,
+
+    'D': 6
+
+}
+
+DIAS_SEMANA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+TODOS_LOS_DIAS = ["L", "M", "X", "J", "V", "S", "D"]
+
+
+def cargar_horarios(config_file):
+    """Carga los horarios guardados en horarios_config.json"""
+
+    try:
+
+        if os.path.exists(config_file):
+            with open(config_file, 'r') as f:
+                return json.load(f).get("horarios", [])
+
+    except Exception as e:
+
+        logger.error(f"❌ Error cargando horarios: {e}")
+
+    return []
+
+
+def guardar_horarios(config_file, horarios):
+    """Guarda los horarios en horarios_config.json"""
+
+    try:
+
+        with open(config_file, 'w') as f:
+
+            json.dump({"horarios": horarios}, f, indent=4)
+
+    except Exception as e:
+
+        print(f"Error guardando config: {e}")
+
+
+def instante_local(fecha, hora, minuto, segundo):
+    """Epoch de una hora local; en el cambio de hora usa la primera ocurrencia o el final del hueco"""
+
+    validos = []
+
+    candidatos = []
+
+    for isdst in (0, 1):
+
+        instante = time.mktime((fecha.year, fecha.month, fecha.day, hora, minuto, segundo, 0, 0, isdst))
+
+        candidatos.append(instante)
+
+        if time.localtime(instante)[3:6] == (hora, minuto, segundo):
+            validos.append(instante)
+
+    # Hora repetida (otoño): la primera; hora inexistente (primavera): la posterior al salto
+
+    return min(validos) if validos else max(candidatos)
+
+
+def proxima_hora_local(horario, dias, desde):
+    """Próximo epoch posterior a 'desde' con la hora 'HH:MM[:SS]' en uno de los días (letras L..D)"""
+
+    partes = [int(p) for p in horario.split(':')]
+
+    hora, minuto, segundo = (partes + [0, 0])[:3]
+
+    numeros = {DIAS_NUMERO[d] for d in dias if d in DIAS_NUMERO}
+
+    if not numeros:
+        return None
+
+    fecha = datetime.fromtimestamp(desde).date()
+
+    for delta in range(8):
+
+        dia = fecha + timedelta(days=delta)
+
+        if dia.weekday() in numeros:
+
+            instante = instante_local(dia, hora, minuto, segundo)
+
+            if instante > desde:
+                return instante
+
+    return None
+
+
+def ultima_hora_local(horario, dias, hasta):
+    """Última ocurrencia (epoch) no posterior a 'hasta' de la hora 'HH:MM[:SS]' en uno de los días"""
+
+    partes = [int(p) for p in horario.split(':')]
+
+    hora, minuto, segundo = (partes + [0, 0])[:3]
+
+    numeros = {DIAS_NUMERO[d] for d in dias if d in DIAS_NUMERO}
+
+    fecha = datetime.fromtimestamp(hasta).date()
+
+    for delta in range(8):
+
+        dia = fecha - timedelta(days=delta)
+
+        if dia.weekday() in numeros:
+
+            instante = instante_local(dia, hora, minuto, segundo)
+
+            if instante <= hasta:
+                return instante
+
+    return None
+
+
+def inicio_dia_siguiente(instante):
+    """Epoch de las 00:00 locales del día siguiente a 'instante'"""
+
+    return instante_local(datetime.fromtimestamp(instante).date() + timedelta(days=1), 0, 0, 0)
+
+
+class TareaProgramada:
+    """Un horario activo dentro de la cola del programador
+
+    'ocurrencia' es la hora nominal que toca y 'proxima' cuándo se dispara: coinciden salvo
+    con preparación (se dispara 'adelanto' segundos antes) o al recuperar una ejecución
+    perdida, que se dispara ya pero cuenta como la ocurrencia perdida.
+    """
+
+    __slots__ = ('horario', 'dias', 'obj', 'adelanto', 'proxima', 'ocurrencia', 'ultimo_disparo')
+
+    def __init__(self, horario_obj, adelanto=0):
+
+        self.obj = horario_obj
+
+        self.adelanto = adelanto
+
+        self.horario = horario_obj["horario"]
+
+        self.dias = horario_obj.get("dias", TODOS_LOS_DIAS)
+
+        self.proxima = None
+
+        self.ocurrencia = None
+
+        self.ultimo_disparo = None
+
+    @property
+    def id(self):
+
+        return f"{self.horario}|{''.join(self.dias)}"
+
+    def planificar(self, desde):
+
+        """Calcula la próxima ejecución; tras un disparo, nunca antes del día siguiente"""
+
+        if self.ultimo_disparo is not None:
+            desde = max(desde, inicio_dia_siguiente(self.ultimo_disparo) - 1)
+
+        self.ocurrencia = proxima_hora_local(self.horario, self.dias, desde)
+
+        self.proxima = None if self.ocurrencia is None else self.ocurrencia - self.adelanto
+
+        return self.proxima
+
+
+class AlmacenTareas:
+    """Estado persistente de las tareas del programador (scheduler_jobs.json)
+
+    Por tarea guarda la próxima ocurrencia pendiente y el último disparo completado, de modo
+    que al arrancar se sabe qué ejecuciones se perdieron sin recorrerlas una a una.
+    """
+
+    def __init__(self, ruta, solo_lectura=False):
+
+        self.ruta = ruta
+
+        self.solo_lectura = solo_lectura
 
-            )
+    def cargar(self):
 
-            return False
+        try:
 
-    def procesar_usuarios(self, callback=None):
+            if os.path.exists(self.ruta):
+                with open(self.ruta, 'r', encoding='utf-8') as f:
+                    return json.load(f).get("tareas", {})
 
-        """Procesa todos los usuarios del CSV"""
+        except (OSError, ValueError) as e:
 
-        logger.info("\n" + "=" * 80)
+            logger.error(f"❌ Error cargando {self.ruta}: {e}")
 
-        logger.info("🚀 INICIANDO SISTEMA DE FICHAJE")
+        return {}
 
-        logger.info("=" * 80 + "\n")
+    def guardar(self, tareas):
 
-        if callback:
-            callback("Iniciando sistema de fichaje...")
+        self._escribir({
 
-        # Verificar CSV
+            t.id: {'horario': t.horario, 'proxima': t.ocurrencia, 'ultimo': t.ultimo_disparo}
 
-        if not os.path.exists(self.config['csv_file']):
+            for t in tareas
 
-            msg = f"❌ No existe {self.config['csv_file']}"
+        })
 
-            logger.error(msg)
+    def registrar_disparo(self, tarea):
 
-            if callback:
-                callback(msg)
+        """Anota el disparo de una tarea que ya no está en la cola (se reprogramó o se detuvo durante la ejecución)"""
 
-            return {'exitos': 0, 'fallos': 0, 'desconocidos': 0, 'total': 0}
+        registros = self.cargar()
+
+        registro = registros.setdefault(tarea.id, {'horario': tarea.horario, 'proxima': tarea.ocurrencia})
+
+        registro['ultimo'] = max(registro.get('ultimo') or 0, tarea.ultimo_disparo)
 
-        # Cargar datos
+        self._escribir(registros)
+
+    def _escribir(self, registros):
+
+        if self.solo_lectura:
+            return
 
         try:
 
-            df = pd.read_csv(self.config['csv_file'])
+            temporal = self.ruta + ".tmp"
 
-            if df.empty:
+            with open(temporal, 'w', encoding='utf-8') as f:
 
-                logger.error("❌ El CSV está vacío")
+                json.dump({"tareas": registros}, f, indent=4)
 
-                if callback:
-                    callback("❌ El CSV está vacío")
+            os.replace(temporal, self.ruta)
 
-                return {'exitos': 0, 'fallos': 0, 'desconocidos': 0, 'total': 0}
+        except OSError as e:
 
-            logger.info(f"✅ Cargados {len(df)} usuarios")
+            logger.error(f"❌ Error guardando {self.ruta}: {e}")
 
-            if callback:
-                callback(f"✅ Cargados {len(df)} usuarios")
 
-        except Exception as e:
+class ProgramadorHorarios:
+    """Programador de tareas independiente de la interfaz (lo usan la GUI y el modo daemon)
 
-            logger.error(f"❌ Error leyendo CSV: {e}")
+    Las tareas están en una cola de prioridad ordenada por hora: el thread duerme hasta la
+    siguiente (o como mucho scheduler_max_espera_s, para detectar saltos del reloj) y se
+    despierta en cuanto cambian los horarios.
+    """
 
-            if callback:
-                callback(f"❌ Error leyendo CSV: {e}")
+    # Diferencia entre reloj de pared y monotónico a partir de la cual se considera un salto
 
-            return {'exitos': 0, 'fallos': 0, 'desconocidos': 0, 'total': 0}
+    SALTO_RELOJ_S = 2
 
-        # Enviar notificación de inicio
+    def __init__(self, engine, horarios, on_tarea, log=None, solo_lectura=False):
 
-        self.notifier.notify(
+        self.engine = engine
 
-            "Inicio de Proceso de Fichaje",
+        self.horarios = horarios
 
-            f"Iniciando proceso para {len(df)} usuarios\nFecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+        self.on_tarea = on_tarea
 
-            tipo="info"
+        self.log = log or logger.info
 
-        )
+        self.almacen = AlmacenTareas(engine.config['jobstore_file'], solo_lectura)
 
-        # Procesar
+        self._tareas = []
 
-        driver = None
+        self.running = False
 
-        exitos = 0
+        self.thread = None
 
-        fallos = 0
+        self._cola = []
 
-        desconocidos = 0
+        self._secuencia = 0
 
-        for i, row in df.iterrows():
+        # Cambia con cada reprogramación: invalida las tareas que estaban ejecutándose
 
-            usuario = str(row["tarjeta"]).strip()
+        self._generacion = 0
 
-            password = str(row["contrasena"]).strip()
+        self._cond = threading.Condition()
 
-            logger.info(f"\n{'=' * 80}")
+    def programar_tareas(self):
 
-            logger.info(f"📋 USUARIO {i + 1}/{len(df)}: {usuario}")
+        """Programa todas las tareas con días específicos y devuelve la próxima ejecución"""
 
-            logger.info(f"{'=' * 80}")
+        ahora = self.engine.reloj.ahora()
 
-            if callback:
-                callback(f"\n{'=' * 60}\n📋 Procesando {i + 1}/{len(df)}: {usuario}\n{'=' * 60}")
+        registros = self.almacen.cargar()
 
-            try:
+        tareas = []
 
-                if driver:
+        cola = []
+
+        for h in self.horarios:
+
+            if h["activo"]:
+
+                tarea = TareaProgramada(h, self.engine.config.get('preparacion_adelanto_s', 0))
+
+                registro = registros.get(tarea.id, {})
+
+                tarea.ultimo_disparo = registro.get('ultimo')
+
+                if tarea.planificar(ahora) is not None:
+
+                    self._aplicar_misfire(tarea, registro.get('proxima'), ahora)
+
+                    tareas.append(tarea)
+
+                    cola.append(self._entrada(tarea))
+
+                dias_texto = ', '.join(tarea.dias)
+
+                self.log(f"⏰ Programado: {tarea.horario} - Días: {dias_texto}")
+
+        heapq.heapify(cola)
+
+        self._comprobar_turnos(tareas)
+
+        with self._cond:
+
+            self._tareas = tareas
+
+            self._cola = cola
+
+            self._generacion += 1
+
+            # Despertar al thread: puede que la siguiente tarea sea ahora anterior
+
+            self._cond.notify_all()
+
+            self.almacen.guardar(tareas)
+
+        return self.proxima_ejecucion()
+
+    def _comprobar_turnos(self, tareas):
+
+        """Precalcula el índice de turnos del roster y avisa de los turnos que ningún horario cubre"""
+
+        config = self.engine.config
+
+        try:
+
+            indice = LectorRoster(config['csv_file'], config.get('roster_cache_max', 100000)).indice_franjas()
+
+        except (OSError, RosterError):
+
+            return
+
+        cubiertas = {(dia, normalizar_hora(t.horario)) for t in tareas for dia in t.dias}
+
+        dias_cubiertos = {dia for dia, _ in cubiertas}
+
+        for (dia, hora), tarjetas in sorted(indice['franjas'].items(), key=lambda e: (DIAS_NUMERO[e[0][0]], e[0][1] or "")):
+
+            cubierta = dia in dias_cubiertos if hora is None else (dia, hora) in cubiertas
+
+            if not cubierta:
+                self.log(f"⚠️ Turno {dia} {hora or '(cualquier hora)'} de {len(tarjetas)} usuarios sin horario programado")
+
+    def _aplicar_misfire(self, tarea, pendiente, ahora):
+
+        """Decide si se recupera una ejecución perdida mientras el programador no corría"""
+
+        if pendiente is None or pendiente > ahora:
+            return
+
+        if tarea.ultimo_disparo is not None and pendiente <= tarea.ultimo_disparo:
+            return
+
+        politica = tarea.obj.get("misfire", self.engine.config.get('misfire_politica', 'coalescer'))
+
+        gracia = self.engine.config.get('misfire_gracia_s', 3600)
+
+        texto = datetime.fromtimestamp(pendiente).strftime('%d/%m/%Y %H:%M:%S')
+
+        if politica == 'una_vez':
+
+            # Solo la primera ejecución perdida, si aún está dentro de la ventana de gracia
+
+            ocurrencia = pendiente
+
+        elif politica == 'coalescer':
+
+            # Todas las perdidas se funden en una, la más reciente
+
+            ocurrencia = ultima_hora_local(tarea.horario, tarea.dias, ahora) or pendiente
+
+        else:
+
+            self.log(f"⏭ Ejecución perdida de {tarea.horario} ({texto}) - se omite")
+
+            return
+
+        retraso = ahora - ocurrencia
+
+        if retraso > gracia:
+
+            self.log(f"⏭ Ejecución perdida de {tarea.horario} ({texto}) fuera de la ventana de gracia - se omite")
+
+            return
+
+        self.log(f"⚡ Ejecución perdida de {tarea.horario} ({texto}) - se ejecuta ahora ({retraso / 60:.0f} min de retraso)")
+
+        tarea.ocurrencia = ocurrencia
+
+        tarea.proxima = ahora
+
+    def _entrada(self, tarea):
+
+        # La secuencia desempata tareas a la misma hora sin comparar objetos
+
+        self._secuencia += 1
+
+        return (tarea.proxima, self._secuencia, tarea)
+
+    def proxima_ejecucion(self):
+
+        """Devuelve el datetime de la próxima tarea programada (o None)"""
+
+        with self._cond:
+
+            if not self._cola:
+                return None
+
+            return datetime.fromtimestamp(self._cola[0][0])
+
+    def _tarea_programada(self, horario_str, horario_obj, franja=None):
+
+        """Registra la ejecución en horarios_config.json y lanza la tarea para su franja"""
+
+        horario_obj["ultima_ejecucion"] = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+
+        guardar_horarios(self.engine.config['config_file'], self.horarios)
+
+        self.on_tarea(horario_str, horario_obj, franja)
+
+    def iniciar(self, bloquear=False):
+
+        """Arranca el bucle del scheduler (en un thread en segundo plano salvo bloquear=True)"""
+
+        self.running = True
+
+        if bloquear:
+
+            self._run_scheduler()
+
+            return
+
+        self.thread = threading.Thread(target=self._run_scheduler)
+
+        self.thread.daemon = True
+
+        self.thread.start()
+
+    def detener(self):
+
+        """Detiene el bucle y elimina las tareas programadas"""
+
+        with self._cond:
+
+            self.running = False
+
+            self._cola = []
+
+            self._tareas = []
+
+            self._generacion += 1
+
+            self._cond.notify_all()
+
+    def _vencidas(self):
+
+        """Espera hasta que venza alguna tarea y devuelve (generación, tareas vencidas); vacía si hay que parar"""
+
+        max_espera = self.engine.config.get('scheduler_max_espera_s', 60)
+
+        with self._cond:
+
+            while self.running:
+
+                pared, mono = time.time(), time.monotonic()
+
+                # Las horas de la cola son del reloj del servidor del portal (calibrado)
+
+                servidor = self.engine.reloj.ahora()
+
+                if self._cola and self._cola[0][0] <= servidor:
+
+                    vencidas = []
+
+                    while self._cola and self._cola[0][0] <= servidor:
+                        vencidas.append(heapq.heappop(self._cola)[2])
+
+                    return self._generacion, vencidas
+
+                espera = min(self._cola[0][0] - servidor, max_espera) if self._cola else max_espera
+
+                self._cond.wait(espera)
+
+                # wait() mide con el reloj monotónico: si el de pared avanzó distinto, hubo un salto
+
+                salto = (time.time() - pared) - (time.monotonic() - mono)
+
+                if abs(salto) > self.SALTO_RELOJ_S:
+                    self._replanificar_tras_salto(salto)
+
+        return self._generacion, []
+
+    def _replanificar_tras_salto(self, salto):
+
+        """Recalcula todas las tareas tras un cambio brusco del reloj de pared"""
+
+        self.log(f"⚠️ Salto del reloj de {salto:+.0f}s detectado - replanificando tareas")
+
+        ahora = self.engine.reloj.ahora()
+
+        tareas = [entrada[2] for entrada in self._cola]
+
+        # Hacia delante se mantienen las vencidas (se ejecutan ya); hacia atrás se recalculan
+
+        self._cola = [self._entrada(t) for t in tareas if t.proxima <= ahora or t.planificar(ahora) is not None]
+
+        heapq.heapify(self._cola)
+
+    def _run_scheduler(self):
+
+        """Loop del scheduler"""
+
+        with self.engine.profiler.perfilar("scheduler", muestreo=True):
+
+            while self.running:
+
+                # La calibración tarda unos segundos: va en su propio thread para no retrasar tareas
+
+                if self.engine.reloj.toca_calibrar():
+                    threading.Thread(target=self.engine.reloj.calibrar, daemon=True).start()
+
+                self.engine.supervisor.recolectar_si_toca()
+
+                generacion, vencidas = self._vencidas()
+
+                for tarea in vencidas:
 
                     try:
 
-                        driver.quit()
+                        self._tarea_programada(tarea.horario, tarea.obj, franja_de(tarea.ocurrencia, tarea.horario))
 
-                    except:
+                    except Exception as e:
 
-                        pass
+                        logger.error(f"❌ Error en la tarea programada {tarea.horario}: {e}")
 
-                    time.sleep(2)
+                    tarea.ultimo_disparo = tarea.ocurrencia
 
-                driver = self.start_driver(self.config['headless'])
+                    with self._cond:
 
-                resultado = self.realizar_fichaje(usuario, password, driver, callback)
+                        # Si se reprogramó o detuvo mientras se ejecutaba, la tarea ya no pertenece a la cola
 
-                if resultado is True:
+                        if not self.running or generacion != self._generacion:
 
-                    exitos += 1
+                            for actual in self._tareas:
 
-                elif resultado is False:
+                                if actual.id == tarea.id:
+                                    actual.ultimo_disparo = max(actual.ultimo_disparo or 0, tarea.ultimo_disparo)
 
-                    fallos += 1
+                            self.almacen.registrar_disparo(tarea)
 
-                else:
+                            continue
 
-                    desconocidos += 1
+                        if tarea.planificar(self.engine.reloj.ahora()) is not None:
+                            heapq.heappush(self._cola, self._entrada(tarea))
 
+                        self.almacen.guardar(self._tareas)
 
 
-            except Exception as e:
+class EjecutorTareas:
+    """Lanza las ejecuciones (programadas y manuales) fuera del thread del programador
 
-                logger.error(f"❌ Error crítico procesando {usuario}: {e}")
+    Si ya hay una ejecución en marcha, la política de solapamiento decide: 'omitir',
+    'encolar' (se lanza al terminar las activas) o 'concurrente' (en paralelo hasta
+    max_concurrentes; por encima se omite).
 
-                if callback:
-                    callback(f"❌ Error crítico: {str(e)[:50]}")
+    Cada función recibe el motor con el que ejecutar: el compartido si está libre y, si
+    no (ejecución concurrente), un FichajeEngine propio, porque el estado de una ejecución
+    vive en su motor.
+    """
 
-                fallos += 1
+    def __init__(self, config, on_cambio=None, log=None, motor=None):
 
-                self.guardar_resultado(usuario, "ERROR", f"Error crítico: {str(e)[:100]}", "")
+        self.config = config
 
-            if i < len(df) - 1:
-                logger.info("⏸ Pausa de 3 segundos...")
+        self.motor = motor
 
-                time.sleep(3)
+        self.on_cambio = on_cambio
 
-        # Cerrar driver
+        self.log = log or logger.info
 
-        if driver:
+        self.activas = {}
 
-            try:
+        self.pendientes = deque()
 
-                driver.quit()
+        self._lock = threading.Lock()
 
-                logger.info("🔚 Driver cerrado")
+        self._secuencia = 0
 
-            except:
+    def enviar(self, nombre, funcion, politica=None, max_concurrentes=None):
 
-                pass
+        """Lanza, encola u omite una ejecución; devuelve 'lanzada', 'encolada' u 'omitida'"""
 
-        # Resumen
+        politica = politica or self.config.get('solapamiento_politica', 'encolar')
 
-        logger.info("\n" + "=" * 80)
+        limite = max_concurrentes or self.config.get('ejecutor_max_concurrentes', 2)
 
-        logger.info("📊 RESUMEN FINAL")
+        with self._lock:
 
-        logger.info("=" * 80)
+            if not self.activas or (politica == 'concurrente' and len(self.activas) < limite):
 
-        logger.info(f"✅ Exitosos: {exitos}")
+                decision = 'lanzada'
 
-        logger.info(f"❌ Fallidos: {fallos}")
+                self._lanzar(nombre, funcion)
 
-        logger.info(f"⚠️ Desconocidos: {desconocidos}")
+            elif politica == 'encolar':
 
-        logger.info(f"📁 Total: {len(df)}")
+                decision = 'encolada'
 
-        logger.info("=" * 80 + "\n")
+                self.pendientes.append((nombre, funcion))
 
-        if callback:
-            callback(f"\n{'=' * 60}\n📊 RESUMEN FINAL\n{'=' * 60}")
+            else:
 
-            callback(f"✅ Exitosos: {exitos}")
+                decision = 'omitida'
 
-            callback(f"❌ Fallidos: {fallos}")
+        if decision == 'encolada':
+            self.log(f"⏳ {nombre}: hay una ejecución en curso - en cola ({len(self.pendientes)} pendientes)")
 
-            callback(f"⚠️ Desconocidos: {desconocidos}")
+        elif decision == 'omitida':
+            self.log(f"⏭ {nombre}: hay una ejecución en curso - se omite")
 
-            callback(f"📁 Total procesados: {len(df)}")
+        self._notificar()
 
-            callback(f"📄 Resultados en: {self.config['results_file']}")
+        return decision
 
-            callback(f"{'=' * 60}\n")
+    def _lanzar(self, nombre, funcion):
 
-        # Enviar notificación de resumen
+        # Con self._lock adquirido
 
-        resumen_msg = f"""Total procesados: {len(df)}
+        self._secuencia += 1
 
-✅ Exitosos: {exitos}
+        id_ejecucion = self._secuencia
 
-❌ Fallidos: {fallos}
+        # El motor compartido solo lo usa una ejecución a la vez (None = se crea uno propio)
 
-⚠️ Desconocidos: {desconocidos}
+        libre = self.motor is not None and all(a['motor'] is not self.motor for a in self.activas.values())
 
+        thread = threading.Thread(target=self._ejecutar, args=(id_ejecucion, funcion), name=f"ejecucion-{id_ejecucion}")
 
+        thread.daemon = True
 
-Archivo de resultados: {self.config['results_file']}
+        self.activas[id_ejecucion] = {'nombre': nombre, 'inicio': datetime.now(), 'thread': thread,
+                                      'motor': self.motor if libre else None}
 
-Fecha: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"""
+        thread.start()
 
-        tipo_resumen = "success" if fallos == 0 else "warning" if exitos > 0 else "error"
+    def _ejecutar(self, id_ejecucion, funcion):
+
+        try:
+
+            motor = self.activas[id_ejecucion]['motor']
+
+            if motor is None:
+
+                self.log(f"🔀 {self.activas[id_ejecucion]['nombre']}: ejecución concurrente con su propio motor")
+
+                motor = FichajeEngine(self.config)
+
+            funcion(motor)
+
+        except Exception as e:
+
+            logger.error(f"❌ Error en la ejecución {self.activas[id_ejecucion]['nombre']}: {e}")
+
+        finally:
+
+            with self._lock:
+
+                del self.activas[id_ejecucion]
+
+                # Las encoladas esperan a que no quede ninguna activa
+
+                if not self.activas and self.pendientes:
+                    self._lanzar(*self.pendientes.popleft())
+
+            self._notificar()
+
+    def _notificar(self):
+
+        if self.on_cambio:
+
+            try:
+
+                self.on_cambio(self.estado())
+
+            except Exception as e:
+
+                logger.error(f"❌ Error actualizando el estado de las ejecuciones: {e}")
+
+    @property
+    def ocupado(self):
+
+        return bool(self.activas)
+
+    def estado(self):
+
+        """Ejecuciones activas y pendientes, para la GUI y el fichero de estado del daemon"""
+
+        with self._lock:
+
+            return {
+
+                'activas': [{'nombre': a['nombre'], 'inicio': a['inicio'].strftime("%d/%m/%Y %H:%M:%S")}
+
+                            for a in self.activas.values()],
+
+                'pendientes': [nombre for nombre, _ in self.pendientes]
+
+            }
+
+    def detener(self, esperar=True):
+
+        """Descarta las pendientes y, si se pide, espera a que terminen las activas"""
+
+        with self._lock:
+
+            self.pendientes.clear()
+
+            threads = [a['thread'] for a in self.activas.values()]
 
-        self.notifier.notify("Resumen de Fichajes", resumen_msg, tipo=tipo_resumen)
+        if esperar:
 
-        return {'exitos': exitos, 'fallos': fallos, 'desconocidos': desconocidos, 'total': len(df)}
+            for thread in threads:
+                thread.join()
 
 
 # ==================== INTERFAZ GRÁFICA ====================
@@ -1453,14 +6995,14 @@ class FichajeGUI:
 
         self.horarios = []
 
-        self.scheduler_running = False
-
-        self.scheduler_thread = None
-
         # Cargar configuración
 
         self.cargar_configuracion()
 
+        self.programador = ProgramadorHorarios(engine, self.horarios, self._tarea_programada, self.log_consola)
+
+        self.ejecutor = EjecutorTareas(engine.config, self._estado_ejecucion, self.log_consola, engine)
+
         # Crear interfaz
 
         self.crear_interfaz()
@@ -1876,6 +7418,28 @@ class FichajeGUI:
 
         self.label_proxima.pack()
 
+        self.label_ejecucion = tk.Label(frame_control,
+
+                                        text="",
+
+                                        font=("Arial", 9),
+
+                                        fg="#2980b9")
+
+        self.label_ejecucion.pack()
+
+        self.label_reloj = tk.Label(frame_control,
+
+                                    text=f"🕰 {self.engine.reloj.texto()}" if self.engine.reloj.activo else "",
+
+                                    font=("Arial", 9),
+
+                                    fg="#7f8c8d")
+
+        self.label_reloj.pack()
+
+        self.engine.reloj.on_calibrado = lambda reloj: self.label_reloj.config(text=f"🕰 {reloj.texto()}")
+
         # CONSOLA
 
         frame_consola = tk.LabelFrame(self.root,
@@ -1982,6 +7546,9 @@ class FichajeGUI:
 
         self.log_consola("=" * 80)
 
+        for diario in DiarioEjecucion.interrumpidas(CONFIG['journal_dir']):
+            self.log_consola(f"⚠️ Ejecución interrumpida {diario.run_id} - reanudar con: python fichaje.py resume {diario.run_id}")
+
         # Cargar horarios
 
         self.actualizar_lista_horarios()
@@ -2204,21 +7771,17 @@ class FichajeGUI:
 
         self.log_consola("=" * 80)
 
-        self.btn_ejecutar.config(state=tk.DISABLED, text="⏳ Ejecutando...")
-
-        thread = threading.Thread(target=self._ejecutar_thread)
-
-        thread.daemon = True
+        # La manual no se solapa con ninguna otra (el botón ya está desactivado mientras hay una)
 
-        thread.start()
+        self.ejecutor.enviar("Manual", self._ejecutar_thread, politica='omitir')
 
-    def _ejecutar_thread(self):
+    def _ejecutar_thread(self, motor, franja=None):
 
-        """Ejecuta el fichaje en thread separado"""
+        """Ejecuta el fichaje (lo llama el ejecutor en su propio thread, con el motor que le toca)"""
 
         try:
 
-            resultado = self.engine.procesar_usuarios(callback=self.log_consola)
+            resultado = motor.procesar_usuarios(callback=self.log_consola, franja=franja)
 
             self.log_consola("✅ Ejecución completada")
 
@@ -2226,10 +7789,27 @@ class FichajeGUI:
 
             self.log_consola(f"❌ ERROR: {e}")
 
-        finally:
+    def _estado_ejecucion(self, estado):
+
+        """Refleja en la interfaz las ejecuciones activas y en cola"""
+
+        if estado['activas']:
+
+            self.btn_ejecutar.config(state=tk.DISABLED, text="⏳ Ejecutando...")
+
+            texto = "▶ En curso: " + ", ".join(f"{a['nombre']} (desde {a['inicio'][-8:]})" for a in estado['activas'])
+
+            if estado['pendientes']:
+                texto += f" | En cola: {', '.join(estado['pendientes'])}"
+
+            self.label_ejecucion.config(text=texto)
+
+        else:
 
             self.btn_ejecutar.config(state=tk.NORMAL, text="▶️ Ejecutar Fichaje AHORA")
 
+            self.label_ejecucion.config(text="")
+
     def toggle_scheduler(self):
 
         """Activa/desactiva el programador"""
@@ -2253,8 +7833,6 @@ class FichajeGUI:
 
             return
 
-        self.scheduler_running = True
-
         self.btn_scheduler.config(text="⏸ Detener Programador", bg="#e74c3c")
 
         self.label_estado.config(text="✅ Estado: PROGRAMADOR ACTIVO", fg="#27ae60")
@@ -2279,19 +7857,13 @@ class FichajeGUI:
 
         self.programar_tareas()
 
-        self.scheduler_thread = threading.Thread(target=self._run_scheduler)
-
-        self.scheduler_thread.daemon = True
-
-        self.scheduler_thread.start()
+        self.programador.iniciar()
 
     def detener_scheduler(self):
 
         """Detiene el programador de tareas"""
 
-        self.scheduler_running = False
-
-        schedule.clear()
+        self.programador.detener()
 
         self.btn_scheduler.config(text="🚀 Activar Programador", bg="#f39c12")
 
@@ -2317,170 +7889,488 @@ class FichajeGUI:
 
         )
 
+    @property
+    def scheduler_running(self):
+
+        return self.programador.running
+
     def programar_tareas(self):
 
         """Programa todas las tareas con días específicos"""
 
-        schedule.clear()
+        proxima = self.programador.programar_tareas()
 
-        # Mapeo de días a funciones de schedule
+        if proxima:
+            texto_proxima = proxima.strftime('%d/%m/%Y %H:%M:%S')
 
-        dias_schedule = {
+            dia_semana = DIAS_SEMANA[proxima.weekday()]
 
-            'L': 'monday',
+            self.log_consola(f"📅 Próxima ejecución: {dia_semana} {texto_proxima}")
 
-            'M': 'tuesday',
+            self.label_proxima.config(text=f"Próxima: {dia_semana} {texto_proxima}")
 
-            'X': 'wednesday',
+    def _tarea_programada(self, horario_str, horario_obj, franja=None):
 
-            'J': 'thursday',
+        """Función que se ejecuta cuando llega la hora"""
 
-            'V': 'friday',
+        dias_texto = ', '.join(horario_obj.get("dias", []))
 
-            'S': 'saturday',
+        self.log_consola("=" * 80)
 
-            'D': 'sunday'
+        self.log_consola(f"⏰ TAREA PROGRAMADA - {horario_str} - Días: [{dias_texto}]")
 
-        }
+        self.log_consola("=" * 80)
 
-        for h in self.horarios:
+        self.actualizar_lista_horarios()
 
-            if h["activo"]:
+        # El thread del programador queda libre para disparar otros horarios a su hora
 
-                horario = h["horario"]
+        self.ejecutor.enviar(
 
-                dias = h.get("dias", ["L", "M", "X", "J", "V", "S", "D"])
+            f"Horario {horario_str}", lambda motor: self._ejecutar_thread(motor, franja),
 
-                for dia_letra in dias:
+            horario_obj.get("solapamiento"), horario_obj.get("max_concurrentes")
 
-                    dia_schedule = dias_schedule.get(dia_letra)
+        )
 
-                    if dia_schedule:
-                        # Programar para cada día específico
+    def cargar_configuracion(self):
 
-                        getattr(schedule.every(), dia_schedule).at(horario).do(
+        """Carga la configuración guardada"""
 
-                            self._tarea_programada, horario, h
+        self.horarios = cargar_horarios(CONFIG['config_file'])
 
-                        )
+    def guardar_configuracion(self):
 
-                dias_texto = ', '.join(dias)
+        """Guarda la configuración"""
 
-                self.log_consola(f"⏰ Programado: {horario} - Días: {dias_texto}")
+        guardar_horarios(CONFIG['config_file'], self.horarios)
 
-        if schedule.jobs:
+    def on_closing(self):
 
-            proxima = schedule.next_run()
+        """Maneja el cierre de la aplicación"""
 
-            if proxima:
-                texto_proxima = proxima.strftime('%d/%m/%Y %H:%M:%S')
+        if self.scheduler_running:
 
-                dia_semana = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo'][
+            respuesta = messagebox.askyesno(
 
-                    proxima.weekday()]
+                "Programador Activo",
 
-                self.log_consola(f"📅 Próxima ejecución: {dia_semana} {texto_proxima}")
+                "El programador está activo.\n\n"
 
-                self.label_proxima.config(text=f"Próxima: {dia_semana} {texto_proxima}")
+                "¿Seguro que quieres cerrar?\n"
 
-    def _tarea_programada(self, horario_str, horario_obj):
+                "Las tareas programadas se detendrán."
 
-        """Función que se ejecuta cuando llega la hora"""
+            )
 
-        dias_texto = ', '.join(horario_obj.get("dias", []))
+            if not respuesta:
+                return
 
-        self.log_consola("=" * 80)
+            self.detener_scheduler()
 
-        self.log_consola(f"⏰ TAREA PROGRAMADA - {horario_str} - Días: [{dias_texto}]")
+        self.guardar_configuracion()
 
-        self.log_consola("=" * 80)
+        self.root.destroy()
 
-        horario_obj["ultima_ejecucion"] = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
 
-        self.actualizar_lista_horarios()
+# ==================== MODO CONSOLA / DAEMON (SIN INTERFAZ) ====================
 
-        self.guardar_configuracion()
+# Lo escriben el thread del programador y los de las ejecuciones
 
-        self._ejecutar_thread()
+_lock_estado_daemon = threading.Lock()
 
-    def _run_scheduler(self):
 
-        """Loop del scheduler"""
+def escribir_estado_daemon(config, **cambios):
+    """Actualiza el fichero de estado del daemon de forma atómica"""
 
-        while self.scheduler_running:
-            schedule.run_pending()
+    ruta = config['daemon_status_file']
 
-            time.sleep(1)
+    with _lock_estado_daemon:
 
-    def cargar_configuracion(self):
+        estado = leer_estado_daemon(config) or {}
 
-        """Carga la configuración guardada"""
+        estado.update(cambios)
 
         try:
 
-            config_file = CONFIG['config_file']
+            temporal = ruta + ".tmp"
+
+            with open(temporal, 'w', encoding='utf-8') as f:
 
-            if os.path.exists(config_file):
-                with open(config_file, 'r') as f:
-                    data = json.load(f)
+                json.dump(estado, f, indent=4, ensure_ascii=False)
 
-                    self.horarios = data.get("horarios", [])
+            os.replace(temporal, ruta)
 
         except Exception as e:
 
-            self.horarios = []
+            logger.error(f"❌ Error guardando estado del daemon: {e}")
 
-    def guardar_configuracion(self):
 
-        """Guarda la configuración"""
+def leer_estado_daemon(config):
+    """Lee el fichero de estado del daemon (None si no existe)"""
+
+    try:
+
+        with open(config['daemon_status_file'], 'r', encoding='utf-8') as f:
+
+            return json.load(f)
+
+    except (OSError, ValueError):
+
+        return None
+
+
+def proceso_vivo(pid):
+    """Comprueba si existe un proceso con ese PID"""
+
+    if sys.platform == 'win32':
+
+        # En Windows os.kill(pid, 0) terminaría el proceso
+
+        import ctypes
+
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+
+        if not handle:
+            return False
+
+        ctypes.windll.kernel32.CloseHandle(handle)
+
+        return True
+
+    try:
+
+        os.kill(pid, 0)
+
+    except ProcessLookupError:
+
+        return False
+
+    except (PermissionError, OSError):
+
+        return True
+
+    return True
+
+
+def cmd_run_now(engine, args):
+    """Ejecuta el fichaje de todo el CSV una vez"""
+
+    resultado = engine.procesar_usuarios()
+
+    return 0 if resultado['fallos'] == 0 and resultado['total'] > 0 else 1
+
+
+def cmd_resume(engine, args):
+    """Continúa una ejecución interrumpida omitiendo los usuarios ya completados"""
+
+    resultado = engine.reanudar_ejecucion(args.run_id)
+
+    if resultado is None:
+        return 0 if args.run_id is None else 2
+
+    return 0 if resultado['fallos'] == 0 else 1
+
+
+def cmd_run_user(engine, args):
+    """Ficha a un único usuario (contraseña por argumento o tomada del CSV)"""
+
+    password = args.password
+
+    if password is None:
 
         try:
 
-            with open(CONFIG['config_file'], 'w') as f:
+            registro = LectorRoster(engine.config['csv_file']).buscar(args.tarjeta)
+
+            if registro is None:
+
+                logger.error(f"❌ El usuario {args.tarjeta} no está en {engine.config['csv_file']}")
+
+                return 2
 
-                json.dump({"horarios": self.horarios}, f, indent=4)
+            password = registro.contrasena
 
         except Exception as e:
 
-            print(f"Error guardando config: {e}")
+            logger.error(f"❌ Error leyendo CSV: {e}")
 
-    def on_closing(self):
+            return 2
 
-        """Maneja el cierre de la aplicación"""
+    resultado = engine.fichar_usuario(args.tarjeta, password, forzar=args.forzar)
 
-        if self.scheduler_running:
+    return 0 if resultado is True else 1
 
-            respuesta = messagebox.askyesno(
 
-                "Programador Activo",
+def cmd_daemon(engine, args):
+    """Mantiene el programador de horarios en primer plano sin interfaz gráfica"""
 
-                "El programador está activo.\n\n"
+    config = engine.config
 
-                "¿Seguro que quieres cerrar?\n"
+    horarios = cargar_horarios(config['config_file'])
 
-                "Las tareas programadas se detendrán."
+    if not any(h.get("activo") for h in horarios):
 
-            )
+        logger.error(f"❌ No hay horarios activos en {config['config_file']}")
 
-            if not respuesta:
-                return
+        return 2
 
-            self.detener_scheduler()
+    def ejecutar(motor, horario_str, franja):
 
-        self.guardar_configuracion()
+        escribir_estado_daemon(config, horario_en_curso=horario_str)
 
-        self.root.destroy()
+        try:
+
+            resumen = motor.procesar_usuarios(franja=franja)
+
+        except Exception as e:
+
+            logger.error(f"❌ ERROR: {e}")
+
+            resumen = {'error': str(e)}
+
+        # Liberar la memoria de la ejecución mientras el daemon espera la siguiente
+
+        gc.collect()
+
+        proxima = programador.proxima_ejecucion()
+
+        escribir_estado_daemon(
+
+            config,
+
+            horario_en_curso=None,
+
+            ultima_ejecucion=datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+
+            ultimo_resumen=resumen,
+
+            proxima_ejecucion=proxima.strftime("%d/%m/%Y %H:%M:%S") if proxima else None
+
+        )
+
+    def tarea(horario_str, horario_obj, franja=None):
+
+        logger.info(f"⏰ TAREA PROGRAMADA - {horario_str} - Días: [{', '.join(horario_obj.get('dias', []))}]")
+
+        ejecutor.enviar(
+
+            f"Horario {horario_str}", lambda motor: ejecutar(motor, horario_str, franja),
+
+            horario_obj.get("solapamiento"), horario_obj.get("max_concurrentes")
+
+        )
+
+    def estado_ejecucion(estado):
+
+        escribir_estado_daemon(config, estado="ejecutando" if estado['activas'] else "esperando", ejecuciones=estado)
+
+    ejecutor = EjecutorTareas(config, estado_ejecucion, motor=engine)
+
+    programador = ProgramadorHorarios(engine, horarios, tarea)
+
+    proxima = programador.programar_tareas()
+
+    escribir_estado_daemon(
+
+        config,
+
+        pid=os.getpid(),
+
+        inicio=datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+
+        estado="esperando",
+
+        proxima_ejecucion=proxima.strftime("%d/%m/%Y %H:%M:%S") if proxima else None
+
+    )
+
+    logger.info(f"🚀 Daemon de fichaje iniciado (PID {os.getpid()})")
+
+    if proxima:
+        logger.info(f"📅 Próxima ejecución: {DIAS_SEMANA[proxima.weekday()]} {proxima.strftime('%d/%m/%Y %H:%M:%S')}")
+
+    def parar(signum, frame):
+
+        logger.info("⏸ Señal de parada recibida")
+
+        programador.detener()
+
+    signal.signal(signal.SIGTERM, parar)
+
+    try:
+
+        programador.iniciar(bloquear=True)
+
+    except KeyboardInterrupt:
+
+        programador.detener()
+
+    # Las ejecuciones en curso terminan (las encoladas se descartan)
+
+    if ejecutor.ocupado:
+        logger.info("⏳ Esperando a que termine la ejecución en curso...")
+
+    ejecutor.detener(esperar=True)
+
+    escribir_estado_daemon(config, estado="detenido", pid=None)
+
+    logger.info("🔚 Daemon de fichaje detenido")
+
+    return 0
+
+
+def cmd_status(engine, args):
+    """Muestra horarios, próxima ejecución y estado del daemon"""
+
+    config = engine.config
+
+    horarios = cargar_horarios(config['config_file'])
+
+    print(f"📋 Horarios ({config['config_file']}):")
+
+    if not horarios:
+        print("   (ninguno)")
+
+    for h in sorted(horarios, key=lambda x: x["horario"]):
+
+        estado = "ACTIVO" if h.get("activo") else "INACTIVO"
+
+        dias = ', '.join(h.get("dias", TODOS_LOS_DIAS))
+
+        print(f"   {h['horario']} - Días:[{dias}] - {estado} - Última:{h.get('ultima_ejecucion', 'Nunca')}")
+
+    programador = ProgramadorHorarios(engine, horarios, lambda *a: None, log=lambda mensaje: None, solo_lectura=True)
+
+    proxima = programador.programar_tareas()
+
+    programador.detener()
+
+    if proxima:
+        print(f"📅 Próxima ejecución: {DIAS_SEMANA[proxima.weekday()]} {proxima.strftime('%d/%m/%Y %H:%M:%S')}")
+
+    for diario in DiarioEjecucion.interrumpidas(config['journal_dir']):
+
+        completados = sum(map(diario.completado, diario.estados))
+
+        print(f"⚠️ Ejecución interrumpida {diario.run_id}: {completados}/{diario.info.get('total', '?')} usuarios completados"
+
+              f" - reanudar con: resume {diario.run_id}")
+
+    estado = leer_estado_daemon(config)
+
+    if not estado:
+
+        print("⏸ Daemon: sin información de estado")
+
+        return 0
+
+    pid = estado.get("pid")
+
+    vivo = bool(pid) and proceso_vivo(pid)
+
+    print(f"{'✅' if vivo else '⏸'} Daemon: {'EN MARCHA (PID ' + str(pid) + ')' if vivo else 'DETENIDO'}")
+
+    print(f"   Estado: {estado.get('estado')} - Iniciado: {estado.get('inicio')}")
+
+    print(f"   Última ejecución: {estado.get('ultima_ejecucion') or 'Nunca'}")
+
+    ejecuciones = estado.get("ejecuciones") or {}
+
+    for activa in ejecuciones.get("activas", []):
+        print(f"   ▶ En curso: {activa['nombre']} (desde {activa['inicio']})")
+
+    if ejecuciones.get("pendientes"):
+        print(f"   ⏳ En cola: {', '.join(ejecuciones['pendientes'])}")
+
+    if estado.get("ultimo_resumen"):
+        print(f"   Último resumen: {estado['ultimo_resumen']}")
+
+    return 0
+
+
+def crear_parser():
+    """Parser de argumentos del modo consola"""
+
+    parser = argparse.ArgumentParser(
+
+        description="Sistema de Fichaje Automatizado. Sin subcomando abre la interfaz gráfica."
+
+    )
+
+    parser.add_argument("--csv", help="Archivo CSV de usuarios")
+
+    parser.add_argument("--visible", action="store_true", help="Chrome con ventana (por defecto headless en consola)")
+
+    subparsers = parser.add_subparsers(dest="comando")
+
+    subparsers.add_parser("run-now", help="Ficha ahora a todos los usuarios del CSV")
+
+    p_user = subparsers.add_parser("run-user", help="Ficha ahora a un único usuario")
+
+    p_user.add_argument("tarjeta")
+
+    p_user.add_argument("--password", help="Contraseña (si no se indica se busca en el CSV)")
+
+    p_user.add_argument("--forzar", action="store_true", help="Fichar aunque ya haya fichado en la ventana de idempotencia")
+
+    p_resume = subparsers.add_parser("resume", help="Reanuda una ejecución interrumpida")
+
+    p_resume.add_argument("run_id", nargs="?", help="Ejecución a reanudar (por defecto la más reciente)")
+
+    subparsers.add_parser("daemon", help="Programador de horarios en primer plano, sin interfaz")
+
+    subparsers.add_parser("status", help="Muestra horarios y estado del daemon")
+
+    return parser
+
+
+COMANDOS_CLI = {
+
+    'run-now': cmd_run_now,
+
+    'run-user': cmd_run_user,
+
+    'resume': cmd_resume,
+
+    'daemon': cmd_daemon,
+
+    'status': cmd_status
+
+}
 
 
 # ==================== FUNCIÓN PRINCIPAL ====================
 
 def main():
-    """Función principal que inicia la aplicación"""
+    """Función principal: interfaz gráfica, o modo consola si se indica un subcomando"""
+
+    args = crear_parser().parse_args()
+
+    if args.csv:
+        CONFIG['csv_file'] = args.csv
+
+    if args.comando:
+
+        # Modo consola: sin tkinter y con Chrome invisible salvo --visible
+
+        CONFIG['headless'] = not args.visible
+
+        engine = FichajeEngine(CONFIG)
+
+        # Navegadores que dejó atrás una ejecución anterior que terminó mal
+
+        if args.comando != 'status':
+            engine.supervisor.recolectar()
+
+        sys.exit(COMANDOS_CLI[args.comando](engine, args))
 
     # Crear motor de fichaje
 
     engine = FichajeEngine(CONFIG)
 
+    engine.supervisor.recolectar()
+
     # Crear ventana principal
 
     root = tk.Tk()
@@ -0,0 +1,508 @@
+"""
+
+PORTAL WCRONOS SIMULADO - SERVIDOR LOCAL PARA PRUEBAS Y BENCHMARKS
+
+Reproduce el frameset (cuerpo_WCRONOS / principal_wcronos), el formulario de login
+con captcha, el botón de Punto de Fichaje y las páginas de resultado del portal real,
+además de los endpoints de 2Captcha, con latencia y fallos configurables.
+
+Uso: python mock_wcronos.py --puerto 8088 --latencia-ms 50 --fallo-fichaje 0.05
+
+"""
+
+import argparse
+
+import random
+
+import struct
+
+import threading
+
+import time
+
+import uuid
+
+import zlib
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from urllib.parse import parse_qs, urlparse
+
+# ==================== CONFIGURACIÓN DEL PORTAL SIMULADO ====================
+
+MOCK_CONFIG = {
+
+    'latencia_ms': 0,
+
+    'jitter_ms': 0,
+
+    'fallo_http': 0.0,
+
+    'fallo_login': 0.0,
+
+    'fallo_fichaje': 0.0,
+
+    'captcha_codigo': "0000",
+
+    'captcha_espera_s': 0.0,
+
+    'semilla': None
+
+}
+
+
+def generar_png(ancho=120, alto=40):
+    """Genera un PNG en escala de grises con un patrón sencillo (imagen de captcha)"""
+
+    filas = b"".join(
+
+        b"\x00" + bytes(((x * 7 + y * 13) % 256) for x in range(ancho))
+
+        for y in range(alto)
+
+    )
+
+    def chunk(tipo, datos):
+
+        return struct.pack(">I", len(datos)) + tipo + datos + struct.pack(">I", zlib.crc32(tipo + datos) & 0xffffffff)
+
+    cabecera = struct.pack(">IIBBBBB", ancho, alto, 8, 0, 0, 0, 0)
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", cabecera) +
+
+            chunk(b"IDAT", zlib.compress(filas)) + chunk(b"IEND", b""))
+
+
+# ==================== PÁGINAS HTML ====================
+
+PAGINA_RAIZ = """<html><head><title>WCRONOS</title></head>
+<frameset rows="60,*" frameborder="0">
+<frame name="cabecera_WCRONOS" src="/cabecera.html">
+<frame name="cuerpo_WCRONOS" src="/cuerpo.html">
+</frameset></html>"""
+
+PAGINA_CABECERA = """<html><head><link rel="stylesheet" href="/estilos.css"></head>
+<body><img src="/logo.png" alt="WCRONOS"></body></html>"""
+
+PAGINA_CUERPO = """<html><head><title>WCRONOS</title></head>
+<frameset cols="*" frameborder="0">
+<frame name="principal_wcronos" src="/login.asp">
+</frameset></html>"""
+
+PAGINA_LOGIN = """<html><head><title>Acceso WCRONOS</title>
+<link rel="stylesheet" href="/estilos.css"></head>
+<body>
+<img src="/logo.png" alt="WCRONOS">
+{mensaje}
+<form name="form_login" method="post" action="/login.asp">
+<input type="text" id="USUARIO" name="USUARIO">
+<input type="password" id="CONTRASENA" name="CONTRASENA">
+<img src="/captcha.asp?r={aleatorio}" alt="codigo">
+<input type="text" name="codigo_captcha">
+<input type="submit" value="Entrar">
+</form>
+</body></html>"""
+
+PAGINA_MENU = """<html><head><title>WCRONOS - Menú</title>
+<link rel="stylesheet" href="/estilos.css"></head>
+<body>
+<p>Bienvenido {usuario}</p>
+<form name="form_pfichaje" method="post" action="/pfichaje.asp"></form>
+<button type="button" onclick="document.form_pfichaje.submit();">Punto de Fichaje</button>
+</body></html>"""
+
+PAGINA_PFICHAJE = """<html><head><title>WCRONOS - Punto de Fichaje</title>
+<link rel="stylesheet" href="/estilos.css"></head>
+<body>
+<form name="form_fichaje" method="post" action="/fichar.asp">
+<button type="submit" id="btnEnviarForm">Realizar Fichaje</button>
+</form>
+</body></html>"""
+
+PAGINA_EXITO = """<html><head><title>WCRONOS - Fichaje</title></head>
+<body><p>El fichaje se a realizado correctamente</p><p>{hora}</p></body></html>"""
+
+PAGINA_ERROR = """<html><head><title>WCRONOS - Fichaje</title></head>
+<body><p>Ha ocurrido un error al registrar el fichaje</p></body></html>"""
+
+PAGINA_SIN_SESION = """<html><head><title>WCRONOS</title></head>
+<body><p>La sesión ha caducado</p></body></html>"""
+
+ESTILOS_CSS = "body { font-family: Arial, sans-serif; }\n" * 200
+
+
+# ==================== SERVIDOR ====================
+
+class ManejadorWCRONOS(BaseHTTPRequestHandler):
+    """Atiende las peticiones del portal simulado"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+
+        """Silencia el log por petición de BaseHTTPRequestHandler"""
+
+        pass
+
+    def do_GET(self):
+
+        self._atender("GET")
+
+    def do_POST(self):
+
+        self._atender("POST")
+
+    def _atender(self, metodo):
+
+        """Aplica latencia y fallos inyectados y despacha la petición"""
+
+        servidor = self.server.portal
+
+        url = urlparse(self.path)
+
+        servidor.contar(f"{metodo} {url.path}")
+
+        servidor.esperar_latencia()
+
+        datos = {}
+
+        if metodo == "POST":
+
+            longitud = int(self.headers.get("Content-Length") or 0)
+
+            cuerpo = self.rfile.read(longitud).decode("utf-8", "replace") if longitud else ""
+
+            datos = {k: v[0] for k, v in parse_qs(cuerpo).items()}
+
+        datos.update({k: v[0] for k, v in parse_qs(url.query).items()})
+
+        if servidor.sortear('fallo_http'):
+
+            servidor.contar("fallo_http")
+
+            return self._responder(503, "<html><body>Servicio no disponible</body></html>")
+
+        rutas = {
+
+            "/": lambda: self._responder(200, PAGINA_RAIZ),
+
+            "/cabecera.html": lambda: self._responder(200, PAGINA_CABECERA),
+
+            "/cuerpo.html": lambda: self._responder(200, PAGINA_CUERPO),
+
+            "/estilos.css": lambda: self._responder(200, ESTILOS_CSS, "text/css"),
+
+            "/logo.png": lambda: self._responder(200, servidor.png, "image/png"),
+
+            "/captcha.asp": lambda: self._responder(200, servidor.png, "image/png"),
+
+            "/login.asp": lambda: self._login(metodo, datos),
+
+            "/pfichaje.asp": self._pfichaje,
+
+            "/fichar.asp": self._fichar,
+
+            "/in.php": lambda: self._captcha_in(datos),
+
+            "/res.php": lambda: self._captcha_res(datos)
+
+        }
+
+        ruta = rutas.get(url.path)
+
+        if ruta is None:
+
+            return self._responder(404, "<html><body>No encontrado</body></html>")
+
+        ruta()
+
+    def _sesion(self):
+
+        """Devuelve el usuario asociado a la cookie de sesión, si existe"""
+
+        for parte in (self.headers.get("Cookie") or "").split(";"):
+
+            nombre, _, valor = parte.strip().partition("=")
+
+            if nombre == "WCRONOS_SID":
+
+                return self.server.portal.sesiones.get(valor)
+
+        return None
+
+    def _login(self, metodo, datos):
+
+        portal = self.server.portal
+
+        if metodo == "GET":
+
+            return self._responder(200, PAGINA_LOGIN.format(mensaje="", aleatorio=uuid.uuid4().hex[:8]))
+
+        usuario = datos.get("USUARIO", "")
+
+        codigo_esperado = portal.config['captcha_codigo']
+
+        codigo_ok = codigo_esperado is None or datos.get("codigo_captcha") == codigo_esperado
+
+        if not usuario or not codigo_ok or portal.sortear('fallo_login'):
+
+            portal.contar("login_fallido")
+
+            return self._responder(200, PAGINA_LOGIN.format(mensaje="<p>Código incorrecto</p>",
+
+                                                            aleatorio=uuid.uuid4().hex[:8]))
+
+        sid = uuid.uuid4().hex
+
+        with portal.lock:
+
+            portal.sesiones[sid] = usuario
+
+        portal.contar("login_ok")
+
+        self._responder(200, PAGINA_MENU.format(usuario=usuario),
+
+                        cabeceras={"Set-Cookie": f"WCRONOS_SID={sid}; Path=/"})
+
+    def _pfichaje(self):
+
+        if self._sesion() is None:
+
+            return self._responder(200, PAGINA_SIN_SESION)
+
+        self._responder(200, PAGINA_PFICHAJE)
+
+    def _fichar(self):
+
+        portal = self.server.portal
+
+        usuario = self._sesion()
+
+        if usuario is None:
+
+            return self._responder(200, PAGINA_SIN_SESION)
+
+        if portal.sortear('fallo_fichaje'):
+
+            portal.contar("fichaje_fallido")
+
+            return self._responder(200, PAGINA_ERROR)
+
+        portal.contar("fichaje_ok")
+
+        with portal.lock:
+
+            portal.fichajes.append((usuario, time.time()))
+
+        self._responder(200, PAGINA_EXITO.format(hora=time.strftime("%d/%m/%Y %H:%M:%S")))
+
+    def _captcha_in(self, datos):
+
+        """Emula el endpoint in.php de 2Captcha"""
+
+        portal = self.server.portal
+
+        captcha_id = uuid.uuid4().hex[:12]
+
+        with portal.lock:
+
+            portal.captchas[captcha_id] = time.time() + portal.config['captcha_espera_s']
+
+        self._responder(200, f'{{"status": 1, "request": "{captcha_id}"}}', "application/json")
+
+    def _captcha_res(self, datos):
+
+        """Emula el endpoint res.php de 2Captcha"""
+
+        portal = self.server.portal
+
+        listo = portal.captchas.get(datos.get("id", ""))
+
+        if listo is None:
+
+            return self._responder(200, '{"status": 0, "request": "ERROR_WRONG_CAPTCHA_ID"}', "application/json")
+
+        if time.time() < listo:
+
+            return self._responder(200, '{"status": 0, "request": "CAPCHA_NOT_READY"}', "application/json")
+
+        codigo = portal.config['captcha_codigo'] or "0000"
+
+        self._responder(200, f'{{"status": 1, "request": "{codigo}"}}', "application/json")
+
+    def _responder(self, codigo, cuerpo, tipo="text/html; charset=utf-8", cabeceras=None):
+
+        datos = cuerpo if isinstance(cuerpo, bytes) else cuerpo.encode("utf-8")
+
+        self.send_response(codigo)
+
+        self.send_header("Content-Type", tipo)
+
+        self.send_header("Content-Length", str(len(datos)))
+
+        for nombre, valor in (cabeceras or {}).items():
+
+            self.send_header(nombre, valor)
+
+        self.end_headers()
+
+        self.wfile.write(datos)
+
+
+class PortalWCRONOS:
+    """Portal WCRONOS simulado servido en local, con latencia y fallos configurables"""
+
+    def __init__(self, host="127.0.0.1", puerto=0, **config):
+
+        self.config = dict(MOCK_CONFIG)
+
+        self.config.update(config)
+
+        self.lock = threading.Lock()
+
+        self.random = random.Random(self.config['semilla'])
+
+        self.png = generar_png()
+
+        self.sesiones = {}
+
+        self.captchas = {}
+
+        self.fichajes = []
+
+        self.contadores = {}
+
+        self.httpd = ThreadingHTTPServer((host, puerto), ManejadorWCRONOS)
+
+        self.httpd.daemon_threads = True
+
+        self.httpd.portal = self
+
+        self.thread = None
+
+    @property
+    def url(self):
+
+        host, puerto = self.httpd.server_address[:2]
+
+        return f"http://{host}:{puerto}/"
+
+    def contar(self, clave):
+
+        with self.lock:
+
+            self.contadores[clave] = self.contadores.get(clave, 0) + 1
+
+    def sortear(self, clave):
+
+        """Devuelve True con la probabilidad configurada para el fallo indicado"""
+
+        probabilidad = self.config.get(clave) or 0.0
+
+        if probabilidad <= 0:
+
+            return False
+
+        with self.lock:
+
+            return self.random.random() < probabilidad
+
+    def esperar_latencia(self):
+
+        latencia = self.config['latencia_ms']
+
+        jitter = self.config['jitter_ms']
+
+        if jitter:
+
+            with self.lock:
+
+                latencia += self.random.uniform(0, jitter)
+
+        if latencia > 0:
+
+            time.sleep(latencia / 1000.0)
+
+    def iniciar(self):
+
+        """Arranca el servidor en un thread en segundo plano"""
+
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+
+        self.thread.daemon = True
+
+        self.thread.start()
+
+        return self
+
+    def detener(self):
+
+        self.httpd.shutdown()
+
+        self.httpd.server_close()
+
+    def __enter__(self):
+
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+
+        self.detener()
+
+
+def main():
+    """Sirve el portal simulado hasta Ctrl+C"""
+
+    parser = argparse.ArgumentParser(description="Portal WCRONOS simulado")
+
+    parser.add_argument("--host", default="127.0.0.1")
+
+    parser.add_argument("--puerto", type=int, default=8088)
+
+    parser.add_argument("--latencia-ms", type=float, default=0)
+
+    parser.add_argument("--jitter-ms", type=float, default=0)
+
+    parser.add_argument("--fallo-http", type=float, default=0.0)
+
+    parser.add_argument("--fallo-login", type=float, default=0.0)
+
+    parser.add_argument("--fallo-fichaje", type=float, default=0.0)
+
+    parser.add_argument("--captcha", default="0000")
+
+    args = parser.parse_args()
+
+    portal = PortalWCRONOS(args.host, args.puerto,
+
+                           latencia_ms=args.latencia_ms,
+
+                           jitter_ms=args.jitter_ms,
+
+                           fallo_http=args.fallo_http,
+
+                           fallo_login=args.fallo_login,
+
+                           fallo_fichaje=args.fallo_fichaje,
+
+                           captcha_codigo=args.captcha)
+
+    print(f"🌐 Portal WCRONOS simulado en {portal.url}")
+
+    try:
+
+        portal.httpd.serve_forever()
+
+    except KeyboardInterrupt:
+
+        pass
+
+    finally:
+
+        portal.httpd.server_close()
+
+        print(f"📊 Peticiones: {portal.contadores}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+import fichaje
+
+from mock_wcronos import PortalWCRONOS
+
+
+@pytest.fixture
+def portal():
+
+    """Portal WCRONOS simulado, sin latencia"""
+
+    with PortalWCRONOS(latencia_ms=0, jitter_ms=0) as p:
+
+        yield p
+
+
+@pytest.fixture
+def config_temporal(tmp_path, portal):
+
+    """Copia de CONFIG con todos los ficheros de estado en tmp_path y sin esperas"""
+
+    config = dict(fichaje.CONFIG)
+
+    config.update({
+
+        'url': portal.url,
+
+        'csv_file': str(tmp_path / "datos.csv"),
+
+        'log_file': str(tmp_path / "fichajes.log"),
+
+        'results_file': str(tmp_path / "resultados.csv"),
+
+        'screenshots_dir': str(tmp_path / "screenshots"),
+
+        'config_file': str(tmp_path / "horarios_config.json"),
+
+        'journal_dir': str(tmp_path / "journal"),
+
+        'notifications_file': str(tmp_path / "notificaciones_inexistente.ini"),
+
+        'daemon_status_file': str(tmp_path / "fichaje_daemon.json"),
+
+        'jobstore_file': str(tmp_path / "scheduler_jobs.json"),
+
+        'concurrencia_export': str(tmp_path / "concurrencia.csv"),
+
+        'chrome_plantilla_dir': str(tmp_path / "chrome_plantilla"),
+
+        'frames_cache_file': str(tmp_path / "frames_cache.json"),
+
+        'selectores_cache_file': str(tmp_path / "selectores_cache.json"),
+
+        'sesiones_cache_file': str(tmp_path / "sesiones_cache.bin"),
+
+        'sesiones_clave_file': str(tmp_path / "sesiones.key"),
+
+        'reloj_file': str(tmp_path / "reloj_portal.json"),
+
+        'procesos_file': str(tmp_path / "procesos_chrome.json"),
+
+        'reloj_calibrar': False,
+
+        'reintentos_base_s': 0,
+
+        'reintentos_max_s': 0
+
+    })
+
+    return config
@@ -0,0 +1,74 @@
+import json
+
+import fichaje
+
+
+class DriverFalso:
+
+    def __init__(self, log=()):
+
+        self.cdp = []
+
+        self.log = [{"message": json.dumps({"message": m})} for m in log]
+
+    def execute_cdp_cmd(self, metodo, params):
+
+        self.cdp.append((metodo, params))
+
+    def get_log(self, tipo):
+
+        return self.log
+
+
+def config_bloqueo(**ajustes):
+
+    return dict(fichaje.CONFIG, bloqueo_red=True, url="http://portal.example/wcronos/", **ajustes)
+
+
+def test_permitidos_van_delante_de_las_reglas_de_bloqueo():
+
+    driver = DriverFalso()
+
+    fichaje.BloqueoRed(config_bloqueo(bloqueo_tipos=['Image'])).aplicar(driver)
+
+    metodo, params = driver.cdp[-1]
+
+    assert metodo == "Network.setBlockedURLs"
+
+    assert "*.png" in params['urls']
+
+    assert params['urlPatterns'][0] == {"urlPattern": "*://*:*/*captcha*", "block": False}
+
+
+def test_no_se_bloquea_la_url_del_portal():
+
+    bloqueo = fichaje.BloqueoRed(config_bloqueo(bloqueo_tipos=[], bloqueo_denegar=['*portal.example*', '*.gif']))
+
+    assert bloqueo.patrones == ['*.gif']
+
+
+def test_regla_que_bloquea_un_permitido_se_retira():
+
+    bloqueo = fichaje.BloqueoRed(config_bloqueo(bloqueo_tipos=[], bloqueo_denegar=['*.gif']))
+
+    url = "http://portal.example/wcronos/captcha.gif"
+
+    bloqueo.contabilizar(DriverFalso([
+
+        {"method": "Network.requestWillBeSent", "params": {"requestId": "1", "request": {"url": url}}},
+
+        {"method": "Network.loadingFailed", "params": {"requestId": "1", "blockedReason": "inspector"}}
+
+    ]))
+
+    try:
+
+        driver = DriverFalso()
+
+        bloqueo.aplicar(driver)
+
+        assert driver.cdp[-1][1]['urls'] == []
+
+    finally:
+
+        fichaje.BloqueoRed._retirados.clear()
@@ -0,0 +1,54 @@
+import threading
+
+import fichaje
+
+
+class CircuitoLento(fichaje.CircuitoPortal):
+    """Sonda que no responde hasta que el test la suelta"""
+
+    def __init__(self, config):
+
+        super().__init__(config)
+
+        self.sondeando = threading.Event()
+
+        self.soltar = threading.Event()
+
+    def sondear(self):
+
+        self.sondeando.set()
+
+        self.soltar.wait(timeout=10)
+
+        return True, "HTTP 200"
+
+
+def test_la_sonda_no_bloquea_al_resto_de_workers():
+
+    circuito = CircuitoLento({'url': "http://portal.example/", 'circuito_espera_s': 0})
+
+    circuito.abrir("prueba")
+
+    resultados = []
+
+    sonda = threading.Thread(target=lambda: resultados.append(circuito.permitir()))
+
+    sonda.start()
+
+    assert circuito.sondeando.wait(timeout=5)
+
+    # Con la sonda en vuelo, los demás no esperan a la red ni lanzan otra sonda
+
+    otro = threading.Thread(target=lambda: (circuito.registrar(fichaje.MOTIVO_TIMEOUT), resultados.append(circuito.permitir())))
+
+    otro.start()
+
+    otro.join(timeout=2)
+
+    assert not otro.is_alive() and resultados == [False]
+
+    circuito.soltar.set()
+
+    sonda.join(timeout=5)
+
+    assert resultados == [False, True] and circuito.estado == fichaje.CircuitoPortal.SEMIABIERTO
@@ -0,0 +1,85 @@
+import threading
+
+import fichaje
+
+
+class MotorBloqueado(fichaje.FichajeEngine):
+    """Motor cuya ejecución queda en curso hasta que el test la suelta"""
+
+    def __init__(self, config):
+
+        super().__init__(config)
+
+        self.en_curso = threading.Event()
+
+        self.soltar = threading.Event()
+
+    def _procesar_usuarios(self, callback=None, reanudar=None, franja=None):
+
+        self.en_curso.set()
+
+        self.soltar.wait(timeout=10)
+
+        return {'exitos': 1, 'fallos': 0, 'desconocidos': 0, 'total': 1}
+
+
+def test_segunda_ejecucion_en_el_mismo_motor_se_rechaza(config_temporal):
+
+    motor = MotorBloqueado(config_temporal)
+
+    resultados = []
+
+    primera = threading.Thread(target=lambda: resultados.append(motor.procesar_usuarios()))
+
+    primera.start()
+
+    assert motor.en_curso.wait(timeout=5)
+
+    assert motor.procesar_usuarios()['total'] == 0
+
+    motor.soltar.set()
+
+    primera.join(timeout=5)
+
+    assert resultados[0]['total'] == 1
+
+    assert motor.procesar_usuarios()['total'] == 1
+
+
+def test_ejecucion_concurrente_usa_su_propio_motor(config_temporal):
+
+    compartido = fichaje.FichajeEngine(config_temporal)
+
+    ejecutor = fichaje.EjecutorTareas(config_temporal, motor=compartido)
+
+    soltar = threading.Event()
+
+    motores = []
+
+    def ejecucion(motor):
+
+        motores.append(motor)
+
+        soltar.wait(timeout=10)
+
+    assert ejecutor.enviar("A", ejecucion, politica='concurrente') == 'lanzada'
+
+    assert ejecutor.enviar("B", ejecucion, politica='concurrente') == 'lanzada'
+
+    soltar.set()
+
+    ejecutor.detener()
+
+    assert len(motores) == 2 and compartido in motores
+
+    assert isinstance(motores[1 - motores.index(compartido)], fichaje.FichajeEngine)
+
+    assert motores[0] is not motores[1]
+
+    motores.clear()
+
+    ejecutor.enviar("C", ejecucion)
+
+    ejecutor.detener()
+
+    assert motores == [compartido]
@@ -0,0 +1,40 @@
+import json
+
+import shutil
+
+import subprocess
+
+import pytest
+
+import fichaje
+
+# DOM mínimo: USUARIO y CONTRASENA se encuentran por id; el captcha solo por name y con otro id
+
+DOM_FALSO = """
+class Campo {
+    constructor(id, name) { this.id = id; this.name = name; this.value = ''; }
+    focus() {}
+    dispatchEvent() {}
+}
+const campos = [new Campo('USUARIO', 'USUARIO'), new Campo('CONTRASENA', 'CONTRASENA'), new Campo('txtCaptcha', 'codigo_captcha')];
+const boton = {textContent: 'ENTRAR', value: '', click() {}};
+globalThis.setTimeout = f => f();
+globalThis.document = {
+    getElementById: id => campos.find(c => c.id === id) || null,
+    getElementsByName: n => campos.filter(c => c.name === n),
+    querySelectorAll: () => [boton]
+};
+const resultado = (function () { %s }).apply(null, ['100001', 'clave', 'ABCD']);
+console.log(JSON.stringify({resultado, valores: campos.map(c => c.value)}));
+"""
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="requiere node")
+def test_campo_encontrado_por_name_recibe_su_valor():
+
+    salida = subprocess.run(["node", "-e", DOM_FALSO % fichaje.SCRIPT_RELLENAR_LOGIN],
+                            capture_output=True, text=True, check=True)
+
+    datos = json.loads(salida.stdout)
+
+    assert datos == {'resultado': 'enviado', 'valores': ['100001', 'clave', 'ABCD']}
@@ -0,0 +1,18 @@
+import os
+
+import benchmark_fichaje
+
+# Margen sobre el presupuesto de 'benchmark_fichaje.py importacion' para máquinas de CI lentas
+
+PRESUPUESTO_MS = float(os.environ.get("FICHAJE_PRESUPUESTO_IMPORTACION_MS", 200))
+
+
+def test_importar_fichaje_es_rapido_y_sin_efectos():
+
+    mediana, cargados, creados = benchmark_fichaje.medir_importacion(3)
+
+    assert cargados == []
+
+    assert creados == []
+
+    assert mediana < PRESUPUESTO_MS
@@ -0,0 +1,31 @@
+from datetime import datetime
+
+import fichaje
+
+
+def test_fila_a_medio_escribir_se_lee_completa_en_la_siguiente_consulta(tmp_path):
+
+    ruta = tmp_path / "resultados_20260101_000000.csv"
+
+    indice = fichaje.IndiceFichajes({'results_file': str(ruta), 'idempotencia_ventana_min': 30})
+
+    ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    fila = f"{ahora},100001,ÉXITO,Fichaje completado,\n"
+
+    # La fila se corta justo dentro del estado, como si guardar_resultado aún estuviera escribiendo
+
+    corte = fila.index("ÉX") + 1
+
+    with open(ruta, 'w', encoding='utf-8') as f:
+
+        f.write("fecha_hora,usuario,estado,mensaje,screenshot\n" + fila[:corte])
+
+    assert indice.reservar("100001") is None
+
+    indice.liberar("100001")
+
+    with open(ruta, 'a', encoding='utf-8') as f:
+        f.write(fila[corte:])
+
+    assert indice.reservar("100001").startswith("ya fichó")
@@ -0,0 +1,135 @@
+import csv
+
+import pytest
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+import fichaje
+
+
+class DriverFalso:
+    """Página de resultado simulada tras pulsar 'Realizar Fichaje'"""
+
+    title = ""
+
+    def __init__(self, pagina):
+
+        self.pagina = pagina
+
+    @property
+    def page_source(self):
+
+        if isinstance(self.pagina, Exception):
+            raise self.pagina
+
+        return self.pagina
+
+    def save_screenshot(self, ruta):
+        pass
+
+    def quit(self):
+        pass
+
+
+class MotorFalso(fichaje.FichajeEngine):
+    """Motor sin Chrome que recorre el paso de fichaje real de _realizar_fichaje
+
+    'antes' es el error al entrar hasta Punto de Fichaje, 'clic' el del botón y 'pagina'
+    el HTML (o el error) de la página de resultado.
+    """
+
+    def __init__(self, config, antes=None, clic=None, pagina=""):
+
+        super().__init__(config)
+
+        self.antes, self.clic, self.pagina = antes, clic, pagina
+
+        self.intentos = 0
+
+    def start_driver(self, headless=False):
+
+        return DriverFalso(self.pagina)
+
+    def _restaurar_sesion(self, usuario, driver, callback=None):
+
+        self.intentos += 1
+
+        if self.antes:
+            raise self.antes
+
+        return True
+
+    def _estrategias_fichaje(self, driver):
+
+        def por_id():
+
+            if self.clic:
+                raise self.clic
+
+            return True
+
+        return {'id': por_id}
+
+
+@pytest.fixture(autouse=True)
+def sin_esperas(monkeypatch):
+
+    monkeypatch.setattr(fichaje.time, "sleep", lambda s: None)
+
+
+def procesar(config, **escenario):
+
+    with open(config['csv_file'], 'w', encoding='utf-8') as f:
+
+        f.write("tarjeta,contrasena\n100001,clave\n")
+
+    motor = MotorFalso(config, **escenario)
+
+    resumen = motor.procesar_usuarios()
+
+    with open(config['results_file'], newline='', encoding='utf-8') as f:
+        filas = list(csv.DictReader(f))
+
+    diario = fichaje.DiarioEjecucion.cargar(fichaje.DiarioEjecucion.ruta_de(config['journal_dir'], resumen['run_id']))
+
+    return motor, resumen, [fila['estado'] for fila in filas], diario.estados["100001"]
+
+
+@pytest.mark.parametrize("escenario", [
+
+    {'pagina': WebDriverException("chrome not reachable")},
+
+    {'clic': fichaje.DriverColgadoError("navegador cerrado por el vigilante")}
+
+])
+def test_fallo_tras_clic_queda_desconocido_y_no_se_reintenta(config_temporal, escenario):
+
+    motor, resumen, estados, diario = procesar(config_temporal, **escenario)
+
+    assert motor.intentos == 1 and resumen['reintentos']['intentos'] == 0
+
+    assert resumen['desconocidos'] == 1 and resumen['fallos'] == 0
+
+    assert estados == ["DESCONOCIDO"] and diario == 'desconocido'
+
+
+def test_rechazo_del_portal_es_un_error_con_una_sola_fila(config_temporal):
+
+    motor, resumen, estados, diario = procesar(config_temporal, pagina="<html>Fichaje rechazado</html>")
+
+    assert motor.intentos == 1 and resumen['reintentos']['intentos'] == 0
+
+    assert resumen['fallos'] == 1 and resumen['desconocidos'] == 0
+
+    assert estados == ["ERROR"] and diario == 'error'
+
+
+def test_fallo_antes_del_clic_se_reintenta(config_temporal):
+
+    motor, resumen, estados, diario = procesar(config_temporal, antes=TimeoutException("login.asp"))
+
+    assert motor.intentos == 1 + config_temporal['reintentos_max']
+
+    assert resumen['reintentos']['intentos'] == config_temporal['reintentos_max']
+
+    assert resumen['fallos'] == 1 and diario == 'error'
@@ -0,0 +1,32 @@
+import logging
+
+import fichaje
+
+
+def test_hora_no_valida_se_avisa_con_el_usuario(tmp_path, caplog):
+
+    ruta = tmp_path / "datos.csv"
+
+    ruta.write_text("tarjeta,contrasena,dias,horas\n100001,clave,LMXJV,08:00;25:00\n", encoding="utf-8")
+
+    with caplog.at_level(logging.WARNING):
+        usuarios = list(fichaje.LectorRoster(str(ruta)))
+
+    assert usuarios[0].turno[1] == ("08:00",)
+
+    assert any("25:00" in r.getMessage() and "100001" in r.getMessage() for r in caplog.records)
+
+
+def test_fila_sin_ninguna_hora_valida_se_omite(tmp_path, caplog):
+
+    ruta = tmp_path / "datos.csv"
+
+    ruta.write_text("tarjeta,contrasena,dias,horas\n100001,clave,LMXJV,25:00;8h\n100002,clave,LMXJV,08:00\n",
+                    encoding="utf-8")
+
+    with caplog.at_level(logging.WARNING):
+        usuarios = list(fichaje.LectorRoster(str(ruta)))
+
+    assert [u.tarjeta for u in usuarios] == ["100002"]
+
+    assert any("100001" in r.getMessage() and "se omite" in r.getMessage() for r in caplog.records)
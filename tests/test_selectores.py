@@ -0,0 +1,36 @@
+import pytest
+
+from selenium.common.exceptions import NoSuchElementException, InvalidSessionIdException
+
+import fichaje
+
+
+def test_error_de_localizacion_cuenta_como_fallo(tmp_path):
+
+    cache = fichaje.CacheSelectores(str(tmp_path / "selectores.json"), degradar_fallos=1)
+
+    def no_existe():
+        raise NoSuchElementException("btnEnviarForm")
+
+    assert cache.resolver('fichaje', {'id': no_existe, 'texto': lambda: True}) == 'texto'
+
+    assert cache.orden('fichaje', ['id', 'texto']) == ['texto', 'id']
+
+
+@pytest.mark.parametrize("error", [fichaje.DriverColgadoError("cerrado por el vigilante"),
+                                   InvalidSessionIdException("invalid session id")])
+def test_error_del_driver_se_propaga_sin_anotar(tmp_path, error):
+
+    ruta = tmp_path / "selectores.json"
+
+    cache = fichaje.CacheSelectores(str(ruta), degradar_fallos=1)
+
+    otra = []
+
+    def driver_muerto():
+        raise error
+
+    with pytest.raises(type(error)):
+        cache.resolver('fichaje', {'id': driver_muerto, 'texto': lambda: otra.append(1) or True})
+
+    assert not otra and not ruta.exists() and cache.paginas == {}
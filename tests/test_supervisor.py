@@ -0,0 +1,61 @@
+import json
+
+import os
+
+import subprocess
+
+import sys
+
+import fichaje
+
+
+def lanzar_dormido():
+
+    return subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+
+
+def test_cada_proceso_escribe_su_registro_y_se_recogen_los_de_duenos_muertos(tmp_path):
+
+    supervisor = fichaje.SupervisorProcesos({'procesos_file': str(tmp_path / "procesos_chrome.json")})
+
+    # Registro de otro proceso que ya terminó, con un navegador que sigue vivo
+
+    dueno = subprocess.Popen([sys.executable, "-c", "pass"])
+
+    dueno.wait()
+
+    huerfano = lanzar_dormido()
+
+    ajeno = supervisor.ruta_de(dueno.pid)
+
+    with open(ajeno, 'w', encoding='utf-8') as f:
+        json.dump({"procesos": {str(huerfano.pid): {'inicio': fichaje.inicio_proceso(huerfano.pid), 'dueno': dueno.pid}}}, f)
+
+    propio = lanzar_dormido()
+
+    driver = object()
+
+    try:
+
+        supervisor.registrar(driver, propio.pid)
+
+        assert (tmp_path / f"procesos_chrome.{os.getpid()}.json").exists()
+
+        assert supervisor.recolectar() == 1
+
+        assert huerfano.wait(timeout=5) is not None
+
+        assert propio.poll() is None
+
+        assert not os.path.exists(ajeno)
+
+        supervisor.liberar(driver)
+
+        assert propio.wait(timeout=5) is not None
+
+        assert os.listdir(tmp_path) == []
+
+    finally:
+
+        for proceso in (huerfano, propio):
+            proceso.kill()
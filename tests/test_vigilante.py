@@ -0,0 +1,39 @@
+import time
+
+import fichaje
+
+
+class DriverFalso:
+    pass
+
+
+def test_comandos_que_navegan_tienen_plazo_de_carga():
+
+    vigilante = fichaje.VigilanteDriver({'driver_comando_timeout_s': 30, 'driver_carga_timeout_s': 20})
+
+    assert vigilante.plazo_carga > fichaje.VigilanteDriver.CARGA_PAGINA_S
+
+    for nombre in ("get", "clickElement", "w3cExecuteScript"):
+        assert nombre in fichaje.VigilanteDriver.COMANDOS_CARGA
+
+
+def test_thread_termina_sin_drivers():
+
+    vigilante = fichaje.VigilanteDriver({})
+
+    driver = DriverFalso()
+
+    vigilante.registrar(driver)
+
+    thread = vigilante._thread
+
+    with vigilante.comando(driver, "quit"):
+        pass
+
+    thread.join(timeout=5)
+
+    assert not thread.is_alive() and vigilante._thread is None
+
+    vigilante.registrar(driver)
+
+    assert vigilante._thread.is_alive()